@@ -0,0 +1,150 @@
+"""
+Сборка альбомов (media_group_id), которые Telegram присылает отдельными сообщениями.
+
+Альбом считается собранным, когда после последнего фото прошло окно ожидания.
+Окно подстраивается под наблюдаемые интервалы между частями альбомов, а при
+известном числе фото (или максимуме Telegram в 10 фото) альбом завершается сразу.
+Брошенные группы удаляются по TTL.
+"""
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Больше фото в одном альбоме Telegram не присылает
+MAX_ALBUM_SIZE = 10
+
+OnComplete = Callable[[List[Any]], Awaitable[None]]
+
+
+@dataclass
+class _Group:
+    """Собираемый альбом."""
+    on_complete: OnComplete
+    created: float
+    expected: Optional[int] = None
+    items: List[Any] = field(default_factory=list)
+    keys: Set[Hashable] = field(default_factory=set)
+    arrivals: List[float] = field(default_factory=list)
+    task: Optional[asyncio.Task] = None
+
+
+class AlbumCollector:
+    """Собирает части альбомов и передает альбом обработчику после его завершения."""
+
+    def __init__(
+        self,
+        min_window: float = 0.8,
+        max_window: float = 9.0,
+        gap_factor: float = 3.0,
+        initial_gap: float = 0.3,
+        ttl: float = 300.0
+    ):
+        """
+        Args:
+            min_window: Минимальное окно ожидания после последнего фото, секунд
+            max_window: Максимальное окно ожидания, секунд
+            gap_factor: Во сколько раз окно больше ожидаемого интервала между частями
+            initial_gap: Оценка интервала между частями до первых наблюдений, секунд
+            ttl: Через сколько секунд удалять незавершенную группу
+        """
+        self.min_window = min_window
+        self.max_window = max_window
+        self.gap_factor = gap_factor
+        self.ttl = ttl
+        # Сглаженная оценка интервала между частями альбома по всем альбомам
+        self._gap_estimate = initial_gap
+        self._groups: Dict[Tuple[Hashable, Hashable], _Group] = {}
+
+    def add(
+        self,
+        owner: Hashable,
+        group_id: Hashable,
+        item: Any,
+        on_complete: OnComplete,
+        key: Optional[Hashable] = None,
+        expected: Optional[int] = None
+    ) -> bool:
+        """
+        Добавляет часть альбома.
+
+        Args:
+            owner: Владелец группы (например, ID пользователя)
+            group_id: media_group_id
+            item: Часть альбома (например, PhotoSize)
+            on_complete: Корутина, которой передается список частей собранного альбома
+            key: Ключ для отбрасывания повторов (например, file_unique_id)
+            expected: Ожидаемое число частей, если оно известно
+
+        Returns:
+            bool: False, если часть с таким ключом уже добавлена
+        """
+        now = time.monotonic()
+        self._evict(now)
+        group_key = (owner, group_id)
+        group = self._groups.get(group_key)
+        if group is None:
+            group = _Group(on_complete=on_complete, created=now, expected=expected)
+            self._groups[group_key] = group
+        if key is not None:
+            if key in group.keys:
+                return False
+            group.keys.add(key)
+
+        if group.arrivals:
+            self._observe(now - group.arrivals[-1])
+        group.items.append(item)
+        group.arrivals.append(now)
+
+        if group.task:
+            group.task.cancel()
+        if len(group.items) >= (group.expected or MAX_ALBUM_SIZE):
+            delay = 0.0
+        else:
+            delay = self._window(group)
+        group.task = asyncio.create_task(self._settle(group_key, group, delay))
+        logger.info(f"Альбом {group_id}: частей {len(group.items)}, ожидание {delay:.2f} с")
+        return True
+
+    def _observe(self, gap: float) -> None:
+        """Учитывает интервал между частями альбома в общей оценке."""
+        if gap < self.max_window:
+            self._gap_estimate = 0.8 * self._gap_estimate + 0.2 * gap
+
+    def _window(self, group: _Group) -> float:
+        """Окно ожидания следующей части: по интервалам этого альбома или по общей оценке."""
+        gaps = [b - a for a, b in zip(group.arrivals, group.arrivals[1:])]
+        gap = max(max(gaps), self._gap_estimate) if gaps else self._gap_estimate
+        return min(self.max_window, max(self.min_window, gap * self.gap_factor))
+
+    async def _settle(self, group_key: Tuple[Hashable, Hashable], group: _Group, delay: float) -> None:
+        """Ждет окно и передает собранный альбом обработчику."""
+        await asyncio.sleep(delay)
+        # Группу убираем до вызова обработчика: опоздавшая часть начнет новую группу,
+        # а не отменит уже запущенную обработку
+        if self._groups.get(group_key) is group:
+            del self._groups[group_key]
+        group.task = None
+        try:
+            await group.on_complete(group.items)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке альбома {group_key[1]}: {e}")
+
+    def _evict(self, now: float) -> None:
+        """Удаляет группы, которые не завершились за TTL."""
+        for group_key, group in list(self._groups.items()):
+            if now - group.created > self.ttl:
+                if group.task:
+                    group.task.cancel()
+                del self._groups[group_key]
+                logger.warning(f"Альбом {group_key[1]} не завершен за {self.ttl} с, удален")
+
+    def close(self) -> None:
+        """Отменяет ожидание всех незавершенных альбомов."""
+        for group in self._groups.values():
+            if group.task:
+                group.task.cancel()
+        self._groups.clear()
@@ -18,8 +18,8 @@ from telegram.ext import (
 )
 from telegram.error import TimedOut, NetworkError, TelegramError
 import time
-import collections
 import re
+import contextlib
 import sys
 
 from src.config.settings import settings
@@ -33,9 +33,19 @@ from src.bot.keyboards import (
 from src.bot.storage import AsyncFileManager, SentPostsCache
 from src.bot.states import BotState, StateManager, PostContext
 from src.bot.handlers.callback import handle_media_callback
+from src.bot.handlers.sber_text import handle_edit_sber_text_callback
 from src.bot.text_processor import TextProcessor
 from src.bot.moderation_block import check_and_set_moderation_block, remove_moderation_block
-from src.bot.decorators import check_moderation_block
+from src.bot.decorators import check_moderation_block, with_post_lock
+from src.bot.post_locks import post_locks
+from src.bot.preformatter import SberPreformatter
+from src.bot.post_repository import post_repository
+from src.bot.post_queue import PostQueue, TOPIC_POSTS, TOPIC_ORIGINALS
+from src.bot.post_layout import get_post_dir, list_post_dirs
+from src.bot.album_collector import AlbumCollector
+from src.bot.outbound import OrderSlot, OrderSlots, RateLimiter
+from src.utils.token_tracker import token_tracker
+from src.utils.media_store import download_photo
 
 # Настройка логгера
 logger = setup_logger("bot")
@@ -44,9 +54,16 @@ logger = setup_logger("bot")
 STORAGE_PATH = "storage.json"
 SAVED_DIR = settings.SAVE_DIR
 
-media_group_temp = collections.defaultdict(dict)  # {user_id: {media_group_id: [PhotoSize, ...]}}
-media_group_tasks = collections.defaultdict(dict)  # {user_id: {media_group_id: asyncio.Task}}
-MEDIA_GROUP_TIMEOUT = 9.0  # секунд
+# Очередь постов от юзербота
+QUEUE_DB = settings.QUEUE_DB or os.path.join(SAVED_DIR, ".queue.db")
+QUEUE_BATCH_SIZE = 10
+QUEUE_RETRY_DELAY = 60.0  # секунд
+QUEUE_MAX_ATTEMPTS = 5
+QUEUE_DONE_TTL = 30 * 24 * 3600  # выполненные задания храним 30 дней
+
+# Фоновое скачивание фото, добавленных модератором
+ARCHIVE_ATTEMPTS = 3
+ARCHIVE_RETRY_DELAY = 2.0  # секунд, удваивается с каждой попыткой
 
 class Bot:
     """Основной класс бота."""
@@ -62,6 +79,17 @@ class Bot:
         self.storage = AsyncFileManager("storage.json")
         self.sent_posts_cache = SentPostsCache()
         self.text_processor = TextProcessor()
+        self.preformatter = SberPreformatter()
+        os.makedirs(SAVED_DIR, exist_ok=True)
+        self.post_queue = PostQueue(QUEUE_DB, settings.QUEUE_VISIBILITY_TIMEOUT)
+        # Темп отправки новых постов в группу модераторов
+        self.outbound_limiter = RateLimiter(settings.FORWARD_RATE_PER_MINUTE)
+        # Сборка альбомов, которые модераторы добавляют к постам
+        self.album_collector = AlbumCollector()
+        # Фоновые скачивания фото, добавленных модератором: {post_id: asyncio.Task}
+        self.archive_tasks: Dict[str, asyncio.Task] = {}
+        # Когда у юзербота запрошены оригиналы фото поста: {post_id: time.monotonic()}
+        self.originals_requested: Dict[str, float] = {}
         
         # Создаем storage.json если его нет
         if not os.path.exists(STORAGE_PATH):
@@ -72,6 +100,7 @@ class Bot:
         
         # Запускаем периодическую проверку
         self.application.post_init = self._start_periodic_check
+        self.application.post_shutdown = self._shutdown
             
         logger.info("Bot initialized successfully")
 
@@ -79,11 +108,24 @@ class Bot:
         """Запуск периодической проверки после инициализации бота."""
         # Синхронизируем кэш с storage
         await self.sent_posts_cache.sync_with_storage(STORAGE_PATH)
+
+        # Запускаем фоновое форматирование текстов
+        self.preformatter.start()
         
         # Запускаем периодическую проверку
         self.check_task = asyncio.create_task(self._run_periodic_check(application))
         logger.info("Periodic check started")
 
+    async def _shutdown(self, application: Application) -> None:
+        """Остановка фоновых задач и сохранение статистики токенов."""
+        await self.preformatter.stop()
+        self.album_collector.close()
+        logger.info(f"Блокировки постов: {post_locks.stats()}")
+        logger.info(f"Кэш постов: {post_repository.stats()}")
+        token_tracker.flush()
+        self.post_queue.close()
+        logger.info("Background tasks stopped")
+
     def _setup_handlers(self) -> None:
         """Настройка обработчиков команд."""
         try:
@@ -114,6 +156,12 @@ class Bot:
                 pattern=r"^edittext_"
             ))
 
+            # Обработчик callback-запросов для форматирования текста через Sber GPT
+            self.application.add_handler(CallbackQueryHandler(
+                self.handle_sber_text_callback,
+                pattern=r"^sbertext_"
+            ))
+
             # Обработчик callback-запросов для редактирования
             self.application.add_handler(CallbackQueryHandler(
                 self.handle_edit,
@@ -157,8 +205,29 @@ class Bot:
         result = self.sent_posts_cache.is_post_sent(post_id)
         return result
 
-    async def process_post(self, post_dir: str, context: ContextTypes.DEFAULT_TYPE) -> bool:
-        """Обработка одного поста."""
+    async def process_post(
+        self,
+        post_dir: str,
+        context: ContextTypes.DEFAULT_TYPE,
+        slot: Optional[OrderSlot] = None
+    ) -> bool:
+        """
+        Обработка одного поста.
+
+        Args:
+            post_dir: Папка поста
+            context: Контекст бота
+            slot: Слот в очереди отправки: альбом отправляется после альбома предыдущего поста
+
+        Returns:
+            bool: True если пост отправлен модераторам
+        """
+        # Под блокировкой поста: /test и очередь не отправят его дважды
+        async with post_locks.hold(os.path.basename(post_dir)):
+            return await self._process_post(post_dir, context, slot)
+
+    async def _process_post(self, post_dir: str, context: ContextTypes.DEFAULT_TYPE, slot: Optional[OrderSlot]) -> bool:
+        """Отправка поста модераторам (вызывается под блокировкой поста)."""
         try:
             post_id = os.path.basename(post_dir)
             logger.info(f"Обработка поста {post_id}")
@@ -167,57 +236,34 @@ class Bot:
             if await self.is_post_sent(post_id):
                 logger.info(f"Пост {post_id} уже отправлен")
                 return False
+            async with AsyncFileManager(STORAGE_PATH) as storage:
+                if post_id in await storage.read():
+                    logger.info(f"Пост {post_id} уже есть в storage")
+                    return False
 
-            # Проверяем статус готовности
-            ready_file = os.path.join(post_dir, "ready.txt")
-            if not os.path.exists(ready_file):
+            # Читаем манифест поста (для старых папок собирается из text.txt, source.txt и ready.txt)
+            manifest = post_repository.load(post_dir)
+            if manifest is None:
                 logger.error(f"Пост не готов: {post_dir}")
                 return False
 
-            with open(ready_file, 'r') as f:
-                status = f.read().strip()
-
-            if status != "ok":
-                logger.error(f"Пост не готов, статус: {status}")
-                return False
-
-            # Читаем текст поста
-            text_file = os.path.join(post_dir, "text.txt")
-            if not os.path.exists(text_file):
-                logger.error(f"Файл text.txt не найден: {post_dir}")
-                return False
-
-            with open(text_file, 'r', encoding='utf-8') as f:
-                post_text = f.read().strip()
-
             # Обрабатываем текст с учетом лимитов
-            processed_text, was_truncated = await self.text_processor.process_text(post_text)
+            processed_text, was_truncated = await self.text_processor.process_text(manifest.text)
             if was_truncated:
                 logger.info("Текст был обрезан из-за превышения лимита")
             
-            # Читаем информацию об источнике
-            source_file = os.path.join(post_dir, "source.txt")
-            if not os.path.exists(source_file):
-                logger.error(f"Файл source.txt не найден: {post_dir}")
-                return False
-
-            with open(source_file, 'r', encoding='utf-8') as f:
-                source_info = f.read().strip()
+            # Информация об источнике
+            source_info = manifest.source_text
 
             # Формируем полный текст поста
             full_text = f"{processed_text}"
 
-            # Получаем список фотографий
-            photos = sorted(
-                [f for f in os.listdir(post_dir) if f.startswith("photo_") and f.endswith(".jpg")],
-                key=lambda x: int(x.split("_")[1].split(".")[0])
-            )
-            if not photos:
+            # Фотографии в порядке из манифеста
+            photo_paths = manifest.photo_paths(post_dir)
+            if not photo_paths:
                 logger.error(f"Фотографии не найдены: {post_dir}")
                 return False
 
-            photo_paths = [os.path.join(post_dir, photo) for photo in photos]
-
             # Отправляем альбом с фотографиями и текстом
             try:
                 media_group = []
@@ -236,19 +282,29 @@ class Bot:
                             )
                         )
 
-                messages = await context.bot.send_media_group(
-                    chat_id=settings.MODERATOR_GROUP_ID,
-                    media=media_group,
-                    read_timeout=30,
-                    write_timeout=30,
-                    connect_timeout=30,
-                    pool_timeout=30
-                )
+                # Альбомы уходят в порядке слотов, остальное идет параллельно
+                async with slot or contextlib.nullcontext():
+                    await self.outbound_limiter.acquire()
+                    messages = await context.bot.send_media_group(
+                        chat_id=settings.MODERATOR_GROUP_ID,
+                        media=media_group,
+                        read_timeout=30,
+                        write_timeout=30,
+                        connect_timeout=30,
+                        pool_timeout=30
+                    )
+                # Повторные отправки поста модераторам пойдут по file_id без загрузки файлов
+                # (манифест сохраняется ниже вместе с подписями и статусом)
+                manifest.remember_file_ids(messages)
 
+                # Клавиатура отвечает на альбом, чтобы ее было видно рядом с постом
+                # даже если между ними успел появиться следующий альбом
+                await self.outbound_limiter.acquire()
                 keyboard_message = await context.bot.send_message(
                     chat_id=settings.MODERATOR_GROUP_ID,
                     text=f"Выберите действие для поста \n{source_info}:",
                     reply_markup=get_post_keyboard(post_id),
+                    reply_to_message_id=messages[0].message_id,
                     read_timeout=20,
                     write_timeout=15,
                     connect_timeout=15,
@@ -291,6 +347,12 @@ class Bot:
 
                 # Добавляем пост в кэш отправленных
                 self.sent_posts_cache.add_post(post_id)
+                manifest.captions = await self.text_processor.render_captions(
+                    full_text, manifest.text_close, source_info
+                )
+                manifest.status = "sent"
+                post_repository.save(post_dir, manifest)
+                self.preformatter.submit(post_id, post_dir, full_text)
                 logger.info(f"Пост {post_id} успешно обработан")
                 return True
 
@@ -303,7 +365,15 @@ class Bot:
             raise
 
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработчик сообщений."""
+        """Обработчик сообщений: ввод модератора обрабатывается под блокировкой поста."""
+        for pid, ctx in self.state_manager.get_all_contexts().items():
+            if ctx.chat_id == update.message.chat_id and ctx.state in [BotState.EDIT_MEDIA_ADD_WAIT, BotState.EDIT_TEXT_WAIT, BotState.EDIT_MEDIA_REMOVE_WAIT]:
+                async with post_locks.hold(pid):
+                    await self._handle_post_message(update, context)
+                return
+
+    async def _handle_post_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработка ввода модератора для поста в состоянии редактирования."""
         # Получаем контекст поста из состояния
         post_context = None
         post_id = None
@@ -332,8 +402,9 @@ class Bot:
             
             try:
                 # Получаем путь к папке поста
-                post_dir = os.path.join(SAVED_DIR, post_id)
-                if not os.path.exists(post_dir):
+                post_dir = get_post_dir(post_id)
+                manifest = post_repository.load(post_dir)
+                if manifest is None:
                     logger.error(f"Папка поста не найдена: {post_dir}")
                     await update.message.reply_text("❌ Ошибка: папка поста не найдена")
                     return
@@ -375,32 +446,27 @@ class Bot:
                 # Отправляем новый пост
                 messages = []
                 media_group = []
-                # Находим все фотографии в папке поста
-                photos = [f for f in os.listdir(post_dir) if f.startswith("photo_") and f.endswith(".jpg")]
-                photos.sort(key=lambda x: int(x.split("_")[1].split(".")[0]))
-                photo_paths = [os.path.join(post_dir, photo) for photo in photos]
 
                 # Обрабатываем текст с учетом лимитов
                 processed_text, was_truncated = await self.text_processor.process_text(update.message.text)
                 if was_truncated:
                     await update.message.reply_text("⚠️ Текст был обрезан из-за превышения лимита Telegram (1024 символа)")
 
-                # Добавляем фотографии в media_group
-                for i, photo_path in enumerate(photo_paths):
-                    with open(photo_path, 'rb') as photo:
-                        if i == 0:
-                            media_group.append(
-                                InputMediaPhoto(
-                                    media=photo,
-                                    caption=processed_text
-                                )
+                # Добавляем фотографии в media_group (по file_id, если он известен)
+                for i, media in enumerate(manifest.photo_media(post_dir)):
+                    if i == 0:
+                        media_group.append(
+                            InputMediaPhoto(
+                                media=media,
+                                caption=processed_text
                             )
-                        else:
-                            media_group.append(
-                                InputMediaPhoto(
-                                    media=photo
-                                )
+                        )
+                    else:
+                        media_group.append(
+                            InputMediaPhoto(
+                                media=media
                             )
+                        )
 
                 # Отправляем новый пост
                 messages = await context.bot.send_media_group(
@@ -415,18 +481,17 @@ class Bot:
                 post_context.state = BotState.MODERATE_MENU
                 self.state_manager.set_post_context(post_id, post_context)
 
-                # Отправляем клавиатуру к новому посту
-                source_file = os.path.join(post_dir, "source.txt")
-                if not os.path.exists(source_file):
-                    logger.error(f"Файл source.txt не найден в {post_dir}")
-                    return False
-
-                with open(source_file, 'r', encoding='utf-8') as f:
-                    source_info = f.read().strip()
+                # Подписи для публикации пересчитываем сразу после правки
+                manifest = post_repository.load(post_dir) or manifest
+                manifest.captions = await self.text_processor.render_captions(
+                    processed_text, manifest.text_close, manifest.source_text
+                )
+                post_repository.save(post_dir, manifest)
 
+                # Отправляем клавиатуру к новому посту
                 keyboard_message = await context.bot.send_message(
                     chat_id=post_context.chat_id,
-                    text=f"Выберите действие для поста \n{source_info}:",
+                    text=f"Выберите действие для поста \n{manifest.source_text}:",
                     reply_markup=get_moderate_keyboard(post_id),
                     read_timeout=20,
                     write_timeout=15,
@@ -483,9 +548,9 @@ class Bot:
                 self.state_manager.set_post_context(post_id, post_context)
                 return
 
-            post_dir = os.path.join(SAVED_DIR, post_id)
-            photos = [f for f in os.listdir(post_dir) if f.startswith("photo_") and f.endswith(".jpg")]
-            photos.sort(key=lambda x: int(x.split('_')[1].split('.')[0]))
+            post_dir = get_post_dir(post_id)
+            manifest = post_repository.load(post_dir)
+            photos = [photo["file"] for photo in manifest.photos] if manifest else []
             
             if not photos:
                 no_photos_msg = await update.message.reply_text("В этом посте нет фото для удаления.")
@@ -505,24 +570,37 @@ class Bot:
                 self.state_manager.set_post_context(post_id, post_context)
                 return
 
-            # Удаляем выбранные фото
+            # Удаляем выбранные фото (после фонового скачивания добавленных).
+            # Манифест перечитываем: скачивание дописывает в него размеры и хэши
+            await self._wait_archived(post_id)
+            manifest = post_repository.load(post_dir)
+            if manifest is None:
+                logger.error(f"Папка поста не найдена: {post_dir}")
+                return
             deleted = []
             for idx in sorted(to_delete, reverse=True):
+                path = os.path.join(post_dir, photos[idx])
                 try:
-                    os.remove(os.path.join(post_dir, photos[idx]))
+                    # Фото, которое не удалось скачать, есть только в манифесте (по file_id)
+                    if os.path.exists(path):
+                        os.remove(path)
                     deleted.append(photos[idx])
                 except Exception as e:
                     logger.error(f"Ошибка при удалении файла {photos[idx]}: {e}")
 
-            # Обновляем список фото
-            remaining_photos = [f for f in os.listdir(post_dir) if f.startswith("photo_") and f.endswith(".jpg")]
-            remaining_photos.sort(key=lambda x: int(x.split('_')[1].split('.')[0]))
-
             # Переименовываем оставшиеся фото для последовательности
-            for i, fname in enumerate(remaining_photos):
+            remaining_photos = [entry for entry in manifest.photos if entry["file"] not in deleted]
+            for i, entry in enumerate(remaining_photos):
                 correct_name = f"photo_{i+1}.jpg"
-                if fname != correct_name:
-                    os.rename(os.path.join(post_dir, fname), os.path.join(post_dir, correct_name))
+                if entry["file"] != correct_name:
+                    path = os.path.join(post_dir, entry["file"])
+                    if os.path.exists(path):
+                        os.rename(path, os.path.join(post_dir, correct_name))
+                    entry["file"] = correct_name
+            manifest.photos = remaining_photos
+
+            # Обновляем список фото в манифесте
+            post_repository.sync_photos(post_dir, manifest)
 
             # Удаляем старые сообщения с фото
             for message_id in post_context.original_media:
@@ -540,22 +618,21 @@ class Bot:
             post_context.original_media = []
             post_context.service_messages = []
 
-            # Если остались фото — отправляем их заново
-            remaining_photos = [f for f in os.listdir(post_dir) if f.startswith("photo_") and f.endswith(".jpg")]
-            remaining_photos.sort(key=lambda x: int(x.split('_')[1].split('.')[0]))
+            # Если остались фото — отправляем их заново (по file_id, с диска только фото без file_id)
+            remaining_media = manifest.photo_media(post_dir)
 
-            if remaining_photos:
+            if remaining_media:
                 media_group = []
-                for i, fname in enumerate(remaining_photos):
-                    path = os.path.join(post_dir, fname)
-                    with open(path, 'rb') as photo:
-                        if i == 0:
-                            media_group.append(InputMediaPhoto(media=photo, caption=post_context.original_text))
-                        else:
-                            media_group.append(InputMediaPhoto(media=photo))
+                for i, media in enumerate(remaining_media):
+                    if i == 0:
+                        media_group.append(InputMediaPhoto(media=media, caption=post_context.original_text))
+                    else:
+                        media_group.append(InputMediaPhoto(media=media))
                 messages = await context.bot.send_media_group(chat_id=post_context.chat_id, media=media_group)
                 message_ids = [msg.message_id for msg in messages]
                 post_context.original_media = message_ids
+                if manifest.remember_file_ids(messages):
+                    post_repository.save(post_dir, manifest)
 
             # Клавиатура
             keyboard_message = await context.bot.send_message(
@@ -602,113 +679,74 @@ class Bot:
         # Сохраняем ID пользовательского сообщения (фото)
         post_context.user_message_ids.append(update.message.message_id)
         self.state_manager.set_post_context(post_id, post_context)
-        post_dir = os.path.join(SAVED_DIR, post_id)
+        post_dir = get_post_dir(post_id)
         if not update.message.photo:
             await update.message.reply_text("❌ Пожалуйста, отправьте фото.")
             return
         media_group_id = update.message.media_group_id
         if media_group_id:
-            # Альбом: собираем фото во временное хранилище
-            if media_group_id not in media_group_temp[user_id]:
-                media_group_temp[user_id][media_group_id] = []
-            media_group_temp[user_id][media_group_id].append(update.message.photo[-1])
-            logger.info(f"Альбом: добавлено фото в media_group_temp[{user_id}][{media_group_id}] (текущее кол-во: {len(media_group_temp[user_id][media_group_id])})")
-            # Сбросить старый таймер, если есть
-            if media_group_id in media_group_tasks[user_id]:
-                media_group_tasks[user_id][media_group_id].cancel()
-            # Запустить новый таймер
-            async def timer():
-                try:
-                    await asyncio.sleep(MEDIA_GROUP_TIMEOUT)
-                    await self.finalize_media_add_album(user_id, media_group_id, post_context, context)
-                except asyncio.CancelledError:
-                    pass
-            media_group_tasks[user_id][media_group_id] = asyncio.create_task(timer())
+            # Альбом: фото собираются, пока не перестанут приходить
+            photo = update.message.photo[-1]
+
+            async def finalize(album_photos):
+                async with post_locks.hold(post_id):
+                    await self.finalize_media_add_album(album_photos, media_group_id, post_context, context)
+
+            self.album_collector.add(user_id, media_group_id, photo, finalize, key=photo.file_unique_id)
         else:
             # Одиночное фото — сразу финализируем
             await self.finalize_media_add_single(update, context, post_context)
         logger.info("=== handle_media_add_message: завершено ===")
 
-    async def finalize_media_add_album(self, user_id, media_group_id, post_context, context):
+    async def finalize_media_add_album(self, album_photos, media_group_id, post_context, context):
         """
-        Финализация добавления альбома: сохраняет фото, удаляет старые сообщения, отправляет новый пост.
+        Финализация добавления альбома: добавляет фото к посту, удаляет старые сообщения, отправляет новый пост.
         """
         logger.info(f"=== finalize_media_add_album: старт для post_id={post_context.post_id}, media_group_id={media_group_id} ===")
         post_id = post_context.post_id
-        post_dir = os.path.join(SAVED_DIR, post_id)
-        album_photos = media_group_temp[user_id][media_group_id]
-        old_photos = [f for f in os.listdir(post_dir) if f.startswith("photo_") and f.endswith(".jpg")]
-        old_photos.sort(key=lambda x: int(x.split('_')[1].split('.')[0]))
-        old_photo_paths = [os.path.join(post_dir, f) for f in old_photos]
-        new_photo_paths = []
-        start_idx = len(old_photo_paths) + 1
-        for i, photo in enumerate(album_photos):
-            file = await photo.get_file()
-            file_path = os.path.join(post_dir, f"photo_{start_idx + i}.jpg")
-            await file.download_to_drive(file_path)
-            new_photo_paths.append(file_path)
-            logger.info(f"Сохранено фото: {file_path}")
-        all_photo_paths = old_photo_paths + new_photo_paths
-        # Удаляем старые сообщения
-        for message_id in post_context.original_media:
-            try:
-                await context.bot.delete_message(chat_id=post_context.chat_id, message_id=message_id)
-            except Exception as e:
-                logger.error(f"Ошибка при удалении старого сообщения {message_id}: {e}")
-        for message_id in post_context.service_messages:
-            try:
-                await context.bot.delete_message(chat_id=post_context.chat_id, message_id=message_id)
-            except Exception as e:
-                logger.error(f"Ошибка при удалении служебного сообщения {message_id}: {e}")
-        post_context.original_media = []
-        post_context.service_messages = []
-        # Отправляем новый пост
-        media_group = []
-        for i, path in enumerate(all_photo_paths):
-            with open(path, 'rb') as photo:
-                if i == 0:
-                    media_group.append(InputMediaPhoto(media=photo, caption=post_context.original_text))
-                else:
-                    media_group.append(InputMediaPhoto(media=photo))
-        messages = await context.bot.send_media_group(chat_id=post_context.chat_id, media=media_group)
-        message_ids = [msg.message_id for msg in messages]
-        post_context.original_media = message_ids
-        # Клавиатура
-        keyboard_message = await context.bot.send_message(
-            chat_id=post_context.chat_id,
-            text="Выберите действие для поста:",
-            reply_markup=get_moderate_keyboard(post_id),
-            read_timeout=20,
-            write_timeout=15,
-            connect_timeout=15,
-            pool_timeout=15
-        )
-        post_context.service_messages.append(keyboard_message.message_id)
-        post_context.state = BotState.MODERATE_MENU
-        self.state_manager.set_post_context(post_id, post_context)
-        # Очистка временных данных
-        del media_group_temp[user_id][media_group_id]
-        del media_group_tasks[user_id][media_group_id]
+        await self._add_photos_to_post(post_context, album_photos, context)
         logger.info(f"Пост {post_id} обновлён с новыми фото (альбом)")
         await context.bot.send_message(chat_id=post_context.chat_id, text="✅ Фото успешно добавлены к посту!")
         logger.info(f"=== finalize_media_add_album: завершено для post_id={post_id} ===")
 
     async def finalize_media_add_single(self, update, context, post_context):
         """
-        Финализация добавления одиночного фото: сохраняет фото, удаляет старые сообщения, отправляет новый пост.
+        Финализация добавления одиночного фото: добавляет фото к посту, удаляет старые сообщения, отправляет новый пост.
         """
         logger.info(f"=== finalize_media_add_single: старт для post_id={post_context.post_id} ===")
-        user_id = update.message.from_user.id
         post_id = post_context.post_id
-        post_dir = os.path.join(SAVED_DIR, post_id)
-        old_photos = [f for f in os.listdir(post_dir) if f.startswith("photo_") and f.endswith(".jpg")]
-        old_photos.sort(key=lambda x: int(x.split('_')[1].split('.')[0]))
-        old_photo_paths = [os.path.join(post_dir, f) for f in old_photos]
-        photo = update.message.photo[-1]
-        file = await photo.get_file()
-        file_path = os.path.join(post_dir, f"photo_{len(old_photo_paths)+1}.jpg")
-        await file.download_to_drive(file_path)
-        all_photo_paths = old_photo_paths + [file_path]
+        await self._add_photos_to_post(post_context, [update.message.photo[-1]], context)
+        logger.info(f"Пост {post_id} обновлён с новым фото (одиночное)")
+        await context.bot.send_message(chat_id=post_context.chat_id, text="✅ Фото успешно добавлены к посту!")
+        logger.info(f"=== finalize_media_add_single: завершено для post_id={post_id} ===")
+
+    async def _add_photos_to_post(self, post_context, photos, context) -> None:
+        """
+        Добавляет фото модератора к посту и переотправляет пост на модерацию.
+
+        Фото не скачиваются перед отправкой: в манифест записываются их file_id,
+        пост отправляется по file_id одним send_media_group, а файлы скачиваются
+        в папку поста в фоне.
+
+        Args:
+            post_context: Контекст поста
+            photos: PhotoSize присланных фото
+            context: Контекст бота
+        """
+        post_id = post_context.post_id
+        post_dir = get_post_dir(post_id)
+        manifest = post_repository.load(post_dir)
+        if manifest is None:
+            logger.error(f"Папка поста не найдена: {post_dir}")
+            return
+        start_idx = len(manifest.photos) + 1
+        added = []
+        for i, photo in enumerate(photos):
+            name = f"photo_{start_idx + i}.jpg"
+            manifest.photos.append({"file": name, "size": photo.file_size, "file_id": photo.file_id})
+            added.append((name, photo))
+        post_repository.save(post_dir, manifest)
+        self._archive_photos(post_id, post_dir, added)
         # Удаляем старые сообщения
         for message_id in post_context.original_media:
             try:
@@ -722,17 +760,19 @@ class Bot:
                 logger.error(f"Ошибка при удалении служебного сообщения {message_id}: {e}")
         post_context.original_media = []
         post_context.service_messages = []
-        # Отправляем новый пост
+        # Отправляем новый пост: по file_id, с диска только фото без file_id
         media_group = []
-        for i, path in enumerate(all_photo_paths):
-            with open(path, 'rb') as photo:
-                if i == 0:
-                    media_group.append(InputMediaPhoto(media=photo, caption=post_context.original_text))
-                else:
-                    media_group.append(InputMediaPhoto(media=photo))
+        for i, media in enumerate(manifest.photo_media(post_dir)):
+            if i == 0:
+                media_group.append(InputMediaPhoto(media=media, caption=post_context.original_text))
+            else:
+                media_group.append(InputMediaPhoto(media=media))
         messages = await context.bot.send_media_group(chat_id=post_context.chat_id, media=media_group)
-        message_ids = [msg.message_id for msg in messages]
-        post_context.original_media = message_ids
+        post_context.original_media = [msg.message_id for msg in messages]
+        # Манифест перечитываем: фоновое скачивание могло дописать в него размеры и хэши
+        manifest = post_repository.load(post_dir) or manifest
+        if manifest.remember_file_ids(messages):
+            post_repository.save(post_dir, manifest)
         # Клавиатура
         keyboard_message = await context.bot.send_message(
             chat_id=post_context.chat_id,
@@ -746,13 +786,103 @@ class Bot:
         post_context.service_messages.append(keyboard_message.message_id)
         post_context.state = BotState.MODERATE_MENU
         self.state_manager.set_post_context(post_id, post_context)
-        logger.info(f"Пост {post_id} обновлён с новым фото (одиночное)")
-        await context.bot.send_message(chat_id=post_context.chat_id, text="✅ Фото успешно добавлены к посту!")
-        logger.info(f"=== finalize_media_add_single: завершено для post_id={post_id} ===")
+
+    def _archive_photos(self, post_id: str, post_dir: str, photos) -> None:
+        """
+        Запускает фоновое скачивание добавленных фото в папку поста.
+
+        Args:
+            post_id: ID поста
+            post_dir: Папка поста
+            photos: Пары (имя файла, PhotoSize)
+        """
+        previous = self.archive_tasks.get(post_id)
+
+        async def archive():
+            if previous:
+                await asyncio.gather(previous, return_exceptions=True)
+            saved = {}
+            for name, photo in photos:
+                for attempt in range(1, ARCHIVE_ATTEMPTS + 1):
+                    try:
+                        saved[name] = await download_photo(photo, os.path.join(post_dir, name))
+                        break
+                    except Exception as e:
+                        if attempt == ARCHIVE_ATTEMPTS:
+                            # В манифесте остается file_id: по нему фото публикуется и без файла
+                            logger.error(f"Ошибка при скачивании фото {name} поста {post_id}: {e}")
+                        else:
+                            delay = ARCHIVE_RETRY_DELAY * 2 ** (attempt - 1)
+                            logger.warning(
+                                f"Ошибка при скачивании фото {name} поста {post_id}, повтор через {delay:.0f} с: {e}"
+                            )
+                            await asyncio.sleep(delay)
+            manifest = post_repository.load(post_dir)
+            if manifest is None:
+                return
+            for entry in manifest.photos:
+                if entry["file"] in saved:
+                    entry.update(size=saved[entry["file"]]["size"], sha256=saved[entry["file"]]["sha256"])
+            post_repository.save(post_dir, manifest)
+            logger.info(f"Фото поста {post_id} сохранены в архив: {len(saved)} из {len(photos)}")
+
+        task = asyncio.create_task(archive())
+        self.archive_tasks[post_id] = task
+        task.add_done_callback(
+            lambda t: self.archive_tasks.pop(post_id, None) if self.archive_tasks.get(post_id) is t else None
+        )
+
+    async def _wait_archived(self, post_id: str) -> None:
+        """Дожидается фонового скачивания фото поста перед работой с файлами."""
+        task = self.archive_tasks.get(post_id)
+        if task:
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _backfill_queue(self, full_scan: bool = False) -> None:
+        """
+        Ставит в очередь папки постов, которые в нее не попали.
+
+        Нужна для папок, сохраненных до появления очереди, и на случай,
+        если юзербот не смог поставить пост в очередь.
+
+        Args:
+            full_scan: Просмотреть все шарды, а не только последние SHARD_SCAN_DAYS дней
+        """
+        if not os.path.exists(SAVED_DIR):
+            logger.error(f"[backfill] Директория saved не найдена: {SAVED_DIR}")
+            return
+
+        async with AsyncFileManager(STORAGE_PATH) as storage:
+            stored = await storage.read()
+
+        if full_scan:
+            # При запуске даем проваленным заданиям еще один круг попыток
+            retried = await asyncio.to_thread(self.post_queue.retry_failed, TOPIC_POSTS)
+            if retried:
+                logger.info(f"[backfill] Возвращено в очередь проваленных заданий: {retried}")
+
+        added = 0
+        days = None if full_scan else settings.SHARD_SCAN_DAYS
+        for post_dir in sorted(list_post_dirs(days), key=os.path.basename):
+            post_id = os.path.basename(post_dir)
+            if post_id in stored or self.sent_posts_cache.is_post_sent(post_id):
+                continue
+            if await asyncio.to_thread(self.post_queue.enqueue, TOPIC_POSTS, post_id):
+                added += 1
+        if added:
+            logger.info(f"[backfill] Поставлено в очередь постов: {added}")
+
+        purged = await asyncio.to_thread(self.post_queue.purge_done, QUEUE_DONE_TTL)
+        if purged:
+            logger.info(f"[backfill] Удалено выполненных заданий: {purged}")
 
     async def check_posts(self, context: ContextTypes.DEFAULT_TYPE) -> None:
         """
-        Периодическая проверка постов.
+        Обработка новых постов из очереди.
+
+        Задание подтверждается после отправки поста модераторам. При ошибке
+        оно возвращается в очередь с задержкой, после QUEUE_MAX_ATTEMPTS попыток
+        помечается проваленным и возвращается в очередь при следующем запуске.
 
         Args:
             context: Контекст бота
@@ -763,66 +893,87 @@ class Bot:
 
         self.is_checking = True
         try:
-            logger.info("[check_posts] Начало периодической проверки постов")
-
-            # Путь к папке с постами
-            saved_dir = SAVED_DIR
-            if not os.path.exists(saved_dir):
-                logger.error(f"[check_posts] Директория saved не найдена: {saved_dir}")
-                return
-
-            # Получаем список всех подпапок
-            post_dirs = []
-            for item in os.listdir(saved_dir):
-                item_path = os.path.join(saved_dir, item)
-                if os.path.isdir(item_path) and item.startswith('post_'):
-                    post_dirs.append(item_path)
-
-            if not post_dirs:
-                logger.info("[check_posts] Директории с постами не найдены")
+            # SQLite может ждать блокировку базы до 30 с: запросы к очереди идут вне цикла событий
+            jobs = await asyncio.to_thread(self.post_queue.claim, TOPIC_POSTS, QUEUE_BATCH_SIZE)
+            if not jobs:
                 return
 
-            logger.info(f"[check_posts] Найдено {len(post_dirs)} директорий с постами")
+            logger.info(f"[check_posts] Получено {len(jobs)} заданий из очереди")
 
-            # Обрабатываем каждый пост
-            success_count = 0
-            error_count = 0
+            async with AsyncFileManager(STORAGE_PATH) as storage:
+                stored = await storage.read()
 
-            for post_dir in sorted(post_dirs):
-                post_id = os.path.basename(post_dir)
-                logger.info(f"[check_posts] Проверка поста {post_id}")
-                
-                # Проверяем, не был ли пост уже отправлен
-                if await self.is_post_sent(post_id):
-                    logger.info(f"[check_posts] Пост {post_id} уже отправлен, пропускаем")
-                    continue
+            # Посты обрабатываются параллельно (до FORWARD_CONCURRENCY), альбомы
+            # уходят модераторам в порядке очереди
+            counts = {"success": 0, "error": 0}
+            semaphore = asyncio.Semaphore(settings.FORWARD_CONCURRENCY)
+            slots = OrderSlots()
 
-                # Проверяем, есть ли пост в storage
-                async with AsyncFileManager(STORAGE_PATH) as storage:
-                    data = await storage.read()
-                    if post_id in data:
-                        logger.info(f"[check_posts] Пост {post_id} уже есть в storage, пропускаем")
-                        continue
-
-                processing_result = False
+            async def handle(job, slot: OrderSlot) -> None:
                 try:
-                    processing_result = await self.process_post(post_dir, context)
-                except Exception as e:
-                    logger.error(f"[check_posts] Ошибка при обработке поста {post_id}: {e}", exc_info=True)
-                if processing_result:
-                    success_count += 1
-                    logger.info(f"[check_posts] Пост {post_id} успешно обработан")
-                else:
-                    error_count += 1
-                    logger.info(f"[check_posts] Ошибка при обработке поста {post_id}")
+                    await self._forward_job(job, slot, stored, context, counts)
+                finally:
+                    slot.release()
+                    semaphore.release()
+
+            tasks = []
+            for job in jobs:
+                # Захватываем семафор по порядку, чтобы слоты освобождались по очереди
+                await semaphore.acquire()
+                tasks.append(asyncio.create_task(handle(job, slots.reserve())))
+            await asyncio.gather(*tasks)
+            success_count, error_count = counts["success"], counts["error"]
 
+            self.sent_posts_cache.update_last_check()
             logger.info(f"[check_posts] Проверка завершена. Успешно: {success_count}, Ошибок: {error_count}")
         except Exception as e:
             logger.error(f"[check_posts] Ошибка в периодической проверке: {e}", exc_info=True)
         finally:
             self.is_checking = False
-            self.sent_posts_cache.update_last_check()
-            logger.info("[check_posts] Проверка завершена, флаг is_checking сброшен")
+
+    async def _forward_job(self, job, slot: OrderSlot, stored: Dict[str, Any], context, counts: Dict[str, int]) -> None:
+        """
+        Отправляет модераторам пост из задания очереди и подтверждает или возвращает задание.
+
+        Args:
+            job: Задание очереди
+            slot: Слот в очереди отправки
+            stored: Данные storage.json на момент выборки заданий
+            context: Контекст бота
+            counts: Счетчики успешных и неудачных отправок
+        """
+        post_id = job.key
+        post_dir = get_post_dir(post_id)
+        logger.info(f"[check_posts] Проверка поста {post_id} (попытка {job.attempts})")
+
+        # Проверяем, не был ли пост уже отправлен
+        if await self.is_post_sent(post_id) or post_id in stored:
+            logger.info(f"[check_posts] Пост {post_id} уже отправлен, пропускаем")
+            await asyncio.to_thread(self.post_queue.ack, job)
+            return
+
+        if not os.path.isdir(post_dir):
+            logger.warning(f"[check_posts] Папка поста {post_id} не найдена, задание снято")
+            await asyncio.to_thread(self.post_queue.ack, job)
+            return
+
+        processing_result = False
+        try:
+            processing_result = await self.process_post(post_dir, context, slot)
+        except Exception as e:
+            logger.error(f"[check_posts] Ошибка при обработке поста {post_id}: {e}", exc_info=True)
+        if processing_result:
+            counts["success"] += 1
+            await asyncio.to_thread(self.post_queue.ack, job)
+            logger.info(f"[check_posts] Пост {post_id} успешно обработан")
+        elif job.attempts >= QUEUE_MAX_ATTEMPTS:
+            counts["error"] += 1
+            await asyncio.to_thread(self.post_queue.fail, job)
+            logger.error(f"[check_posts] Пост {post_id} не обработан за {job.attempts} попыток, задание помечено проваленным")
+        else:
+            counts["error"] += 1
+            await asyncio.to_thread(self.post_queue.nack, job, QUEUE_RETRY_DELAY)
+            logger.info(f"[check_posts] Ошибка при обработке поста {post_id}, повтор через {QUEUE_RETRY_DELAY} с")
 
     async def test_command(
             self,
@@ -859,12 +1010,8 @@ class Bot:
                 await update.message.reply_text("❌ Папка saved не найдена")
                 return
 
-            # Получаем список всех подпапок
-            post_dirs = []
-            for item in os.listdir(saved_dir):
-                item_path = os.path.join(saved_dir, item)
-                if os.path.isdir(item_path) and item.startswith('post_'):
-                    post_dirs.append(item_path)
+            # Получаем список всех папок постов
+            post_dirs = list_post_dirs()
 
             if not post_dirs:
                 logger.info("No post directories found")
@@ -877,7 +1024,7 @@ class Bot:
             success_count = 0
             error_count = 0
 
-            for post_dir in sorted(post_dirs):
+            for post_dir in sorted(post_dirs, key=os.path.basename):
                 processing_result = False
                 try:
                     processing_result = await self.process_post(post_dir, context)
@@ -939,15 +1086,22 @@ class Bot:
 
     async def _run_periodic_check(
             self, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Запуск периодической проверки постов."""
+        """Запуск периодической проверки очереди постов."""
+        last_backfill = None
         while True:
             try:
+                now = time.monotonic()
+                if last_backfill is None or now - last_backfill >= settings.QUEUE_RESCAN_INTERVAL:
+                    # При запуске просматриваем все шарды, дальше только последние дни
+                    await self._backfill_queue(full_scan=last_backfill is None)
+                    last_backfill = now
                 await self.check_posts(context)
             except Exception as e:
                 logger.error(f"Error in periodic check: {e}", exc_info=True)
-            await asyncio.sleep(20)  # Проверка каждые 20 секунд
+            await asyncio.sleep(settings.QUEUE_POLL_INTERVAL)
 
     @check_moderation_block
+    @with_post_lock
     async def handle_delete_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """
         Обработчик callback-запросов для удаления поста.
@@ -1020,11 +1174,12 @@ class Bot:
             except Exception as e:
                 logger.error(f"Ошибка при удалении сообщения с клавиатурой: {e}", exc_info=True)
             # Удаляем файлы поста
-            post_dir = os.path.join(SAVED_DIR, post_id)
+            post_dir = get_post_dir(post_id)
             if os.path.exists(post_dir):
                 try:
                     import shutil
                     shutil.rmtree(post_dir)
+                    post_repository.invalidate(post_dir)
                     logger.info(f"Удалена директория {post_dir}")
                 except Exception as e:
                     logger.error(f"Ошибка при удалении файлов поста: {e}", exc_info=True)
@@ -1040,6 +1195,7 @@ class Bot:
             await remove_moderation_block(post_id)
             # Очищаем контекст
             self.state_manager.clear_post_context(post_id)
+            self.originals_requested.pop(post_id, None)
             # Отправляем уведомление об удалении
             await context.bot.send_message(
                 chat_id=post_context.chat_id,
@@ -1053,6 +1209,7 @@ class Bot:
             )
 
     @check_moderation_block
+    @with_post_lock
     async def handle_moderate_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """
         Обработчик callback-запросов для модерации поста.
@@ -1135,6 +1292,9 @@ class Bot:
             # Обновляем состояние поста
             post_context.state = BotState.MODERATE_MENU
             self.state_manager.set_post_context(post_id, post_context)
+
+            # Оригиналы фото запрашиваем заранее: к публикации они обычно уже загружены
+            await self._request_originals(post_id)
             
         except Exception as e:
             logger.error(f"Ошибка при обработке модерации поста: {e}", exc_info=True)
@@ -1143,6 +1303,57 @@ class Bot:
                 text="❌ Произошла ошибка при обработке модерации"
             )
 
+    async def _request_originals(self, post_id: str) -> None:
+        """
+        Ставит юзерботу задание на загрузку оригиналов фото, если пост сохранен в превью.
+
+        Args:
+            post_id: ID поста
+        """
+        if settings.ORIGINALS_WAIT <= 0:
+            return
+        manifest = post_repository.load(get_post_dir(post_id))
+        if manifest is None or manifest.photo_tier != "preview":
+            return
+        try:
+            # Выполненное задание перезапускаем: пост все еще в превью, значит оригиналы не получены
+            await asyncio.to_thread(self.post_queue.enqueue, TOPIC_ORIGINALS, post_id, reset=True)
+        except Exception as e:
+            logger.error(f"Не удалось запросить оригиналы фото поста {post_id}: {e}")
+            return
+        self.originals_requested.setdefault(post_id, time.monotonic())
+
+    async def _wait_for_originals(self, post_id: str, post_dir: str, manifest):
+        """
+        Ждет оригиналы фото, запрошенные при начале модерации.
+
+        Ожидание отсчитывается от запроса, а не от публикации, поэтому обычно
+        оригиналы уже на месте и публикация не задерживает обработку обновлений.
+
+        Args:
+            post_id: ID поста
+            post_dir: Папка поста
+            manifest: Текущий манифест поста
+
+        Returns:
+            PostManifest: Манифест с оригиналами или исходный, если оригиналы не пришли вовремя
+        """
+        if settings.ORIGINALS_WAIT <= 0:
+            return manifest
+        await self._request_originals(post_id)
+        requested = self.originals_requested.pop(post_id, time.monotonic())
+        deadline = requested + settings.ORIGINALS_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+            current = post_repository.load(post_dir)
+            if current is not None and current.photo_tier != "preview":
+                logger.info(f"Оригиналы фото поста {post_id} получены")
+                return current
+        logger.warning(
+            f"Оригиналы фото поста {post_id} не получены за {settings.ORIGINALS_WAIT} с, публикуем превью"
+        )
+        return manifest
+
     async def publish_post(self, post_id: str, context: ContextTypes.DEFAULT_TYPE) -> bool:
         """
         Публикация поста в каналы.
@@ -1191,88 +1402,60 @@ class Bot:
             logger.info(f"Текст поста для публикации: {post_text[:100]}...")
 
 
-            # Получаем путь к папке поста
-            post_dir = os.path.join(SAVED_DIR, post_id)
-            if not os.path.exists(post_dir):
+            # Получаем путь к папке поста (фото, добавленные модератором, должны быть скачаны)
+            await self._wait_archived(post_id)
+            post_dir = get_post_dir(post_id)
+            manifest = post_repository.load(post_dir)
+            if manifest is None:
                 logger.error(f"Папка поста не найдена: {post_dir}")
                 return False
 
-            # Читаем text_close.txt для закрытого канала
-            text_close_file = os.path.join(post_dir, "text_close.txt")
-            if not os.path.exists(text_close_file):
-                logger.error(f"Файл text_close.txt не найден в {post_dir}")
-                return False
-
-            # Читаем текст для закрытого канала
-            with open(text_close_file, 'r', encoding='utf-8') as f:
-                close_text = f.read().strip()
-                logger.info(f"Текст из text_close.txt: {close_text[:100]}...")
+            # Фото сохранены юзерботом в уменьшенном размере: перед публикацией просим оригиналы
+            if manifest.photo_tier == "preview":
+                manifest = await self._wait_for_originals(post_id, post_dir, manifest)
 
-            # Читаем первые две строки из source.txt
-            source_file = os.path.join(post_dir, "source.txt")
-            if not os.path.exists(source_file):
-                logger.error(f"Файл source.txt не найден в {post_dir}")
-                return False
-
-            with open(source_file, 'r', encoding='utf-8') as f:
-                source_lines = f.readlines()
-                if len(source_lines) >= 2:
-                    source_text = ''.join(source_lines[:2]).strip()
-                    logger.info(f"Первые две строки из source.txt: {source_text}")
-                else:
-                    logger.error(f"В файле source.txt недостаточно строк: {source_lines}")
-                    return False
+            # Подписи готовятся при отправке на модерацию и после правок текста;
+            # пересчитываем только если текст изменился мимо них (или пост старый)
+            if manifest.captions.get("moderation") != post_text:
+                logger.info(f"Подписи поста {post_id} устарели, пересчитываем")
+                manifest.captions = await self.text_processor.render_captions(
+                    post_text, manifest.text_close, manifest.source_text
+                )
+            processed_text = manifest.captions["public"]
+            processed_close_text = manifest.captions["private"]
 
-            # Получаем список фотографий
-            photos = sorted(
-                [f for f in os.listdir(post_dir) if f.startswith("photo_") and f.endswith(".jpg")],
-                key=lambda x: int(x.split("_")[1].split(".")[0])
-            )
-            if not photos:
+            # Фотографии в порядке из манифеста: по file_id, если он известен
+            photo_media = manifest.photo_media(post_dir)
+            if not photo_media:
                 logger.error(f"Нет фотографий в папке {post_dir}")
                 return False
-            
-            photo_paths = [os.path.join(post_dir, photo) for photo in photos]
-            logger.info(f"Найдено {len(photos)} фотографий: {photo_paths}")
-            
-            # Обрабатываем текст для публикации в открытый канал
-            processed_text, was_truncated = await self.text_processor.process_text(post_text, is_channel=True)
-            if was_truncated:
-                logger.info("Текст был обрезан из-за превышения лимита")
-            
-            # Обрабатываем текст для закрытого канала
-            processed_close_text, was_truncated = await self.text_processor.process_private_channel_text(
-                close_text,
-                source_text
-            )
-            if was_truncated:
-                logger.info("Текст для закрытого канала был обрезан из-за превышения лимита")
+            logger.info(f"Найдено {len(photo_media)} фотографий")
             
             # Формируем медиа-группу
             media_group = []
             private_first_media_photo = None
-            for i, path in enumerate(photo_paths):
+            for i, media in enumerate(photo_media):
                 try:
                     # Добавляем caption только к первой фотографии
                     if i == 0:
                         private_first_media_photo = InputMediaPhoto(
-                            media=open(path, 'rb'),
+                            media=media,
                             caption=processed_close_text
                         )
                         media_group.append(
                             InputMediaPhoto(
-                                media=open(path, 'rb'),
+                                media=media,
                                 caption=processed_text
                             )
                         )
                     else:
                         media_group.append(
                             InputMediaPhoto(
-                                media=open(path, 'rb')
+                                media=media
                             )
                         )
                 except Exception as e:
-                    logger.error(f"Ошибка при добавлении фото {path}: {e}", exc_info=True)
+                    logger.error(f"Ошибка при добавлении фото {media}: {e}", exc_info=True)
                     return False
             # Публикуем в открытый канал
             logger.info("Публикация в открытый канал")
@@ -1319,6 +1502,8 @@ class Bot:
                     logger.info(f"Статус поста {post_id} обновлен на 'published'")
                 else:
                     logger.warning(f"Пост {post_id} не найден в storage для обновления статуса")
+            manifest.status = 'published'
+            post_repository.save(post_dir, manifest)
             
             logger.info(f"=== Завершение публикации поста {post_id} ===")
             return True
@@ -1391,12 +1576,13 @@ class Bot:
                     logger.error(f"Ошибка при удалении сообщения с клавиатурой: {e}", exc_info=True)
             
             # Удаляем директорию поста и файлы
-            post_dir = os.path.join(SAVED_DIR, post_id)
+            post_dir = get_post_dir(post_id)
             if os.path.exists(post_dir):
                 logger.info(f"Удаление файлов поста из директории: {post_dir}")
                 try:
                     import shutil
                     shutil.rmtree(post_dir)
+                    post_repository.invalidate(post_dir)
                     logger.info(f"Удалена директория {post_dir}")
                 except Exception as e:
                     logger.error(f"[delete_post_and_messages_by_id] Ошибка при удалении файлов поста: {e}", exc_info=True)
@@ -1421,6 +1607,7 @@ class Bot:
             # Очищаем контекст
             logger.info("Очистка контекста поста")
             self.state_manager.clear_post_context(post_id)
+            self.originals_requested.pop(post_id, None)
             
             # Отправляем уведомление об удалении
             logger.info("Отправка уведомления об удалении")
@@ -1432,6 +1619,7 @@ class Bot:
             logger.info("=== Завершение обработки callback-запроса на удаление ===")
 
     @check_moderation_block
+    @with_post_lock
     async def handle_publish_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """
         Обработчик callback-запросов для публикации поста.
@@ -1476,6 +1664,7 @@ class Bot:
             )
 
     @check_moderation_block
+    @with_post_lock
     async def handle_edit(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Обработчик нажатия на кнопку 'Редактировать' или 'Назад' из меню медиа."""
         query = update.callback_query
@@ -1524,6 +1713,7 @@ class Bot:
         self.state_manager.set_post_context(post_id, post_context)
 
     @check_moderation_block
+    @with_post_lock
     async def handle_edit_text_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Обработчик нажатия на кнопку 'Текст'."""
         query = update.callback_query
@@ -1562,6 +1752,32 @@ class Bot:
         self.state_manager.set_post_context(post_id, post_context)
 
     @check_moderation_block
+    @with_post_lock
+    async def handle_sber_text_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Обработчик нажатия на кнопку 'Текст Sber'."""
+        query = update.callback_query
+        post_id = query.data[len("sbertext_"):]
+
+        post_context = self.state_manager.get_post_context(post_id)
+        if not post_context:
+            logger.error(f"Контекст поста {post_id} не найден")
+            await query.answer()
+            await query.message.edit_text("Ошибка: пост не найден")
+            return
+
+        # Устанавливаем user_id в контекст поста
+        post_context.user_id = query.from_user.id
+
+        if post_context.state != BotState.EDIT_MENU:
+            logger.error(f"Некорректное состояние для форматирования текста: {post_context.state}")
+            await query.answer()
+            await query.message.edit_text("Ошибка: некорректное состояние поста")
+            return
+
+        await handle_edit_sber_text_callback(update, context, self.state_manager, post_context, post_id)
+
+    @check_moderation_block
+    @with_post_lock
     async def handle_edit_media_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Обработчик callback-запроса для кнопки 'Медиа'."""
         query = update.callback_query
@@ -1586,6 +1802,7 @@ class Bot:
         )
 
     @check_moderation_block
+    @with_post_lock
     async def handle_add_media_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Обработчик callback-запроса для кнопки 'Добавить'."""
         query = update.callback_query
@@ -1605,9 +1822,9 @@ class Bot:
         self.state_manager.set_post_context(post_id, post_context)
         
         # Считаем, сколько фото уже есть
-        post_dir = os.path.join(SAVED_DIR, post_id)
-        old_photos = [f for f in os.listdir(post_dir) if f.startswith("photo_") and f.endswith(".jpg")]
-        max_to_add = 10 - len(old_photos)
+        post_dir = get_post_dir(post_id)
+        manifest = post_repository.load(post_dir)
+        max_to_add = 10 - (len(manifest.photos) if manifest else 0)
         
         msg = await context.bot.send_message(
             chat_id=post_context.chat_id,
@@ -1617,6 +1834,7 @@ class Bot:
         self.state_manager.set_post_context(post_id, post_context)
 
     @check_moderation_block
+    @with_post_lock
     async def handle_remove_media_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Обработчик callback-запроса для кнопки 'Удалить'."""
         query = update.callback_query
@@ -1637,9 +1855,9 @@ class Bot:
         self.state_manager.set_post_context(post_id, post_context)
         
         # Получаем список фото
-        post_dir = os.path.join(SAVED_DIR, post_id)
-        photos = [f for f in os.listdir(post_dir) if f.startswith("photo_") and f.endswith(".jpg")]
-        photos.sort(key=lambda x: int(x.split('_')[1].split('.')[0]))
+        post_dir = get_post_dir(post_id)
+        manifest = post_repository.load(post_dir)
+        photos = [photo["file"] for photo in manifest.photos] if manifest else []
         
         if not photos:
             await query.message.edit_text(
@@ -8,6 +8,7 @@ from telegram import Update
 from telegram.ext import ContextTypes
 
 from src.bot.moderation_block import check_and_set_moderation_block
+from src.bot.post_locks import callback_post_id, post_locks
 
 logger = logging.getLogger(__name__)
 
@@ -60,6 +61,8 @@ def check_moderation_block(func: Callable) -> Callable:
             post_id = callback_data.replace("addmedia_", "")
         elif callback_data.startswith("removemedia_"):
             post_id = callback_data.replace("removemedia_", "")
+        elif callback_data.startswith("sbertext_"):
+            post_id = callback_data.replace("sbertext_", "")
             
         if not post_id:
             logger.error(f"Не удалось извлечь post_id из callback_data: {callback_data}")
@@ -87,4 +90,25 @@ def check_moderation_block(func: Callable) -> Callable:
         # выполняем оригинальную функцию
         return await func(self, update, context, *args, **kwargs)
         
-    return wrapper 
\ No newline at end of file
+    return wrapper 
+
+def with_post_lock(func: Callable) -> Callable:
+    """
+    Декоратор, выполняющий обработчик кнопки поста под блокировкой этого поста.
+
+    Args:
+        func: Функция-обработчик callback-запроса
+
+    Returns:
+        Callable: Обернутая функция
+    """
+    @functools.wraps(func)
+    async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE, *args: Any, **kwargs: Any) -> None:
+        query = update.callback_query
+        post_id = callback_post_id(query.data) if query and query.data else None
+        if not post_id:
+            return await func(self, update, context, *args, **kwargs)
+        async with post_locks.hold(post_id):
+            return await func(self, update, context, *args, **kwargs)
+
+    return wrapper
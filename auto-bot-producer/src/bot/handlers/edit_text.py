@@ -9,6 +9,7 @@ from telegram.ext import ContextTypes
 from ..states import BotState, PostContext
 from ..keyboards import get_moderate_keyboard
 from ..text_processor import TextProcessor
+from ..post_layout import get_post_dir
 from ..decorators import check_moderation_block
 
 logger = logging.getLogger(__name__)
@@ -34,7 +35,7 @@ async def handle_edit_text_message(
         await update.message.reply_text("⚠️ Текст был обрезан из-за превышения лимита Telegram")
     
     # Получаем путь к папке поста
-    post_dir = os.path.join(settings.SAVED_DIR, post_id)
+    post_dir = get_post_dir(post_id)
     if not os.path.exists(post_dir):
         logger.error(f"Папка поста не найдена: {post_dir}")
         await update.message.reply_text("❌ Ошибка: папка поста не найдена")
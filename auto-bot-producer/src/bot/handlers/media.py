@@ -1,18 +1,17 @@
 import os
-import asyncio
 import logging
 import time
 from telegram import Update, InputMediaPhoto
 from telegram.ext import ContextTypes
-from typing import List, Dict, Optional, Set
+from typing import Any, List, Optional
 from src.bot.decorators import check_moderation_block
 from src.bot.keyboards import get_media_confirm_keyboard
+from src.bot.post_layout import get_post_dir
+from src.bot.album_collector import AlbumCollector
+from src.utils.media_store import download_photo
 
-# Глобальные переменные для хранения временных данных
-media_group_temp: Dict[int, Dict[str, List]] = {}  # {user_id: {media_group_id: [photo, ...]}}
-media_group_tasks: Dict[int, Dict[str, asyncio.Task]] = {}  # {user_id: {media_group_id: asyncio.Task}}
-media_group_file_ids: Dict[int, Dict[str, Set[str]]] = {}  # {user_id: {media_group_id: {file_id, ...}}}
-MEDIA_GROUP_TIMEOUT = 9.0  # Таймаут для сбора альбома
+# Сборка альбомов из отдельных сообщений
+album_collector = AlbumCollector()
 
 @check_moderation_block
 async def handle_photo(
@@ -41,40 +40,13 @@ async def handle_photo(
     media_group_id = update.message.media_group_id
     
     if media_group_id:
-        # Инициализация структур для альбома
-        if user_id not in media_group_temp:
-            media_group_temp[user_id] = {}
-            media_group_file_ids[user_id] = {}
-        if user_id not in media_group_tasks:
-            media_group_tasks[user_id] = {}
-        if media_group_id not in media_group_temp[user_id]:
-            media_group_temp[user_id][media_group_id] = []
-            media_group_file_ids[user_id][media_group_id] = set()
-            
-        # Получаем file_id самой большой версии фото
+        # Самая большая версия фото; повторы отбрасываются по file_id
         largest_photo = photos[-1]
-        file_id = largest_photo.file_id
-        
-        # Проверяем, не было ли уже добавлено это фото
-        if file_id not in media_group_file_ids[user_id][media_group_id]:
-            media_group_temp[user_id][media_group_id].append(largest_photo)
-            media_group_file_ids[user_id][media_group_id].add(file_id)
-            
-            # Создаем или обновляем таймер для сбора альбома
-            if media_group_id in media_group_tasks[user_id]:
-                try:
-                    media_group_tasks[user_id][media_group_id].cancel()
-                except Exception as e:
-                    logging.error(f"Ошибка при отмене таймера: {e}")
-                    
-            async def finish_media_group():
-                try:
-                    await asyncio.sleep(MEDIA_GROUP_TIMEOUT)
-                    await process_media_group(user_id, media_group_id, context, post_id, operation_context)
-                except asyncio.CancelledError:
-                    pass
-                    
-            media_group_tasks[user_id][media_group_id] = asyncio.create_task(finish_media_group())
+
+        async def finish_media_group(album_photos: List[Any]) -> None:
+            await process_media_group(user_id, album_photos, context, post_id, operation_context)
+
+        album_collector.add(user_id, media_group_id, largest_photo, finish_media_group, key=largest_photo.file_id)
     else:
         # Обработка одиночного фото
         await process_single_photo(update, context, post_id, operation_context)
@@ -101,15 +73,14 @@ async def process_single_photo(
     try:
         # Определяем директорию для сохранения в зависимости от контекста
         if operation_context == "edit" and post_id:
-            save_dir = os.path.join("saved", post_id)
+            save_dir = get_post_dir(post_id)
         else:
             save_dir = f"media/{user_id}"
         os.makedirs(save_dir, exist_ok=True)
         
         # Сохраняем фото
-        file = await photo.get_file()
         file_path = f"{save_dir}/photo_{int(time.time())}.jpg"
-        await file.download_to_drive(file_path)
+        await download_photo(photo, file_path)
         
         # Отправляем подтверждение
         await update.message.reply_text(
@@ -124,7 +95,7 @@ async def process_single_photo(
 @check_moderation_block
 async def process_media_group(
     user_id: int, 
-    media_group_id: str, 
+    album_photos: List[Any], 
     context: ContextTypes.DEFAULT_TYPE,
     post_id: Optional[str] = None,
     operation_context: str = "create"
@@ -134,30 +105,25 @@ async def process_media_group(
     
     Args:
         user_id: ID пользователя
-        media_group_id: ID группы медиа
+        album_photos: Фото альбома
         context: Контекст бота
         post_id: ID поста (опционально, для контекста редактирования)
         operation_context: Контекст операции ("create" или "edit")
     """
-    if user_id not in media_group_temp or media_group_id not in media_group_temp[user_id]:
-        return
-        
-    album_photos = media_group_temp[user_id][media_group_id]
     saved_paths = []
     
     try:
         # Определяем директорию для сохранения в зависимости от контекста
         if operation_context == "edit" and post_id:
-            save_dir = os.path.join("saved", post_id)
+            save_dir = get_post_dir(post_id)
         else:
             save_dir = f"media/{user_id}"
         os.makedirs(save_dir, exist_ok=True)
         
         # Сохраняем все фото из альбома
         for i, photo in enumerate(album_photos):
-            file = await photo.get_file()
             file_path = f"{save_dir}/photo_{int(time.time())}_{i}.jpg"
-            await file.download_to_drive(file_path)
+            await download_photo(photo, file_path)
             saved_paths.append(file_path)
             
         # Отправляем подтверждение
@@ -172,10 +138,4 @@ async def process_media_group(
         await context.bot.send_message(
             chat_id=user_id,
             text="Произошла ошибка при сохранении альбома"
-        )
-    finally:
-        # Очищаем временные данные
-        if user_id in media_group_temp:
-            media_group_temp[user_id].pop(media_group_id, None)
-            media_group_file_ids[user_id].pop(media_group_id, None)
-            media_group_tasks[user_id].pop(media_group_id, None) 
\ No newline at end of file
+        ) 
\ No newline at end of file
@@ -8,6 +8,7 @@ from telegram.ext import ContextTypes
 
 from ..states import BotState, PostContext
 from ..text_processor import TextProcessor
+from ..post_layout import get_post_dir
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +26,7 @@ async def handle_publish_callback(
     text_processor = TextProcessor()
     
     # Получаем путь к папке поста
-    post_dir = os.path.join(settings.SAVED_DIR, post_id)
+    post_dir = get_post_dir(post_id)
     if not os.path.exists(post_dir):
         logger.error(f"Папка поста не найдена: {post_dir}")
         await update.message.reply_text("❌ Ошибка: папка поста не найдена")
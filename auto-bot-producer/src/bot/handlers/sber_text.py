@@ -8,13 +8,16 @@ from telegram.ext import ContextTypes
 
 from ..states import BotState, PostContext
 from ..keyboards import get_moderate_keyboard
-from ..decorators import check_moderation_block
-from src.utils.api import format_text_with_sber
+from src.utils.api import format_text_with_sber, stream_format_text_with_sber
+from src.bot.preformatter import load_preformatted
+from src.bot.post_repository import post_repository
+from src.bot.post_layout import get_post_dir
+from src.bot.stream_preview import StreamPreview
+from src.bot.text_processor import TextProcessor
 from src.config.settings import settings
 
 logger = logging.getLogger(__name__)
 
-@check_moderation_block
 async def handle_edit_sber_text_callback(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
@@ -22,7 +25,12 @@ async def handle_edit_sber_text_callback(
     post_context: PostContext,
     post_id: str
 ) -> None:
-    """Обработчик кнопки 'Текст Sber'."""
+    """
+    Обработчик кнопки 'Текст Sber'.
+
+    Вызывается из Bot.handle_sber_text_callback, который проверяет блокировку
+    модерации и держит блокировку поста.
+    """
     query = update.callback_query
     await query.answer()
     
@@ -31,64 +39,78 @@ async def handle_edit_sber_text_callback(
     # Получаем текущий текст поста
     current_text = post_context.original_text
     
-    # Отправляем текст в Sber API
-    formatted_text, token_stats = await format_text_with_sber(current_text, settings.FORMAT_PROMPT)
-    
-    if not formatted_text:
-        logger.error(f"Ошибка при форматировании текста для поста {post_id}")
-        await query.message.edit_text("❌ Ошибка при форматировании текста")
-        return
-    
-    logger.info(f"Текст успешно отформатирован через Sber GPT для поста {post_id}")
-    
     # Получаем путь к папке поста
-    post_dir = os.path.join(settings.SAVE_DIR, post_id)
-    if not os.path.exists(post_dir):
+    post_dir = get_post_dir(post_id)
+    manifest = post_repository.load(post_dir)
+    if manifest is None:
         logger.error(f"Папка поста не найдена: {post_dir}")
         await query.message.edit_text("❌ Ошибка: папка поста не найдена")
         return
     
-    # Сохраняем новый текст в temp.txt
-    temp_file = os.path.join(post_dir, "temp.txt")
-    with open(temp_file, 'w', encoding='utf-8') as f:
-        f.write(formatted_text)
+    preview = None
+    try:
+        # Берем результат фонового форматирования, если он готов
+        formatted_text = load_preformatted(post_dir, current_text)
+        if formatted_text:
+            logger.info(f"Текст для поста {post_id} взят из результата фонового форматирования")
+        else:
+            # Отправляем текст в Sber API
+            if settings.SBER_STREAMING:
+                # Показываем модераторам текст по мере генерации
+                preview = StreamPreview(context.bot, post_context.chat_id)
+                await preview.start()
+                formatted_text, token_stats = await stream_format_text_with_sber(
+                    current_text, settings.FORMAT_PROMPT, preview.update
+                )
+            else:
+                formatted_text, token_stats = await format_text_with_sber(current_text, settings.FORMAT_PROMPT)
+        
+            if not formatted_text:
+                if token_stats.get('refused'):
+                    logger.warning(f"Форматирование поста {post_id} отклонено: недостаточно лимита токенов")
+                    await query.message.edit_text("❌ Недостаточно лимита токенов Sber GPT для форматирования")
+                    return
+                logger.error(f"Ошибка при форматировании текста для поста {post_id}")
+                await query.message.edit_text("❌ Ошибка при форматировании текста")
+                return
+        
+            if token_stats.get('cached'):
+                logger.info(f"Текст для поста {post_id} взят из кэша Sber GPT (0 токенов)")
+            else:
+                logger.info(f"Текст успешно отформатирован через Sber GPT для поста {post_id}")
+    
+        # Сохраняем новый текст в temp.txt
+        temp_file = os.path.join(post_dir, "temp.txt")
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            f.write(formatted_text)
     
-    # Получаем список фото
-    photos = [f for f in os.listdir(post_dir) if f.startswith("photo_") and f.endswith(".jpg")]
-    photos.sort(key=lambda x: int(x.split('_')[1].split('.')[0]))
+        # Фотографии в порядке из манифеста: по file_id, с диска только фото без file_id
+        photo_media = manifest.photo_media(post_dir)
     
-    if not photos:
-        logger.error(f"Фотографии не найдены в папке {post_dir}")
-        await query.message.edit_text("❌ Ошибка: фотографии не найдены")
-        return
+        if not photo_media:
+            logger.error(f"Фотографии не найдены в папке {post_dir}")
+            await query.message.edit_text("❌ Ошибка: фотографии не найдены")
+            return
     
-    # Формируем пути к фото
-    photo_paths = [os.path.join(post_dir, photo) for photo in photos]
-    logger.info(f"Найдено {len(photos)} фотографий: {photo_paths}")
+        logger.info(f"Найдено {len(photo_media)} фотографий")
     
-    # Отправляем новый пост
-    media_group = []
-    for i, path in enumerate(photo_paths):
-        with open(path, 'rb') as photo:
+        # Отправляем новый пост
+        media_group = []
+        for i, media in enumerate(photo_media):
             if i == 0:
-                media_group.append(
-                    InputMediaPhoto(
-                        media=photo,
-                        caption=formatted_text
-                    )
-                )
+                media_group.append(InputMediaPhoto(media=media, caption=formatted_text))
             else:
-                media_group.append(
-                    InputMediaPhoto(
-                        media=photo
-                    )
-                )
+                media_group.append(InputMediaPhoto(media=media))
     
-    messages = await context.bot.send_media_group(
-        chat_id=post_context.chat_id,
-        media=media_group
-    )
-    logger.info("Новый пост успешно отправлен")
+        messages = await context.bot.send_media_group(
+            chat_id=post_context.chat_id,
+            media=media_group
+        )
+        logger.info("Новый пост успешно отправлен")
+    finally:
+        # Итоговый текст зафиксирован в подписи (или отправка не удалась), превью больше не нужно
+        if preview:
+            await preview.delete()
     
     # Обновляем контекст поста
     message_ids = [msg.message_id for msg in messages]
@@ -97,6 +119,12 @@ async def handle_edit_sber_text_callback(
     post_context.state = BotState.MODERATE_MENU
     logger.info(f"Смена состояния: EDIT_SBER_TEXT_WAIT -> MODERATE_MENU для поста {post_id}")
     state_manager.set_post_context(post_id, post_context)
+
+    # Подписи для публикации пересчитываем сразу после правки
+    manifest.captions = await TextProcessor().render_captions(
+        formatted_text, manifest.text_close, manifest.source_text
+    )
+    post_repository.save(post_dir, manifest)
     
     # Отправляем клавиатуру
     keyboard_message = await context.bot.send_message(
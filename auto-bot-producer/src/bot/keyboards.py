@@ -37,6 +37,9 @@ def get_edit_keyboard(post_id: str) -> InlineKeyboardMarkup:
             InlineKeyboardButton("Текст", callback_data=f"edittext_{post_id}"),
             InlineKeyboardButton("Медиа", callback_data=f"editmedia_{post_id}")
         ],
+        [
+            InlineKeyboardButton("Текст Sber", callback_data=f"sbertext_{post_id}")
+        ],
         [
             InlineKeyboardButton("🔙 Назад", callback_data=f"moderate_{post_id}")
         ]
@@ -0,0 +1,69 @@
+"""
+Порядок и темп отправки постов в группу модераторов.
+
+Посты обрабатываются параллельно, но альбомы должны появляться в группе в порядке
+очереди. Каждому посту заранее выдается слот: альбом слота отправляется только
+после того, как отправлен альбом предыдущего слота. Общий темп отправки
+ограничивается RateLimiter.
+"""
+import time
+import asyncio
+from collections import deque
+from typing import Optional
+
+
+class OrderSlot:
+    """Место поста в очереди отправки."""
+
+    def __init__(self, previous: Optional[asyncio.Future]):
+        self._previous = previous
+        self._done = asyncio.get_running_loop().create_future()
+
+    async def __aenter__(self) -> "OrderSlot":
+        if self._previous is not None:
+            await asyncio.shield(self._previous)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.release()
+
+    def release(self) -> None:
+        """Освобождает слот: следующий пост может отправлять альбом. Повторный вызов ничего не делает."""
+        if not self._done.done():
+            self._done.set_result(None)
+
+
+class OrderSlots:
+    """Выдает слоты в порядке обработки постов."""
+
+    def __init__(self):
+        self._last: Optional[asyncio.Future] = None
+
+    def reserve(self) -> OrderSlot:
+        """Резервирует следующий слот."""
+        slot = OrderSlot(self._last)
+        self._last = slot._done
+        return slot
+
+
+class RateLimiter:
+    """Не больше per_minute запросов за любые 60 секунд (0 — без ограничения)."""
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self._sent: deque = deque()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Ждет, пока можно будет отправить запрос. Ожидающие обслуживаются по очереди."""
+        if not self.per_minute:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._sent and self._sent[0] <= now - 60:
+                    self._sent.popleft()
+                if len(self._sent) < self.per_minute:
+                    break
+                await asyncio.sleep(self._sent[0] + 60 - now)
+            self._sent.append(time.monotonic())
@@ -0,0 +1,96 @@
+"""
+Расположение папок постов в SAVE_DIR.
+
+Посты хранятся в подпапках по дате: SAVE_DIR/YYYY/MM/DD/post_YYYYmmdd_HHMMSS_<id>.
+Дата берется из ID поста, поэтому путь вычисляется без обхода дерева.
+Папки, сохраненные до перехода на шардирование, лежат прямо в SAVE_DIR
+и находятся по запасному пути.
+"""
+import os
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+from src.config.settings import settings
+
+SAVED_DIR = settings.SAVE_DIR
+
+
+def post_date(post_id: str) -> Optional[date]:
+    """
+    Извлекает дату из ID поста вида post_YYYYmmdd_HHMMSS_<id>.
+
+    Returns:
+        Optional[date]: Дата или None, если ID имеет другой формат
+    """
+    parts = post_id.split("_")
+    if len(parts) < 3 or parts[0] != "post":
+        return None
+    try:
+        return datetime.strptime(parts[1], "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+def shard_dir(day: date) -> str:
+    """Папка шарда за указанный день."""
+    return os.path.join(SAVED_DIR, f"{day:%Y}", f"{day:%m}", f"{day:%d}")
+
+
+def get_post_dir(post_id: str) -> str:
+    """
+    Возвращает путь к папке поста.
+
+    Если папка еще лежит в старой плоской структуре, возвращается старый путь.
+    """
+    day = post_date(post_id)
+    legacy = os.path.join(SAVED_DIR, post_id)
+    if day is None:
+        return legacy
+    sharded = os.path.join(shard_dir(day), post_id)
+    if not os.path.isdir(sharded) and os.path.isdir(legacy):
+        return legacy
+    return sharded
+
+
+def _scan_post_dirs(path: str) -> List[str]:
+    """Папки post_* в одной директории."""
+    try:
+        with os.scandir(path) as entries:
+            return [
+                entry.path for entry in entries
+                if entry.name.startswith("post_") and entry.is_dir()
+            ]
+    except FileNotFoundError:
+        return []
+
+
+def list_post_dirs(days: Optional[int] = None) -> List[str]:
+    """
+    Возвращает папки постов.
+
+    Args:
+        days: Сколько последних дней просматривать. None — все шарды
+
+    Returns:
+        List[str]: Пути к папкам, включая папки старой плоской структуры
+    """
+    # Старые посты прямо в SAVE_DIR
+    post_dirs = _scan_post_dirs(SAVED_DIR)
+
+    if days is not None:
+        today = date.today()
+        for offset in range(days):
+            post_dirs.extend(_scan_post_dirs(shard_dir(today - timedelta(days=offset))))
+        return post_dirs
+
+    for year in sorted(os.listdir(SAVED_DIR)):
+        year_dir = os.path.join(SAVED_DIR, year)
+        if not year.isdigit() or not os.path.isdir(year_dir):
+            continue
+        for month in sorted(os.listdir(year_dir)):
+            month_dir = os.path.join(year_dir, month)
+            if not os.path.isdir(month_dir):
+                continue
+            for day in sorted(os.listdir(month_dir)):
+                post_dirs.extend(_scan_post_dirs(os.path.join(month_dir, day)))
+    return post_dirs
@@ -0,0 +1,94 @@
+"""
+Блокировки постов по post_id.
+
+Отправка поста модераторам, /test и действия модераторов над постом выполняются
+под блокировкой этого поста, поэтому не перемешивают удаления и переотправки.
+Разные посты обрабатываются параллельно. Блокировки хранятся по слабым ссылкам
+и исчезают, когда пост никто не держит и не ждет.
+"""
+import time
+import asyncio
+import logging
+import weakref
+import contextlib
+from typing import Any, AsyncIterator, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Префиксы callback_data кнопок, после которых идет post_id (длинные раньше коротких)
+_CALLBACK_PREFIXES = (
+    "publish_post_",
+    "removemedia_",
+    "sbertext_",
+    "editmedia_",
+    "edittext_",
+    "addmedia_",
+    "moderate_",
+    "delete_",
+    "edit_",
+)
+
+# Ожидание дольше этого порога попадает в лог
+SLOW_WAIT = 1.0
+
+
+def callback_post_id(callback_data: str) -> Optional[str]:
+    """
+    Извлекает post_id из callback_data кнопки поста.
+
+    Returns:
+        Optional[str]: post_id или None для неизвестного формата
+    """
+    for prefix in _CALLBACK_PREFIXES:
+        if callback_data.startswith(prefix):
+            return callback_data[len(prefix):].strip() or None
+    return None
+
+
+class KeyedLocks:
+    """Реестр asyncio.Lock по ключу со статистикой ожидания."""
+
+    def __init__(self):
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self.acquired = 0
+        self.contended = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @contextlib.asynccontextmanager
+    async def hold(self, key: str) -> AsyncIterator[None]:
+        """
+        Удерживает блокировку ключа на время блока async with.
+
+        Args:
+            key: Ключ (post_id)
+        """
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[key] = lock
+        contended = lock.locked()
+        started = time.monotonic()
+        async with lock:
+            wait = time.monotonic() - started
+            self.acquired += 1
+            if contended:
+                self.contended += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+                if wait >= SLOW_WAIT:
+                    logger.info(f"Ожидание блокировки поста {key}: {wait:.2f} с")
+            yield
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика блокировок: захваты, ожидания и время ожидания."""
+        return {
+            "acquired": self.acquired,
+            "contended": self.contended,
+            "avg_wait": round(self.total_wait / self.contended, 3) if self.contended else 0.0,
+            "max_wait": round(self.max_wait, 3),
+            "active": len(self._locks),
+        }
+
+
+post_locks = KeyedLocks()
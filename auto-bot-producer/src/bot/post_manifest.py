@@ -0,0 +1,250 @@
+"""
+Манифест поста post.json.
+
+Юзербот записывает манифест один раз после загрузки медиа. Для папок,
+сохраненных до появления манифеста, данные собираются из старых файлов
+text.txt, text_close.txt, source.txt и ready.txt.
+"""
+import os
+import json
+import hashlib
+import logging
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "post.json"
+MANIFEST_VERSION = 1
+
+# Подписи полей старого source.txt
+_SOURCE_LABELS = {
+    "Канал": "channel",
+    "Дата": "date",
+    "ID сообщения": "message_id",
+}
+
+
+@dataclass
+class PostManifest:
+    """Описание сохраненного поста."""
+    post_id: str
+    text: str
+    text_close: str
+    source: Dict[str, Any] = field(default_factory=dict)
+    photos: List[Dict[str, Any]] = field(default_factory=list)  # [{file, size, sha256, tier, file_id}]
+    # preview: фото сохранены в уменьшенном размере, оригиналы догружает юзербот
+    photo_tier: str = "original"
+    # Готовые подписи: moderation (текст модерации), public и private (для каналов)
+    captions: Dict[str, str] = field(default_factory=dict)
+    status: str = "ready"
+    created_at: str = ""
+    version: int = MANIFEST_VERSION
+
+    @property
+    def source_text(self) -> str:
+        """Информация об источнике в формате старого source.txt."""
+        channel = self.source.get("channel")
+        return (
+            f"Канал: @{channel}\n"
+            f"Дата: {self.source.get('date', '')}\n"
+            f"ID сообщения: {self.source.get('message_id', '')}"
+        )
+
+    def photo_paths(self, post_dir: str) -> List[str]:
+        """Пути к фото в порядке публикации."""
+        return [os.path.join(post_dir, photo["file"]) for photo in self.photos]
+
+    def photo_media(self, post_dir: str) -> List[str]:
+        """Фото для отправки: file_id Telegram, если он известен, иначе путь к файлу."""
+        return [photo.get("file_id") or os.path.join(post_dir, photo["file"]) for photo in self.photos]
+
+    def remember_file_ids(self, messages) -> bool:
+        """
+        Записывает file_id фото из отправленного альбома, чтобы повторные отправки не загружали файлы.
+
+        Args:
+            messages: Сообщения альбома в порядке фото манифеста
+
+        Returns:
+            bool: False, если число сообщений не совпадает с числом фото
+        """
+        if len(self.photos) != len(messages):
+            return False
+        for entry, message in zip(self.photos, messages):
+            if message.photo:
+                entry["file_id"] = message.photo[-1].file_id
+        return True
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PostManifest":
+        """Создает манифест из словаря, игнорируя неизвестные поля."""
+        known = {name: data[name] for name in cls.__dataclass_fields__ if name in data}
+        return cls(**known)
+
+
+def _file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Считает SHA-256 файла блоками."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def photo_entry(path: str) -> Dict[str, Any]:
+    """Описание фото для манифеста: имя файла, размер и SHA-256."""
+    return {
+        "file": os.path.basename(path),
+        "size": os.path.getsize(path),
+        "sha256": _file_sha256(path)
+    }
+
+
+def _photo_number(name: str) -> int:
+    """Номер фото из имени photo_N.jpg."""
+    return int(name.split("_")[1].split(".")[0])
+
+
+def list_photo_files(post_dir: str) -> List[str]:
+    """Имена файлов photo_N.jpg в папке поста, отсортированные по номеру."""
+    photos = [f for f in os.listdir(post_dir) if f.startswith("photo_") and f.endswith(".jpg")]
+    photos.sort(key=_photo_number)
+    return photos
+
+
+def _parse_source(source_info: str) -> Dict[str, Any]:
+    """Разбирает старый source.txt в структурированные поля."""
+    source: Dict[str, Any] = {}
+    for line in source_info.splitlines():
+        label, sep, value = line.partition(":")
+        key = _SOURCE_LABELS.get(label.strip())
+        if not sep or not key:
+            continue
+        value = value.strip()
+        if key == "channel":
+            value = value.lstrip("@")
+        elif key == "message_id" and value.isdigit():
+            value = int(value)
+        source[key] = value
+    return source
+
+
+def _read_text_file(path: str) -> Optional[str]:
+    """Читает текстовый файл, если он есть."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+
+def _load_legacy_manifest(post_dir: str) -> Optional[PostManifest]:
+    """Собирает манифест из файлов старого формата."""
+    status = _read_text_file(os.path.join(post_dir, "ready.txt"))
+    if status != "ok":
+        logger.info(f"Пост не готов, статус: {status}")
+        return None
+
+    text = _read_text_file(os.path.join(post_dir, "text.txt"))
+    if text is None:
+        logger.error(f"Файл text.txt не найден: {post_dir}")
+        return None
+
+    source_info = _read_text_file(os.path.join(post_dir, "source.txt"))
+    if source_info is None:
+        logger.error(f"Файл source.txt не найден: {post_dir}")
+        return None
+
+    text_close = _read_text_file(os.path.join(post_dir, "text_close.txt"))
+    photos = [photo_entry(os.path.join(post_dir, name)) for name in list_photo_files(post_dir)]
+    return PostManifest(
+        post_id=os.path.basename(post_dir),
+        text=text,
+        text_close=text_close if text_close is not None else text,
+        source=_parse_source(source_info),
+        photos=photos,
+        created_at=datetime.fromtimestamp(os.path.getmtime(post_dir)).isoformat()
+    )
+
+
+def load_manifest(post_dir: str) -> Optional[PostManifest]:
+    """
+    Загружает манифест поста.
+
+    Args:
+        post_dir: Путь к папке поста
+
+    Returns:
+        Optional[PostManifest]: Манифест или None, если пост не готов или поврежден
+    """
+    path = os.path.join(post_dir, MANIFEST_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return _load_legacy_manifest(post_dir)
+    except Exception as e:
+        logger.error(f"Ошибка при чтении манифеста {path}: {e}")
+        return None
+
+    if data.get("version", 0) > MANIFEST_VERSION:
+        logger.error(f"Неподдерживаемая версия манифеста {data.get('version')}: {path}")
+        return None
+    return PostManifest.from_dict(data)
+
+
+def save_manifest(post_dir: str, manifest: PostManifest) -> None:
+    """
+    Атомарно сохраняет манифест в папку поста.
+
+    Args:
+        post_dir: Путь к папке поста
+        manifest: Манифест
+    """
+    path = os.path.join(post_dir, MANIFEST_FILE)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(asdict(manifest), f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, path)
+
+
+def sync_photos(post_dir: str, manifest: PostManifest) -> None:
+    """
+    Обновляет список фото в манифесте по файлам на диске и сохраняет его.
+
+    Используется после добавления и удаления фото модератором.
+    Дополнительные поля фото (размер превью, ID сообщения) сохраняются по SHA-256.
+    Фото с file_id, файл которых еще не скачан (или не скачался), остаются в списке.
+    """
+    known = {photo.get("sha256"): photo for photo in manifest.photos}
+    unhashed = {photo["file"]: photo for photo in manifest.photos if not photo.get("sha256")}
+    files = list_photo_files(post_dir)
+    pending = {
+        photo["file"]: photo for photo in manifest.photos
+        if photo.get("file_id") and photo["file"] not in files
+    }
+    photos = []
+    for name in sorted(set(files) | set(pending), key=_photo_number):
+        if name in pending:
+            photos.append(pending[name])
+            continue
+        entry = photo_entry(os.path.join(post_dir, name))
+        # Фото без хэша (скачано, но еще не учтено в манифесте) сопоставляем по имени
+        previous = known.get(entry["sha256"]) or unhashed.get(name)
+        if previous:
+            entry = {**previous, **entry}
+        photos.append(entry)
+    manifest.photos = photos
+    if not any(photo.get("tier") == "preview" for photo in photos):
+        manifest.photo_tier = "original"
+    save_manifest(post_dir, manifest)
+
+
+def set_status(post_dir: str, status: str) -> None:
+    """Обновляет статус поста в манифесте."""
+    manifest = load_manifest(post_dir)
+    if manifest is None:
+        return
+    manifest.status = status
+    save_manifest(post_dir, manifest)
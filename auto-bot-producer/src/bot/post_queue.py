@@ -0,0 +1,206 @@
+"""
+Очередь заданий между юзерботом и продюсером на SQLite.
+
+Юзербот ставит в очередь опубликованные посты, продюсер забирает задания,
+подтверждает (ack) или возвращает (nack) их. Если продюсер упал, не подтвердив
+задание, оно снова становится доступным после истечения таймаута видимости.
+"""
+import json
+import time
+import sqlite3
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Схема совпадает со схемой в auto-bot-userbot/post_queue.py
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    topic TEXT NOT NULL,
+    key TEXT NOT NULL,
+    payload TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'ready',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    visible_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    UNIQUE (topic, key)
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (topic, status, visible_at, id);
+"""
+
+STATUS_READY = "ready"
+STATUS_CLAIMED = "claimed"
+STATUS_DONE = "done"
+# Попытки исчерпаны: задание не выдается, пока его не вернут через retry_failed()
+STATUS_FAILED = "failed"
+
+TOPIC_POSTS = "posts"
+# Запросы юзерботу на загрузку оригиналов фото перед публикацией
+TOPIC_ORIGINALS = "originals"
+
+
+@dataclass
+class Job:
+    """Задание из очереди."""
+    id: int
+    topic: str
+    key: str
+    payload: Dict[str, Any]
+    attempts: int
+
+
+class PostQueue:
+    """
+    Очередь заданий с подтверждениями и таймаутом видимости.
+
+    Ключ задания уникален в пределах темы, поэтому повторная постановка
+    уже известного поста ничего не делает (если не передан reset).
+    """
+
+    def __init__(self, db_path: str, visibility_timeout: float = 300.0):
+        self.db_path = db_path
+        self.visibility_timeout = visibility_timeout
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def enqueue(
+        self,
+        topic: str,
+        key: str,
+        payload: Optional[Dict[str, Any]] = None,
+        reset: bool = False
+    ) -> bool:
+        """
+        Ставит задание в очередь.
+
+        Args:
+            topic: Тема задания
+            key: Ключ задания (уникален в пределах темы)
+            payload: Данные задания
+            reset: Вернуть в очередь уже выполненное или проваленное задание с этим ключом
+                (задания в очереди и в работе не трогаются)
+
+        Returns:
+            bool: True если задание добавлено или возвращено в очередь, False если оно уже было в очереди
+        """
+        now = time.time()
+        values = (topic, key, json.dumps(payload or {}, ensure_ascii=False), STATUS_READY, now, now)
+        with self._lock:
+            if reset:
+                cursor = self._conn.execute(
+                    "INSERT INTO jobs (topic, key, payload, status, visible_at, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (topic, key) DO UPDATE SET "
+                    "payload = excluded.payload, status = excluded.status, attempts = 0, "
+                    "visible_at = excluded.visible_at, created_at = excluded.created_at "
+                    "WHERE jobs.status IN (?, ?)",
+                    values + (STATUS_DONE, STATUS_FAILED)
+                )
+            else:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO jobs (topic, key, payload, status, visible_at, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    values
+                )
+        return cursor.rowcount == 1
+
+    def claim(self, topic: str, limit: int = 10) -> List[Job]:
+        """
+        Забирает доступные задания темы.
+
+        Задание становится невидимым для других потребителей на visibility_timeout
+        секунд. Неподтвержденные задания с истекшим таймаутом выдаются повторно.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, topic, key, payload, attempts FROM jobs "
+                    "WHERE topic = ? AND status IN (?, ?) AND visible_at <= ? "
+                    "ORDER BY id LIMIT ?",
+                    (topic, STATUS_READY, STATUS_CLAIMED, now, limit)
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, visible_at = ? WHERE id = ?",
+                    [(STATUS_CLAIMED, now + self.visibility_timeout, row[0]) for row in rows]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [
+            Job(id=row[0], topic=row[1], key=row[2], payload=json.loads(row[3]), attempts=row[4] + 1)
+            for row in rows
+        ]
+
+    def ack(self, job: Job) -> None:
+        """Подтверждает выполнение задания."""
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = ? WHERE id = ?", (STATUS_DONE, job.id))
+
+    def nack(self, job: Job, delay: float = 0.0) -> None:
+        """Возвращает задание в очередь с задержкой."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, visible_at = ? WHERE id = ?",
+                (STATUS_READY, time.time() + delay, job.id)
+            )
+
+    def fail(self, job: Job) -> None:
+        """Снимает задание с исчерпанными попытками, оставляя его для разбора."""
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = ? WHERE id = ?", (STATUS_FAILED, job.id))
+
+    def retry_failed(self, topic: str, key: Optional[str] = None) -> int:
+        """
+        Возвращает проваленные задания темы в очередь со сброшенным счетчиком попыток.
+
+        Args:
+            topic: Тема заданий
+            key: Вернуть только задание с этим ключом (None — все проваленные)
+
+        Returns:
+            int: Количество возвращенных заданий
+        """
+        query = "UPDATE jobs SET status = ?, attempts = 0, visible_at = ? WHERE topic = ? AND status = ?"
+        params: List[Any] = [STATUS_READY, time.time(), topic, STATUS_FAILED]
+        if key is not None:
+            query += " AND key = ?"
+            params.append(key)
+        with self._lock:
+            cursor = self._conn.execute(query, params)
+        return cursor.rowcount
+
+    def contains(self, topic: str, key: str) -> bool:
+        """Проверяет, есть ли задание с таким ключом."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM jobs WHERE topic = ? AND key = ?", (topic, key)
+            ).fetchone()
+        return row is not None
+
+    def purge_done(self, older_than: float) -> int:
+        """
+        Удаляет подтвержденные задания старше older_than секунд.
+
+        Returns:
+            int: Количество удаленных заданий
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status = ? AND created_at < ?",
+                (STATUS_DONE, time.time() - older_than)
+            )
+        return cursor.rowcount
+
+    def close(self) -> None:
+        """Закрывает соединение с базой."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,121 @@
+"""
+Кэш разобранных манифестов постов.
+
+Обработчики модерации много раз подряд читают одни и те же посты: текст, источник,
+список фото. Репозиторий держит манифесты последних постов в LRU-кэше и перед
+выдачей проверяет, не изменился ли post.json на диске (mtime, размер, inode),
+поэтому изменения юзербота подхватываются сразу. Собственные изменения бота
+проходят через save() и sync_photos() и сразу попадают в кэш.
+"""
+import os
+import copy
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from src.config.settings import settings
+from src.bot import post_manifest
+from src.bot.post_manifest import MANIFEST_FILE, PostManifest
+
+logger = logging.getLogger(__name__)
+
+# Отпечаток файла, по которому проверяется актуальность записи кэша
+Signature = Tuple[int, int, int]
+
+
+def _signature(post_dir: str) -> Optional[Signature]:
+    """
+    Отпечаток post.json (или папки, если манифеста еще нет).
+
+    Returns:
+        Optional[Signature]: (mtime_ns, размер, inode) или None, если папки нет
+    """
+    try:
+        st = os.stat(os.path.join(post_dir, MANIFEST_FILE))
+    except FileNotFoundError:
+        # Старая папка без манифеста: ориентируемся на саму папку
+        try:
+            st = os.stat(post_dir)
+        except FileNotFoundError:
+            return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+class PostRepository:
+    """LRU-кэш манифестов по пути к папке поста."""
+
+    def __init__(self, max_entries: int = 256):
+        """
+        Args:
+            max_entries: Сколько последних постов держать в памяти
+        """
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, Tuple[Signature, PostManifest]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, post_dir: str) -> Optional[PostManifest]:
+        """
+        Возвращает манифест поста.
+
+        Вызывающий получает собственную копию и может изменять ее перед save().
+
+        Args:
+            post_dir: Путь к папке поста
+
+        Returns:
+            Optional[PostManifest]: Манифест или None, если поста нет или он не готов
+        """
+        signature = _signature(post_dir)
+        if signature is None:
+            self._cache.pop(post_dir, None)
+            return None
+
+        cached = self._cache.get(post_dir)
+        if cached is not None and cached[0] == signature:
+            self._cache.move_to_end(post_dir)
+            self.hits += 1
+            return copy.deepcopy(cached[1])
+
+        self.misses += 1
+        manifest = post_manifest.load_manifest(post_dir)
+        if manifest is None:
+            self._cache.pop(post_dir, None)
+            return None
+        self._store(post_dir, signature, manifest)
+        return copy.deepcopy(manifest)
+
+    def save(self, post_dir: str, manifest: PostManifest) -> None:
+        """Сохраняет манифест на диск и в кэш."""
+        post_manifest.save_manifest(post_dir, manifest)
+        self._remember(post_dir, manifest)
+
+    def sync_photos(self, post_dir: str, manifest: PostManifest) -> None:
+        """Пересобирает список фото по файлам на диске, сохраняет манифест и обновляет кэш."""
+        post_manifest.sync_photos(post_dir, manifest)
+        self._remember(post_dir, manifest)
+
+    def invalidate(self, post_dir: str) -> None:
+        """Удаляет пост из кэша (например, после удаления папки)."""
+        self._cache.pop(post_dir, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика кэша: попадания, промахи и число записей."""
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._cache)}
+
+    def _remember(self, post_dir: str, manifest: PostManifest) -> None:
+        """Кладет в кэш только что сохраненный манифест."""
+        signature = _signature(post_dir)
+        if signature is None:
+            self._cache.pop(post_dir, None)
+            return
+        self._store(post_dir, signature, copy.deepcopy(manifest))
+
+    def _store(self, post_dir: str, signature: Signature, manifest: PostManifest) -> None:
+        self._cache[post_dir] = (signature, manifest)
+        self._cache.move_to_end(post_dir)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+
+post_repository = PostRepository(settings.POST_CACHE_SIZE)
@@ -0,0 +1,155 @@
+"""
+Фоновое предварительное форматирование текста постов через Sber GPT.
+"""
+import os
+import json
+import asyncio
+import logging
+from typing import List, Optional, Set, Tuple
+
+from src.config.settings import settings
+from src.utils.api import format_text_with_sber
+from src.utils.sber_cache import sber_cache
+from src.utils.token_tracker import token_tracker
+
+logger = logging.getLogger(__name__)
+
+# Файл с результатом предварительного форматирования в папке поста
+PREFORMAT_FILE = "sber.json"
+
+
+def save_preformatted(post_dir: str, source_text: str, formatted_text: str) -> None:
+    """
+    Сохраняет результат форматирования рядом с постом.
+
+    Args:
+        post_dir: Путь к папке поста
+        source_text: Текст, который отправлялся на форматирование
+        formatted_text: Отформатированный текст
+    """
+    path = os.path.join(post_dir, PREFORMAT_FILE)
+    temp_path = f"{path}.tmp"
+    data = {
+        'key': sber_cache.make_key(settings.FORMAT_PROMPT, settings.SBER_MODEL, source_text),
+        'text': formatted_text
+    }
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def load_preformatted(post_dir: str, source_text: str) -> Optional[str]:
+    """
+    Возвращает сохраненный результат форматирования, если он получен для этого же текста.
+
+    Args:
+        post_dir: Путь к папке поста
+        source_text: Текущий текст поста
+
+    Returns:
+        Optional[str]: Отформатированный текст или None
+    """
+    path = os.path.join(post_dir, PREFORMAT_FILE)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error(f"Ошибка при чтении {path}: {e}")
+        return None
+
+    key = sber_cache.make_key(settings.FORMAT_PROMPT, settings.SBER_MODEL, source_text)
+    if data.get('key') != key:
+        return None
+    return data.get('text')
+
+
+class SberPreformatter:
+    """
+    Очередь фонового форматирования с ограниченным пулом воркеров.
+
+    Посты ставятся в очередь после отправки модераторам, воркеры форматируют
+    их текст, пока в дневном лимите токенов остается запас для ручных запросов.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = settings.SBER_PREFORMAT_ENABLED,
+        workers: int = settings.SBER_PREFORMAT_WORKERS,
+        queue_size: int = settings.SBER_PREFORMAT_QUEUE_SIZE,
+        reserve_tokens: int = settings.SBER_PREFORMAT_RESERVE_TOKENS
+    ):
+        self.enabled = enabled
+        self.workers_count = max(1, workers)
+        self.reserve_tokens = reserve_tokens
+        self._queue: "asyncio.Queue[Tuple[str, str, str]]" = asyncio.Queue(maxsize=queue_size)
+        self._workers: List[asyncio.Task] = []
+        self._pending: Set[str] = set()
+
+    def start(self) -> None:
+        """Запускает воркеры. Вызывается из работающего event loop."""
+        if not self.enabled or self._workers:
+            return
+        for i in range(self.workers_count):
+            self._workers.append(asyncio.create_task(self._worker(i)))
+        logger.info(f"Фоновое форматирование запущено, воркеров: {self.workers_count}")
+
+    async def stop(self) -> None:
+        """Останавливает воркеры."""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, post_id: str, post_dir: str, text: str) -> bool:
+        """
+        Ставит пост в очередь на форматирование.
+
+        Returns:
+            bool: True если пост поставлен в очередь
+        """
+        if not self.enabled or not text or post_id in self._pending:
+            return False
+        try:
+            self._queue.put_nowait((post_id, post_dir, text))
+        except asyncio.QueueFull:
+            logger.warning(f"Очередь фонового форматирования заполнена, пост {post_id} пропущен")
+            return False
+        self._pending.add(post_id)
+        return True
+
+    def _has_budget(self) -> bool:
+        """Проверяет, что после запроса в дневном лимите останется запас."""
+        daily = token_tracker.get_usage_stats()['daily']
+        return daily['remaining'] - settings.SINGLE_REQUEST_LIMIT >= self.reserve_tokens
+
+    async def _worker(self, worker_id: int) -> None:
+        """Воркер фонового форматирования."""
+        while True:
+            post_id, post_dir, text = await self._queue.get()
+            try:
+                if not os.path.exists(post_dir):
+                    continue
+                if load_preformatted(post_dir, text) is not None:
+                    continue
+                if not self._has_budget():
+                    logger.info(f"[preformat-{worker_id}] Недостаточно дневного лимита токенов, пост {post_id} пропущен")
+                    continue
+
+                formatted_text, token_stats = await format_text_with_sber(
+                    text, settings.FORMAT_PROMPT, request_type='preformat'
+                )
+                if not formatted_text:
+                    logger.error(f"[preformat-{worker_id}] Не удалось отформатировать пост {post_id}")
+                    continue
+                if os.path.exists(post_dir):
+                    save_preformatted(post_dir, text, formatted_text)
+                    logger.info(f"[preformat-{worker_id}] Пост {post_id} отформатирован заранее, токенов: {token_stats.get('total_tokens', 0)}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[preformat-{worker_id}] Ошибка при форматировании поста {post_id}: {e}", exc_info=True)
+            finally:
+                self._pending.discard(post_id)
+                self._queue.task_done()
@@ -0,0 +1,75 @@
+"""
+Превью потокового ответа Sber GPT в группе модераторов.
+"""
+import time
+import logging
+from typing import Optional
+
+from telegram.error import RetryAfter, TelegramError
+
+from src.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class StreamPreview:
+    """
+    Служебное сообщение, которое периодически редактируется по мере получения
+    фрагментов ответа. Частота правок ограничена, чтобы не упираться в лимиты Telegram.
+    """
+
+    MAX_MESSAGE_LENGTH = 4096
+    HEADER = "⏳ Sber GPT форматирует текст...\n\n"
+
+    def __init__(self, bot, chat_id: int, interval: float = settings.SBER_STREAM_EDIT_INTERVAL):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.interval = interval
+        self.message_id: Optional[int] = None
+        self._last_text = ""
+        self._next_edit_at = 0.0
+
+    async def start(self) -> None:
+        """Отправляет служебное сообщение превью."""
+        try:
+            message = await self.bot.send_message(chat_id=self.chat_id, text=self.HEADER.strip())
+        except TelegramError as e:
+            # Без превью форматирование продолжается, update() ничего не делает
+            logger.warning(f"Превью: не удалось отправить сообщение: {e}")
+            return
+        self.message_id = message.message_id
+        self._next_edit_at = time.monotonic() + self.interval
+
+    async def update(self, text: str) -> None:
+        """Обновляет превью, если с прошлой правки прошло достаточно времени."""
+        if self.message_id is None or text == self._last_text:
+            return
+        now = time.monotonic()
+        if now < self._next_edit_at:
+            return
+
+        preview_text = (self.HEADER + text)[:self.MAX_MESSAGE_LENGTH]
+        self._next_edit_at = now + self.interval
+        try:
+            await self.bot.edit_message_text(
+                chat_id=self.chat_id,
+                message_id=self.message_id,
+                text=preview_text
+            )
+            self._last_text = text
+        except RetryAfter as e:
+            logger.warning(f"Превью: превышен лимит правок, пауза {e.retry_after} c")
+            self._next_edit_at = time.monotonic() + float(e.retry_after)
+        except TelegramError as e:
+            # Превью необязательно: ошибка правки не должна прерывать форматирование
+            logger.warning(f"Превью: не удалось обновить сообщение: {e}")
+
+    async def delete(self) -> None:
+        """Удаляет служебное сообщение превью."""
+        if self.message_id is None:
+            return
+        try:
+            await self.bot.delete_message(chat_id=self.chat_id, message_id=self.message_id)
+        except Exception as e:
+            logger.error(f"Ошибка при удалении превью {self.message_id}: {e}")
+        self.message_id = None
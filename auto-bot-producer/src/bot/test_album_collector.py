@@ -0,0 +1,99 @@
+"""
+Тесты для сборки альбомов.
+"""
+import asyncio
+import logging
+from album_collector import AlbumCollector, MAX_ALBUM_SIZE
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def test_settle():
+    """Тест завершения альбома после окна ожидания."""
+    collector = AlbumCollector(min_window=0.2, max_window=1.0)
+    albums = []
+
+    async def on_complete(items):
+        albums.append(list(items))
+
+    for i in range(3):
+        assert collector.add("user", "group_1", i, on_complete, key=f"photo_{i}")
+        await asyncio.sleep(0.05)
+    # Повтор части не добавляется
+    assert not collector.add("user", "group_1", 0, on_complete, key="photo_0")
+    assert albums == []
+
+    await asyncio.sleep(1.2)
+    assert albums == [[0, 1, 2]]
+    collector.close()
+
+
+async def test_separate_groups():
+    """Тест альбомов разных владельцев с одним media_group_id."""
+    collector = AlbumCollector(min_window=0.1, max_window=0.5)
+    albums = {}
+
+    def on_complete_for(owner):
+        async def on_complete(items):
+            albums[owner] = list(items)
+        return on_complete
+
+    collector.add("user_1", "group_1", "a", on_complete_for("user_1"))
+    collector.add("user_2", "group_1", "b", on_complete_for("user_2"))
+    await asyncio.sleep(0.7)
+    assert albums == {"user_1": ["a"], "user_2": ["b"]}
+    collector.close()
+
+
+async def test_complete_album():
+    """Тест альбома, который завершается без ожидания."""
+    collector = AlbumCollector(min_window=5.0, max_window=9.0)
+    albums = []
+
+    async def on_complete(items):
+        albums.append(list(items))
+
+    # Известное число частей
+    collector.add("user", "group_1", "a", on_complete, expected=2)
+    collector.add("user", "group_1", "b", on_complete)
+    await asyncio.sleep(0.05)
+    assert albums == [["a", "b"]]
+
+    # Максимум Telegram
+    for i in range(MAX_ALBUM_SIZE):
+        collector.add("user", "group_2", i, on_complete)
+    await asyncio.sleep(0.05)
+    assert albums[1] == list(range(MAX_ALBUM_SIZE))
+    collector.close()
+
+
+async def test_ttl_eviction():
+    """Тест удаления незавершенных альбомов по TTL."""
+    collector = AlbumCollector(min_window=5.0, max_window=9.0, ttl=0.1)
+    albums = []
+
+    async def on_complete(items):
+        albums.append(list(items))
+
+    collector.add("user", "group_1", "a", on_complete)
+    await asyncio.sleep(0.2)
+    # Новая часть запускает очистку: брошенная группа удаляется без вызова обработчика
+    collector.add("user", "group_2", "b", on_complete)
+    assert ("user", "group_1") not in collector._groups
+    assert ("user", "group_2") in collector._groups
+    await asyncio.sleep(0.1)
+    assert albums == []
+    collector.close()
+
+
+async def run_tests():
+    """Запуск всех тестов."""
+    await test_settle()
+    await test_separate_groups()
+    await test_complete_album()
+    await test_ttl_eviction()
+    print("Все тесты пройдены успешно!")
+
+if __name__ == "__main__":
+    asyncio.run(run_tests())
@@ -0,0 +1,84 @@
+"""
+Тесты для порядка и темпа отправки постов.
+"""
+import time
+import asyncio
+import logging
+from outbound import OrderSlots, RateLimiter
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def test_order_slots():
+    """Тест порядка отправки при завершении подготовки не по порядку."""
+    slots = OrderSlots()
+    sent = []
+
+    async def post(name: str, prepare: float):
+        slot = slots.reserve()
+        # Подготовка поста (загрузка, обработка текста) идет параллельно
+        await asyncio.sleep(prepare)
+        async with slot:
+            sent.append(name)
+
+    await asyncio.gather(post("a", 0.15), post("b", 0.0), post("c", 0.05), post("d", 0.1))
+    assert sent == ["a", "b", "c", "d"]
+
+
+async def test_released_slot():
+    """Тест слота, освобожденного без отправки (ошибка обработки поста)."""
+    slots = OrderSlots()
+    sent = []
+
+    async def post(name: str, prepare: float, fail: bool = False):
+        slot = slots.reserve()
+        try:
+            await asyncio.sleep(prepare)
+            if fail:
+                raise RuntimeError("ошибка обработки")
+            async with slot:
+                sent.append(name)
+        finally:
+            slot.release()
+
+    results = await asyncio.gather(
+        post("a", 0.1, fail=True), post("b", 0.0), post("c", 0.05),
+        return_exceptions=True
+    )
+    assert isinstance(results[0], RuntimeError)
+    # Следующие посты не ждут вечно слот поста с ошибкой
+    assert sent == ["b", "c"]
+
+
+async def test_rate_limiter():
+    """Тест ограничения темпа отправки."""
+    # Без ограничения acquire не ждет
+    unlimited = RateLimiter(0)
+    started = time.monotonic()
+    for _ in range(100):
+        await unlimited.acquire()
+    assert time.monotonic() - started < 0.1
+
+    limiter = RateLimiter(3)
+    started = time.monotonic()
+    for _ in range(3):
+        await limiter.acquire()
+    assert time.monotonic() - started < 0.1
+    # Четвертый запрос в ту же минуту ждет
+    try:
+        await asyncio.wait_for(limiter.acquire(), timeout=0.2)
+        assert False, "лимит не сработал"
+    except asyncio.TimeoutError:
+        pass
+
+
+async def run_tests():
+    """Запуск всех тестов."""
+    await test_order_slots()
+    await test_released_slot()
+    await test_rate_limiter()
+    print("Все тесты пройдены успешно!")
+
+if __name__ == "__main__":
+    asyncio.run(run_tests())
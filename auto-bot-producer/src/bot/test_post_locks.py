@@ -0,0 +1,91 @@
+"""
+Тесты для блокировок постов.
+"""
+import gc
+import asyncio
+import logging
+from post_locks import KeyedLocks, callback_post_id
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def test_serialization():
+    """Тест последовательного выполнения под одним ключом."""
+    locks = KeyedLocks()
+    events = []
+
+    async def worker(key: str, name: str):
+        async with locks.hold(key):
+            events.append(f"{name}:start")
+            await asyncio.sleep(0.05)
+            events.append(f"{name}:end")
+
+    await asyncio.gather(worker("post_1", "a"), worker("post_1", "b"), worker("post_1", "c"))
+    # Работа под одним ключом не перемешивается
+    assert events == ["a:start", "a:end", "b:start", "b:end", "c:start", "c:end"]
+    stats = locks.stats()
+    assert stats["acquired"] == 3
+    assert stats["contended"] == 2
+    assert stats["max_wait"] > 0
+
+
+async def test_parallel_keys():
+    """Тест параллельного выполнения под разными ключами."""
+    locks = KeyedLocks()
+    events = []
+
+    async def worker(key: str):
+        async with locks.hold(key):
+            events.append(f"{key}:start")
+            await asyncio.sleep(0.05)
+            events.append(f"{key}:end")
+
+    await asyncio.gather(worker("post_1"), worker("post_2"))
+    assert events[:2] == ["post_1:start", "post_2:start"]
+    assert locks.stats()["contended"] == 0
+
+
+async def test_release():
+    """Тест освобождения блокировки."""
+    locks = KeyedLocks()
+
+    # Исключение внутри блока освобождает блокировку
+    try:
+        async with locks.hold("post_1"):
+            raise RuntimeError("ошибка обработчика")
+    except RuntimeError:
+        pass
+    await asyncio.wait_for(_hold_once(locks, "post_1"), timeout=1.0)
+
+    # Блокировка, которую никто не держит и не ждет, удаляется из реестра
+    gc.collect()
+    assert locks.stats()["active"] == 0
+
+
+async def _hold_once(locks: KeyedLocks, key: str):
+    async with locks.hold(key):
+        pass
+
+
+def test_callback_post_id():
+    """Тест извлечения post_id из callback_data."""
+    assert callback_post_id("publish_post_post_1") == "post_1"
+    assert callback_post_id("edittext_post_1") == "post_1"
+    assert callback_post_id("edit_post_1") == "post_1"
+    assert callback_post_id("sbertext_post_1") == "post_1"
+    assert callback_post_id("removemedia_post_1") == "post_1"
+    assert callback_post_id("moderate_") is None
+    assert callback_post_id("unknown_post_1") is None
+
+
+async def run_tests():
+    """Запуск всех тестов."""
+    await test_serialization()
+    await test_parallel_keys()
+    await test_release()
+    test_callback_post_id()
+    print("Все тесты пройдены успешно!")
+
+if __name__ == "__main__":
+    asyncio.run(run_tests())
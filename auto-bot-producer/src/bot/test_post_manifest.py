@@ -0,0 +1,68 @@
+"""
+Тесты для манифеста поста.
+"""
+import os
+import asyncio
+import logging
+import tempfile
+from types import SimpleNamespace
+from post_manifest import PostManifest, load_manifest, save_manifest
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def make_message(file_id: str):
+    """Сообщение альбома с фото в нескольких размерах."""
+    return SimpleNamespace(photo=[SimpleNamespace(file_id=f"{file_id}_small"), SimpleNamespace(file_id=file_id)])
+
+
+def make_post(post_dir: str) -> None:
+    """Пост с двумя фото."""
+    photos = []
+    for i in (1, 2):
+        name = f"photo_{i}.jpg"
+        with open(os.path.join(post_dir, name), "wb") as f:
+            f.write(b"photo %d" % i)
+        photos.append({"file": name, "size": 7})
+    save_manifest(post_dir, PostManifest(post_id="post_1", text="Текст", text_close="Текст", photos=photos))
+
+
+def test_file_ids_survive_caption_save():
+    """Тест: file_id после отправки модераторам сохраняются вместе с подписями и статусом."""
+    with tempfile.TemporaryDirectory() as post_dir:
+        make_post(post_dir)
+
+        # Порядок как при отправке поста модераторам: загрузка, отправка, подписи, сохранение
+        manifest = load_manifest(post_dir)
+        assert manifest.remember_file_ids([make_message("id_1"), make_message("id_2")])
+        manifest.captions = {"moderation": "Текст", "public": "Текст", "private": "Текст"}
+        manifest.status = "sent"
+        save_manifest(post_dir, manifest)
+
+        saved = load_manifest(post_dir)
+        assert [photo.get("file_id") for photo in saved.photos] == ["id_1", "id_2"]
+        assert saved.status == "sent"
+        assert saved.captions["public"] == "Текст"
+        # Повторная отправка идет по file_id, без загрузки файлов
+        assert saved.photo_media(post_dir) == ["id_1", "id_2"]
+
+
+def test_file_ids_count_mismatch():
+    """Тест: при несовпадении числа сообщений и фото file_id не записываются."""
+    with tempfile.TemporaryDirectory() as post_dir:
+        make_post(post_dir)
+        manifest = load_manifest(post_dir)
+        assert not manifest.remember_file_ids([make_message("id_1")])
+        assert all("file_id" not in photo for photo in manifest.photos)
+        assert manifest.photo_media(post_dir) == manifest.photo_paths(post_dir)
+
+
+async def run_tests():
+    """Запуск всех тестов."""
+    test_file_ids_survive_caption_save()
+    test_file_ids_count_mismatch()
+    print("Все тесты пройдены успешно!")
+
+if __name__ == "__main__":
+    asyncio.run(run_tests())
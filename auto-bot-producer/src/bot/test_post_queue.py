@@ -0,0 +1,137 @@
+"""
+Тесты для очереди заданий на SQLite.
+"""
+import os
+import time
+import asyncio
+import logging
+import tempfile
+from post_queue import PostQueue, TOPIC_POSTS, TOPIC_ORIGINALS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def make_queue(tmp_dir: str, visibility_timeout: float = 300.0) -> PostQueue:
+    """Очередь во временной базе."""
+    return PostQueue(os.path.join(tmp_dir, "queue.db"), visibility_timeout)
+
+
+def test_claim():
+    """Тест выдачи заданий."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        queue = make_queue(tmp_dir)
+        assert queue.enqueue(TOPIC_POSTS, "post_1")
+        assert queue.enqueue(TOPIC_POSTS, "post_2")
+        # Повторная постановка ничего не делает
+        assert not queue.enqueue(TOPIC_POSTS, "post_1")
+        queue.enqueue(TOPIC_ORIGINALS, "post_1")
+
+        jobs = queue.claim(TOPIC_POSTS, limit=10)
+        assert [job.key for job in jobs] == ["post_1", "post_2"]
+        assert all(job.attempts == 1 for job in jobs)
+        # Выданные задания невидимы до истечения таймаута
+        assert queue.claim(TOPIC_POSTS) == []
+        # Другая тема не затрагивается
+        assert [job.key for job in queue.claim(TOPIC_ORIGINALS)] == ["post_1"]
+        queue.close()
+
+
+def test_ack():
+    """Тест подтверждения задания."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        queue = make_queue(tmp_dir, visibility_timeout=0.0)
+        queue.enqueue(TOPIC_POSTS, "post_1")
+        job = queue.claim(TOPIC_POSTS)[0]
+        queue.ack(job)
+        assert queue.claim(TOPIC_POSTS) == []
+        assert queue.contains(TOPIC_POSTS, "post_1")
+        assert not queue.enqueue(TOPIC_POSTS, "post_1")
+        # Выполненное задание можно перезапустить явно
+        assert queue.enqueue(TOPIC_POSTS, "post_1", reset=True)
+        assert queue.claim(TOPIC_POSTS)[0].attempts == 1
+        queue.close()
+
+
+def test_nack():
+    """Тест возврата задания в очередь."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        queue = make_queue(tmp_dir)
+        queue.enqueue(TOPIC_POSTS, "post_1")
+        job = queue.claim(TOPIC_POSTS)[0]
+        queue.nack(job, delay=0.2)
+        assert queue.claim(TOPIC_POSTS) == []
+        time.sleep(0.3)
+        jobs = queue.claim(TOPIC_POSTS)
+        assert [job.key for job in jobs] == ["post_1"]
+        assert jobs[0].attempts == 2
+        queue.close()
+
+
+def test_visibility_timeout():
+    """Тест повторной выдачи неподтвержденного задания."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        queue = make_queue(tmp_dir, visibility_timeout=0.2)
+        queue.enqueue(TOPIC_POSTS, "post_1")
+        assert len(queue.claim(TOPIC_POSTS)) == 1
+        assert queue.claim(TOPIC_POSTS) == []
+        time.sleep(0.3)
+        jobs = queue.claim(TOPIC_POSTS)
+        assert [job.key for job in jobs] == ["post_1"]
+        assert jobs[0].attempts == 2
+        queue.close()
+
+
+def test_fail():
+    """Тест проваленных заданий."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        queue = make_queue(tmp_dir)
+        queue.enqueue(TOPIC_POSTS, "post_1")
+        queue.enqueue(TOPIC_POSTS, "post_2")
+        for job in queue.claim(TOPIC_POSTS):
+            queue.fail(job)
+        assert queue.claim(TOPIC_POSTS) == []
+        assert not queue.enqueue(TOPIC_POSTS, "post_1")
+        # Проваленные задания не удаляются вместе с выполненными
+        assert queue.purge_done(older_than=0) == 0
+
+        assert queue.retry_failed(TOPIC_POSTS, "post_2") == 1
+        jobs = queue.claim(TOPIC_POSTS)
+        assert [job.key for job in jobs] == ["post_2"]
+        assert jobs[0].attempts == 1
+        assert queue.retry_failed(TOPIC_POSTS) == 1
+        assert [job.key for job in queue.claim(TOPIC_POSTS)] == ["post_1"]
+        queue.close()
+
+
+async def test_claim_in_thread():
+    """Тест работы с очередью из потоков asyncio.to_thread."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        queue = make_queue(tmp_dir)
+        for i in range(20):
+            queue.enqueue(TOPIC_POSTS, f"post_{i}")
+        batches = await asyncio.gather(*(
+            asyncio.to_thread(queue.claim, TOPIC_POSTS, 5) for _ in range(5)
+        ))
+        keys = [job.key for batch in batches for job in batch]
+        # Каждое задание выдано ровно один раз
+        assert sorted(keys) == sorted(f"post_{i}" for i in range(20))
+        await asyncio.gather(*(
+            asyncio.to_thread(queue.ack, job) for batch in batches for job in batch
+        ))
+        assert queue.claim(TOPIC_POSTS) == []
+        queue.close()
+
+
+async def run_tests():
+    """Запуск всех тестов."""
+    test_claim()
+    test_ack()
+    test_nack()
+    test_visibility_timeout()
+    test_fail()
+    await test_claim_in_thread()
+    print("Все тесты пройдены успешно!")
+
+if __name__ == "__main__":
+    asyncio.run(run_tests())
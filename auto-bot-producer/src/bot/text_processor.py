@@ -2,7 +2,7 @@
 Модуль для обработки текста с учетом лимитов Telegram.
 """
 import logging
-from typing import Optional, Tuple
+from typing import Dict, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -117,6 +117,24 @@ class TextProcessor:
         logger.info(f"[process_private_channel_text] Текст обрезан до {len(result_text)} символов")
         return result_text, True
     
+    async def render_captions(self, post_text: str, close_text: str, source_info: str) -> Dict[str, str]:
+        """
+        Асинхронно готовит все подписи поста, чтобы публикация не тратила время на обработку текста.
+        
+        Args:
+            post_text: Текст поста в том виде, в котором его видят модераторы
+            close_text: Текст для закрытого канала (text_close)
+            source_info: Информация об источнике в формате source.txt
+            
+        Returns:
+            Dict[str, str]: Подписи moderation, public и private
+        """
+        public_text, _ = await self.process_text(post_text, is_channel=True)
+        # В закрытый канал идут первые две строки источника (канал и дата)
+        source_text = '\n'.join(source_info.splitlines()[:2])
+        private_text, _ = await self.process_private_channel_text(close_text, source_text)
+        return {"moderation": post_text, "public": public_text, "private": private_text}
+
     async def get_original_text(self, text: str) -> str:
         """
         Асинхронно возвращает оригинальный текст, убирая маркер обрезки и подпись канала.
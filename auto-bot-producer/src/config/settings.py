@@ -30,7 +30,66 @@ class Settings(BaseSettings):
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "DEBUG")
     LOG_FORMAT: str = os.getenv("LOG_FORMAT", "%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s")
     LOG_DIR: str = os.getenv("LOG_DIR", "logs")
-    
+
+    # Доступ к Sber GPT
+    SBER_CLIENT_ID: str = os.getenv("SBER_CLIENT_ID", "")
+    SBER_CLIENT_SECRET: str = os.getenv("SBER_CLIENT_SECRET", "")
+    SBER_AUTH_URL: str = os.getenv("SBER_AUTH_URL", "https://ngw.devices.sberbank.ru:9443/api/v2/oauth")
+    SBER_API_URL: str = os.getenv("SBER_API_URL", "https://gigachat.devices.sberbank.ru/api/v1/chat/completions")
+
+    # Модель Sber GPT
+    SBER_MODEL: str = os.getenv("SBER_MODEL", "GigaChat:latest")
+
+    # Промпт для форматирования текста
+    FORMAT_PROMPT: str = os.getenv("FORMAT_PROMPT", (
+        "Ты автомобильный эксперт и хорошо знаешь марки и модели машин. "
+        "Возьми из текста необходимую информацию и преобразуй его в вид: "
+        "Марка машины, Модель, VIN-код, Пробег, Год, Цена. "
+        "Если нет нужных данных, то строго ставь прочерк (-). "
+        "Не добавляй от себя никакой информации и не меняй формат вывода."
+    ))
+
+    # Лимиты токенов
+    SINGLE_REQUEST_LIMIT: int = int(os.getenv("SINGLE_REQUEST_LIMIT", "1024"))
+    MAX_INPUT_TOKENS: int = int(os.getenv("MAX_INPUT_TOKENS", "1024"))
+    DAILY_TOKEN_LIMIT: int = int(os.getenv("DAILY_TOKEN_LIMIT", "100000"))
+    MONTHLY_TOKEN_LIMIT: int = int(os.getenv("MONTHLY_TOKEN_LIMIT", "1000000"))
+    WARNING_THRESHOLD: float = float(os.getenv("WARNING_THRESHOLD", "80"))
+    CRITICAL_THRESHOLD: float = float(os.getenv("CRITICAL_THRESHOLD", "95"))
+    TOKEN_STATS_FILE: str = os.getenv("TOKEN_STATS_FILE", "token_stats.json")
+
+    # Потоковое форматирование с обновлением превью у модераторов
+    SBER_STREAMING: bool = os.getenv("SBER_STREAMING", "false").lower() == "true"
+    SBER_STREAM_EDIT_INTERVAL: float = float(os.getenv("SBER_STREAM_EDIT_INTERVAL", "1.5"))
+
+    # Фоновое предварительное форматирование постов
+    SBER_PREFORMAT_ENABLED: bool = os.getenv("SBER_PREFORMAT_ENABLED", "false").lower() == "true"
+    SBER_PREFORMAT_WORKERS: int = int(os.getenv("SBER_PREFORMAT_WORKERS", "2"))
+    SBER_PREFORMAT_QUEUE_SIZE: int = int(os.getenv("SBER_PREFORMAT_QUEUE_SIZE", "100"))
+    # Запас дневного лимита, который фоновое форматирование не трогает
+    SBER_PREFORMAT_RESERVE_TOKENS: int = int(os.getenv("SBER_PREFORMAT_RESERVE_TOKENS", "20000"))
+
+    # Кэш результатов форматирования Sber GPT
+    SBER_CACHE_FILE: str = os.getenv("SBER_CACHE_FILE", "sber_cache.json")
+    SBER_CACHE_MAX_SIZE: int = int(os.getenv("SBER_CACHE_MAX_SIZE", "500"))
+
+    # Очередь постов от юзербота (по умолчанию в SAVE_DIR/.queue.db)
+    QUEUE_DB: str = os.getenv("QUEUE_DB", "")
+    QUEUE_POLL_INTERVAL: float = float(os.getenv("QUEUE_POLL_INTERVAL", "2"))
+    QUEUE_VISIBILITY_TIMEOUT: float = float(os.getenv("QUEUE_VISIBILITY_TIMEOUT", "300"))
+    # Как часто сверять папку с очередью на случай постов, поставленных мимо нее
+    QUEUE_RESCAN_INTERVAL: float = float(os.getenv("QUEUE_RESCAN_INTERVAL", "600"))
+    # Сколько последних дневных шардов SAVE_DIR просматривать при сверке
+    SHARD_SCAN_DAYS: int = int(os.getenv("SHARD_SCAN_DAYS", "3"))
+    # Сколько новых постов отправлять модераторам одновременно
+    FORWARD_CONCURRENCY: int = int(os.getenv("FORWARD_CONCURRENCY", "4"))
+    # Лимит запросов в группу модераторов в минуту при отправке новых постов (0 — без лимита)
+    FORWARD_RATE_PER_MINUTE: int = int(os.getenv("FORWARD_RATE_PER_MINUTE", "20"))
+    # Сколько манифестов последних постов держать в памяти
+    POST_CACHE_SIZE: int = int(os.getenv("POST_CACHE_SIZE", "256"))
+    # Сколько секунд ждать оригиналы фото от юзербота перед публикацией (0 — публиковать превью)
+    ORIGINALS_WAIT: float = float(os.getenv("ORIGINALS_WAIT", "20"))
+
     class Config:
         """Конфигурация настроек."""
         env_file = ".env"
@@ -2,11 +2,20 @@
 Модуль для работы с API Sber.
 """
 import os
+import json
 import logging
 import aiohttp
-from typing import Optional, Dict, Tuple
+from typing import Optional, Dict, Tuple, Callable, Awaitable
 
 from src.config.settings import settings
+from src.utils.sber_cache import sber_cache
+from src.utils.token_tracker import token_tracker
+from src.utils.token_estimator import (
+    compact_text,
+    estimate_request_tokens,
+    estimate_tokens,
+    trim_to_tokens
+)
 
 logger = logging.getLogger(__name__)
 
@@ -33,17 +42,98 @@ async def get_access_token() -> Optional[str]:
         logger.error(f"Ошибка при получении токена: {e}")
         return None
 
-async def format_text_with_sber(text: str, prompt: str) -> Tuple[Optional[str], Dict]:
+def _make_token_stats(usage: Dict, cached: bool = False) -> Dict:
+    """Формирует статистику токенов из поля usage ответа API."""
+    return {
+        'prompt_tokens': usage.get('prompt_tokens', 0),
+        'completion_tokens': usage.get('completion_tokens', 0),
+        'total_tokens': usage.get('total_tokens', 0),
+        'cached': cached
+    }
+
+def _prepare_request(compacted: str, prompt: str) -> Tuple[Optional[str], int]:
+    """
+    Обрезает сжатый текст и проверяет лимиты токенов до отправки запроса.
+    
+    Args:
+        compacted (str): Текст после compact_text
+        prompt (str): Промпт для форматирования
+        
+    Returns:
+        Tuple[Optional[str], int]: (Текст для отправки, пустая строка для пустого текста
+        или None, если запрос не укладывается в лимиты; допустимый max_tokens для ответа)
+    """
+    prompt_budget = settings.MAX_INPUT_TOKENS - estimate_request_tokens(prompt, '')
+    compacted, was_trimmed = trim_to_tokens(compacted, prompt_budget)
+    if was_trimmed:
+        logger.warning(f"Текст для Sber GPT обрезан до {prompt_budget} токенов")
+    if not compacted:
+        logger.error("Текст для Sber GPT пуст после сжатия")
+        return '', 0
+
+    request_tokens = estimate_request_tokens(prompt, compacted)
+    # Ответ при форматировании примерно равен по объему исходному тексту
+    expected_completion = min(estimate_tokens(compacted), settings.SINGLE_REQUEST_LIMIT)
+    stats = token_tracker.get_usage_stats()
+    remaining = min(stats['daily']['remaining'], stats['monthly']['remaining'])
+    if remaining < request_tokens + expected_completion:
+        logger.error(
+            f"Запрос к Sber GPT отклонен: нужно ~{request_tokens + expected_completion} токенов, "
+            f"осталось {remaining}"
+        )
+        return None, 0
+
+    max_tokens = min(settings.SINGLE_REQUEST_LIMIT, remaining - request_tokens)
+    logger.info(f"Оценка запроса к Sber GPT: {request_tokens} токенов, лимит ответа {max_tokens}")
+    return compacted, max_tokens
+
+def _make_request_data(text: str, prompt: str, max_tokens: int, stream: bool = False) -> Dict:
+    """Формирует тело запроса к Sber API."""
+    data = {
+        'model': settings.SBER_MODEL,
+        'messages': [
+            {'role': 'system', 'content': prompt},
+            {'role': 'user', 'content': text}
+        ],
+        'temperature': 0.7,
+        'max_tokens': max_tokens
+    }
+    if stream:
+        data['stream'] = True
+    return data
+
+def _get_cached_result(cache_key: str) -> Optional[Tuple[str, Dict]]:
+    """Возвращает результат из кэша: повторный текст не расходует токены."""
+    cached_text = sber_cache.get(cache_key)
+    if cached_text is None:
+        return None
+    logger.info(f"Результат форматирования найден в кэше: {sber_cache.get_stats()}")
+    return cached_text, _make_token_stats({}, cached=True)
+
+async def format_text_with_sber(text: str, prompt: str, request_type: str = 'format') -> Tuple[Optional[str], Dict]:
     """
     Отправляет текст на форматирование через Sber API.
     
     Args:
         text (str): Исходный текст для форматирования
         prompt (str): Промпт для форматирования
+        request_type (str): Тип запроса для статистики токенов
         
     Returns:
         Tuple[Optional[str], Dict]: (Отформатированный текст или None в случае ошибки, статистика токенов)
     """
+    # Сжимаем текст: ключ кэша не зависит от эмодзи, контактов и лишних пробелов
+    compacted = compact_text(text)
+    logger.info(f"Текст для Sber GPT сжат с {len(text)} до {len(compacted)} символов")
+    cache_key = sber_cache.make_key(prompt, settings.SBER_MODEL, compacted)
+    cached = _get_cached_result(cache_key)
+    if cached:
+        return cached
+
+    request_text, max_tokens = _prepare_request(compacted, prompt)
+    if not request_text:
+        return None, {'refused': request_text is None}
+
     try:
         # Получаем токен доступа
         access_token = await get_access_token()
@@ -57,15 +147,7 @@ async def format_text_with_sber(text: str, prompt: str) -> Tuple[Optional[str],
                 'Content-Type': 'application/json'
             }
             
-            data = {
-                'model': 'GigaChat:latest',
-                'messages': [
-                    {'role': 'system', 'content': prompt},
-                    {'role': 'user', 'content': text}
-                ],
-                'temperature': 0.7,
-                'max_tokens': settings.SINGLE_REQUEST_LIMIT
-            }
+            data = _make_request_data(request_text, prompt, max_tokens)
             
             async with session.post(settings.SBER_API_URL, headers=headers, json=data, ssl=False) as response:
                 if response.status == 200:
@@ -73,13 +155,10 @@ async def format_text_with_sber(text: str, prompt: str) -> Tuple[Optional[str],
                     formatted_text = result['choices'][0]['message']['content']
                     
                     # Получаем статистику токенов
-                    usage = result.get('usage', {})
-                    token_stats = {
-                        'prompt_tokens': usage.get('prompt_tokens', 0),
-                        'completion_tokens': usage.get('completion_tokens', 0),
-                        'total_tokens': usage.get('total_tokens', 0)
-                    }
-                    
+                    token_stats = _make_token_stats(result.get('usage', {}))
+
+                    token_tracker.add_usage(token_stats['total_tokens'], request_type)
+                    sber_cache.set(cache_key, formatted_text)
                     return formatted_text, token_stats
                 else:
                     error_text = await response.text()
@@ -88,4 +167,95 @@ async def format_text_with_sber(text: str, prompt: str) -> Tuple[Optional[str],
                     
     except Exception as e:
         logger.error(f"Ошибка при форматировании текста: {e}")
-        return None, {} 
\ No newline at end of file
+        return None, {}
+
+async def stream_format_text_with_sber(
+    text: str,
+    prompt: str,
+    on_update: Callable[[str], Awaitable[None]],
+    request_type: str = 'format'
+) -> Tuple[Optional[str], Dict]:
+    """
+    Форматирует текст через Sber API в потоковом режиме (SSE).
+    
+    По мере получения фрагментов вызывает on_update с накопленным текстом.
+    
+    Args:
+        text (str): Исходный текст для форматирования
+        prompt (str): Промпт для форматирования
+        on_update (Callable): Корутина, получающая накопленный текст
+        request_type (str): Тип запроса для статистики токенов
+        
+    Returns:
+        Tuple[Optional[str], Dict]: (Отформатированный текст или None в случае ошибки, статистика токенов)
+    """
+    # Сжимаем текст: ключ кэша не зависит от эмодзи, контактов и лишних пробелов
+    compacted = compact_text(text)
+    logger.info(f"Текст для Sber GPT сжат с {len(text)} до {len(compacted)} символов")
+    cache_key = sber_cache.make_key(prompt, settings.SBER_MODEL, compacted)
+    cached = _get_cached_result(cache_key)
+    if cached:
+        return cached
+
+    request_text, max_tokens = _prepare_request(compacted, prompt)
+    if not request_text:
+        return None, {'refused': request_text is None}
+
+    try:
+        access_token = await get_access_token()
+        if not access_token:
+            logger.error("Не удалось получить токен доступа")
+            return None, {}
+
+        async with aiohttp.ClientSession() as session:
+            headers = {
+                'Authorization': f'Bearer {access_token}',
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream'
+            }
+
+            data = _make_request_data(request_text, prompt, max_tokens, stream=True)
+
+            async with session.post(settings.SBER_API_URL, headers=headers, json=data, ssl=False) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.error(f"Ошибка API Sber: {response.status} - {error_text}")
+                    return None, {}
+
+                parts = []
+                usage = {}
+                # Разбираем SSE построчно: "data: {...}", завершение — "data: [DONE]"
+                async for raw_line in response.content:
+                    line = raw_line.decode('utf-8').strip()
+                    if not line.startswith('data:'):
+                        continue
+                    payload = line[len('data:'):].strip()
+                    if payload == '[DONE]':
+                        break
+                    try:
+                        chunk = json.loads(payload)
+                    except json.JSONDecodeError:
+                        logger.warning(f"Не удалось разобрать фрагмент SSE: {payload[:100]}")
+                        continue
+                    if chunk.get('usage'):
+                        usage = chunk['usage']
+                    for choice in chunk.get('choices', []):
+                        content = choice.get('delta', {}).get('content')
+                        if content:
+                            parts.append(content)
+                    if parts:
+                        await on_update(''.join(parts))
+
+                formatted_text = ''.join(parts)
+                if not formatted_text:
+                    logger.error("Sber API вернул пустой потоковый ответ")
+                    return None, {}
+
+                token_stats = _make_token_stats(usage)
+                token_tracker.add_usage(token_stats['total_tokens'], request_type)
+                sber_cache.set(cache_key, formatted_text)
+                return formatted_text, token_stats
+
+    except Exception as e:
+        logger.error(f"Ошибка при потоковом форматировании текста: {e}")
+        return None, {}
@@ -0,0 +1,93 @@
+"""
+Хранилище медиа по содержимому (общее с юзерботом).
+
+Каждый файл лежит один раз в SAVE_DIR/.media/<первые два символа хэша>/<sha256>.jpg,
+а в папки постов попадает жесткой ссылкой. Хэш считается во время загрузки.
+Файлы без ссылок удаляет сборщик мусора юзербота (RetentionService).
+"""
+import os
+import uuid
+import shutil
+import hashlib
+import logging
+from typing import Any, Dict
+
+from src.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+MEDIA_DIR = os.path.join(settings.SAVE_DIR, ".media")
+TMP_DIR = os.path.join(MEDIA_DIR, "tmp")
+
+
+class _HashingWriter:
+    """Файловый объект для загрузки: пишет в файл и одновременно считает SHA-256."""
+
+    def __init__(self, f):
+        self._f = f
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.digest.update(data)
+        self.size += len(data)
+        return self._f.write(data)
+
+    def flush(self) -> None:
+        self._f.flush()
+
+
+def path_for(sha256: str) -> str:
+    """Путь к файлу в хранилище по хэшу."""
+    return os.path.join(MEDIA_DIR, sha256[:2], f"{sha256}.jpg")
+
+
+def _commit(tmp_path: str, sha256: str) -> str:
+    """Переносит скачанный файл в хранилище или удаляет его, если такой уже есть."""
+    path = path_for(sha256)
+    if os.path.exists(path):
+        os.remove(tmp_path)
+        # Обновляем время, чтобы сборщик мусора не удалил файл до создания ссылки
+        os.utime(path)
+        logger.info(f"Медиа {sha256[:12]} уже есть в хранилище")
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def link_into(path: str, dest: str) -> None:
+    """Создает жесткую ссылку на файл хранилища (или копию, если ссылка невозможна)."""
+    if os.path.exists(dest):
+        os.remove(dest)
+    try:
+        os.link(path, dest)
+    except OSError:
+        shutil.copy2(path, dest)
+
+
+async def download_photo(photo: Any, dest_path: str) -> Dict[str, Any]:
+    """
+    Скачивает фото из Telegram в хранилище и связывает его с файлом назначения.
+
+    Args:
+        photo: PhotoSize (или другой объект с get_file())
+        dest_path: Путь к файлу в папке поста
+
+    Returns:
+        Dict[str, Any]: Описание фото (file, size, sha256)
+    """
+    os.makedirs(TMP_DIR, exist_ok=True)
+    tmp_path = os.path.join(TMP_DIR, uuid.uuid4().hex)
+    file = await photo.get_file()
+    try:
+        with open(tmp_path, "wb") as f:
+            writer = _HashingWriter(f)
+            await file.download_to_memory(out=writer)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    sha256 = writer.digest.hexdigest()
+    link_into(_commit(tmp_path, sha256), dest_path)
+    return {"file": os.path.basename(dest_path), "size": writer.size, "sha256": sha256}
@@ -0,0 +1,121 @@
+"""
+Кэш результатов форматирования текста через Sber GPT.
+"""
+import os
+import re
+import json
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from src.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SberCache:
+    """
+    Персистентный кэш ответов Sber GPT с вытеснением самых старых записей (LRU).
+
+    Ключ записи — хэш от промпта, модели и нормализованного текста, поэтому
+    одинаковые тексты (в том числе из кросс-постов разных каналов) форматируются
+    через API только один раз.
+    """
+
+    def __init__(self, cache_file: str, max_size: int = 500):
+        self.cache_file = cache_file
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._load_cache()
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """Нормализует текст: схлопывает пробелы внутри строк и убирает пустые строки по краям."""
+        lines = [re.sub(r'\s+', ' ', line).strip() for line in (text or '').splitlines()]
+        return '\n'.join(lines).strip()
+
+    @classmethod
+    def make_key(cls, prompt: str, model: str, text: str) -> str:
+        """
+        Формирует ключ кэша.
+
+        Args:
+            prompt: Системный промпт
+            model: Название модели
+            text: Исходный текст
+
+        Returns:
+            str: SHA-256 от промпта, модели и нормализованного текста
+        """
+        payload = json.dumps([prompt, model, cls.normalize_text(text)], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Возвращает закэшированный результат или None."""
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        """Сохраняет результат в кэш, вытесняя самые старые записи при превышении лимита."""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        self._save_cache()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Возвращает статистику попаданий в кэш."""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits / total) * 100 if total else 0.0
+        }
+
+    def _load_cache(self) -> None:
+        """Загрузка кэша из файла."""
+        try:
+            if os.path.exists(self.cache_file):
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                for key, value in data.get('entries', []):
+                    self._entries[key] = value
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                self.hits = data.get('hits', 0)
+                self.misses = data.get('misses', 0)
+                logger.info(f"Sber cache loaded from {self.cache_file}: {len(self._entries)} entries")
+        except Exception as e:
+            logger.error(f"Error loading Sber cache: {e}")
+            self._entries = OrderedDict()
+
+    def _save_cache(self) -> None:
+        """Атомарное сохранение кэша в файл."""
+        temp_path = f"{self.cache_file}.tmp"
+        try:
+            data = {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': list(self._entries.items())
+            }
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(temp_path, self.cache_file)
+        except Exception as e:
+            logger.error(f"Error saving Sber cache: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+# Создаем экземпляр кэша
+sber_cache = SberCache(settings.SBER_CACHE_FILE, settings.SBER_CACHE_MAX_SIZE)
@@ -0,0 +1,55 @@
+"""
+Тесты для модуля оценки токенов.
+"""
+import logging
+from token_estimator import compact_text, estimate_tokens, trim_to_tokens
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def test_compact_text():
+    """Тест сжатия текста."""
+    text = "🔥🔥 Продаю  BMW X5   🚗\n+7 (921) 123-45-67\n\n\n@seller_name\nЦена 3 500 000 руб\n2019"
+    compacted = compact_text(text)
+    
+    # Тест 1: Эмодзи и повторяющиеся пробелы удалены
+    assert compacted.splitlines()[0] == "Продаю BMW X5"
+    
+    # Тест 2: Строки только с контактами удалены, год сохранен
+    assert "921" not in compacted
+    assert "@seller_name" not in compacted
+    assert compacted.endswith("2019")
+    
+    # Тест 3: Не больше одной пустой строки подряд
+    assert "\n\n\n" not in compacted
+    
+    # Тест 4: Сжатие уменьшает оценку токенов
+    assert estimate_tokens(compacted) < estimate_tokens(text)
+
+def test_trim_to_tokens():
+    """Тест обрезки текста по количеству токенов."""
+    # Тест 1: Короткий текст не обрезается
+    text = "Короткий текст"
+    trimmed, was_trimmed = trim_to_tokens(text, 100)
+    assert not was_trimmed
+    assert trimmed == text
+    
+    # Тест 2: Длинный текст обрезается по строкам
+    long_text = "\n".join(["Строка с текстом объявления"] * 50)
+    trimmed, was_trimmed = trim_to_tokens(long_text, 40)
+    assert was_trimmed
+    assert estimate_tokens(trimmed) <= 40
+    
+    # Тест 3: Одна длинная строка обрезается по символам
+    trimmed, was_trimmed = trim_to_tokens("слово " * 100, 10)
+    assert was_trimmed
+    assert estimate_tokens(trimmed) <= 10
+
+def run_tests():
+    """Запуск всех тестов."""
+    test_compact_text()
+    test_trim_to_tokens()
+    print("Все тесты пройдены успешно!")
+
+if __name__ == "__main__":
+    run_tests()
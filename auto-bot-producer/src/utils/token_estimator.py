@@ -0,0 +1,139 @@
+"""
+Локальная оценка количества токенов и сжатие текста перед запросом к Sber GPT.
+"""
+import re
+import math
+from typing import Tuple
+
+# Служебные токены на каждое сообщение чата и на ответ модели
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_OVERHEAD_TOKENS = 3
+
+# Среднее число символов на токен: кириллица дробится мельче латиницы
+CYRILLIC_CHARS_PER_TOKEN = 3
+LATIN_CHARS_PER_TOKEN = 4
+DIGITS_PER_TOKEN = 3
+
+_piece_pattern = re.compile(r'[^\W\d_]+|\d+|[^\w\s]', re.UNICODE)
+_cyrillic_pattern = re.compile(r'[а-яА-ЯёЁ]')
+_emoji_run_pattern = re.compile(
+    '['
+    '\U0001F000-\U0001FAFF'  # пиктограммы, смайлы, транспорт, флаги
+    '\u2600-\u27BF'  # разные символы и дингбаты
+    '\u2B00-\u2BFF'  # стрелки и звезды
+    '\uFE0F\u200D\u20E3'  # вариационный селектор, ZWJ, keycap
+    ']+'
+)
+_spaces_pattern = re.compile(r'[ \t\u00a0]+')
+
+# Строки, которые clean_text_for_open в юзерботе удаляет целиком
+_year_pattern = re.compile(r'(?<!\d)(?:19|20)\d{2}(?!\d)')
+_contact_only_patterns = [
+    re.compile(r'[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+'),  # email
+    re.compile(r'@[a-zA-Z0-9_]{5,32}'),  # Telegram username
+    re.compile(r'(?:https?://|www\.)\S+', re.IGNORECASE),  # ссылки
+    re.compile(r'(?:t\.me|telegram\.me|wa\.me|vk\.com|instagram\.com)/\S+', re.IGNORECASE),
+]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Приблизительно оценивает количество токенов в тексте.
+
+    Оценка намеренно немного завышена, чтобы не выходить за лимиты.
+
+    Args:
+        text: Исходный текст
+
+    Returns:
+        int: Оценка количества токенов
+    """
+    if not text:
+        return 0
+    tokens = 0
+    for piece in _piece_pattern.findall(text):
+        if piece.isdigit():
+            tokens += math.ceil(len(piece) / DIGITS_PER_TOKEN)
+        elif piece.isalpha():
+            chars_per_token = CYRILLIC_CHARS_PER_TOKEN if _cyrillic_pattern.search(piece) else LATIN_CHARS_PER_TOKEN
+            tokens += math.ceil(len(piece) / chars_per_token)
+        else:
+            # Пунктуация и эмодзи
+            tokens += 1
+    return tokens
+
+
+def estimate_request_tokens(prompt: str, text: str) -> int:
+    """Оценивает количество токенов запроса из системного промпта и текста пользователя."""
+    return (
+        estimate_tokens(prompt)
+        + estimate_tokens(text)
+        + 2 * MESSAGE_OVERHEAD_TOKENS
+        + REPLY_OVERHEAD_TOKENS
+    )
+
+
+def _is_contact_only_line(line: str) -> bool:
+    """Проверяет, состоит ли строка только из контактов, которые удаляются при очистке."""
+    stripped = line.strip()
+    if not stripped:
+        return False
+    # Номер телефона без другого текста (но не год)
+    if all(c.isdigit() or c in ' -–—+()' for c in stripped) and not _year_pattern.fullmatch(stripped):
+        return True
+    rest = stripped
+    for pattern in _contact_only_patterns:
+        rest = pattern.sub('', rest)
+    return rest != stripped and not any(c.isalnum() for c in rest)
+
+
+def compact_text(text: str) -> str:
+    """
+    Сжимает текст перед отправкой в Sber GPT.
+
+    Удаляет строки, состоящие только из контактов и ссылок, эмодзи,
+    повторяющиеся пробелы и лишние пустые строки.
+
+    Args:
+        text: Исходный текст
+
+    Returns:
+        str: Сжатый текст
+    """
+    lines = []
+    for line in (text or '').splitlines():
+        if _is_contact_only_line(line):
+            continue
+        line = _emoji_run_pattern.sub(' ', line)
+        line = _spaces_pattern.sub(' ', line).strip()
+        # Не больше одной пустой строки подряд
+        if not line and (not lines or not lines[-1]):
+            continue
+        lines.append(line)
+    return '\n'.join(lines).strip()
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> Tuple[str, bool]:
+    """
+    Обрезает текст так, чтобы его оценка не превышала max_tokens.
+
+    Сначала отбрасываются последние строки целиком, затем обрезается последняя строка.
+
+    Returns:
+        Tuple[str, bool]: (Обрезанный текст, был ли текст обрезан)
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text, False
+    if max_tokens <= 0:
+        return '', True
+
+    lines = text.splitlines()
+    while len(lines) > 1 and estimate_tokens('\n'.join(lines)) > max_tokens:
+        lines.pop()
+    result = '\n'.join(lines)
+    if estimate_tokens(result) > max_tokens:
+        # Оценка не меньше одного токена на CYRILLIC_CHARS_PER_TOKEN символов
+        result = result[:max_tokens * CYRILLIC_CHARS_PER_TOKEN]
+        while result and estimate_tokens(result) > max_tokens:
+            result = result[:-CYRILLIC_CHARS_PER_TOKEN]
+    return result.rstrip(), True
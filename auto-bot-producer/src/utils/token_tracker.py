@@ -1,127 +1,278 @@
+"""
+Учет использования токенов Sber GPT.
+"""
+import os
 import json
+import asyncio
 import logging
+import threading
 from datetime import datetime, date, timedelta
-from typing import Dict, List
+from typing import Dict, List, Optional
 from pathlib import Path
 
-from config.settings import (
-    MONTHLY_TOKEN_LIMIT,
-    DAILY_TOKEN_LIMIT,
-    WARNING_THRESHOLD,
-    CRITICAL_THRESHOLD,
-    TOKEN_STATS_FILE
-)
+from src.config.settings import settings
+
+MONTHLY_TOKEN_LIMIT = settings.MONTHLY_TOKEN_LIMIT
+DAILY_TOKEN_LIMIT = settings.DAILY_TOKEN_LIMIT
+WARNING_THRESHOLD = settings.WARNING_THRESHOLD
+CRITICAL_THRESHOLD = settings.CRITICAL_THRESHOLD
+TOKEN_STATS_FILE = Path(settings.TOKEN_STATS_FILE)
+
+STATS_VERSION = 2
+HOURLY_SLOTS = 24 * 7  # почасовая статистика за неделю
+DAILY_SLOTS = 92  # посуточная статистика примерно за квартал
+SAVE_DELAY = 5.0  # задержка отложенного сохранения, секунд
+
 
 class TokenUsageTracker:
-    def __init__(self):
-        self.stats = self._load_stats()
-        self._check_monthly_reset()
-    
-    def _load_stats(self) -> Dict:
+    """
+    Трекер использования токенов на кольцевых буферах.
+
+    Почасовые и посуточные счетчики хранятся в буферах фиксированного размера,
+    поэтому учет запроса и выборка истории выполняются за константное время.
+    Сохранение в файл откладывается и выполняется атомарно вне event loop.
+    """
+
+    def __init__(self, stats_file: Path = TOKEN_STATS_FILE, save_delay: float = SAVE_DELAY):
+        self.stats_file = Path(stats_file)
+        self.save_delay = save_delay
+        self._lock = threading.Lock()
+        # Запись файла из пула потоков и flush() используют один временный файл
+        self._write_lock = threading.Lock()
+        self._save_handle: Optional[asyncio.TimerHandle] = None
+        # Слот: [номер часа/дня от эпохи, токены, запросы]
+        self._hourly: List[List[int]] = [[-1, 0, 0] for _ in range(HOURLY_SLOTS)]
+        # Слот: [номер дня, токены, запросы, {тип запроса: токены}]
+        self._daily: List[list] = [[-1, 0, 0, {}] for _ in range(DAILY_SLOTS)]
+        self._month = self._month_key(date.today())
+        self._monthly_tokens = 0
+        self._load_stats()
+
+    @staticmethod
+    def _month_key(day: date) -> str:
+        return day.strftime('%Y-%m')
+
+    @staticmethod
+    def _hour_index(moment: datetime) -> int:
+        return moment.toordinal() * 24 + moment.hour
+
+    def _hour_slot(self, hour_index: int) -> List[int]:
+        """Возвращает слот часа, обнуляя его, если в нем лежит устаревший час."""
+        slot = self._hourly[hour_index % HOURLY_SLOTS]
+        if slot[0] != hour_index:
+            slot[0], slot[1], slot[2] = hour_index, 0, 0
+        return slot
+
+    def _day_slot(self, day_index: int) -> list:
+        """Возвращает слот дня, обнуляя его, если в нем лежит устаревший день."""
+        slot = self._daily[day_index % DAILY_SLOTS]
+        if slot[0] != day_index:
+            slot[0], slot[1], slot[2], slot[3] = day_index, 0, 0, {}
+        return slot
+
+    def _check_monthly_reset(self, today: date) -> None:
+        """Сбрасывает месячный счетчик при смене месяца."""
+        month = self._month_key(today)
+        if month != self._month:
+            self._month = month
+            self._monthly_tokens = 0
+
+    def _record(self, moment: datetime, tokens: int, request_type: str) -> None:
+        """Добавляет запрос в почасовой и посуточный слоты."""
+        hour = self._hour_slot(self._hour_index(moment))
+        hour[1] += tokens
+        hour[2] += 1
+        day = self._day_slot(moment.toordinal())
+        day[1] += tokens
+        day[2] += 1
+        day[3][request_type] = day[3].get(request_type, 0) + tokens
+        if self._month_key(moment.date()) == self._month:
+            self._monthly_tokens += tokens
+
+    def _load_stats(self) -> None:
         """Загружает статистику использования токенов из файла."""
-        if TOKEN_STATS_FILE.exists():
-            try:
-                with open(TOKEN_STATS_FILE, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                logging.error(f"Ошибка при чтении файла статистики: {e}")
-        
-        return {
-            'monthly_tokens': 0,
-            'daily_tokens': 0,
-            'last_reset_date': date.today().isoformat(),
-            'monthly_reset_date': date.today().replace(day=1).isoformat(),
-            'usage_history': []
-        }
-    
-    def _save_stats(self) -> None:
-        """Сохраняет статистику использования токенов в файл."""
+        if not self.stats_file.exists():
+            return
+        try:
+            with open(self.stats_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            logging.error(f"Ошибка при чтении файла статистики: {e}")
+            return
+
+        if data.get('version') == STATS_VERSION:
+            self._month = data.get('month', self._month)
+            self._monthly_tokens = data.get('monthly_tokens', 0)
+            for slot in data.get('hourly', []):
+                if len(slot) == 3:
+                    self._hourly[slot[0] % HOURLY_SLOTS] = list(slot)
+            for slot in data.get('daily', []):
+                if len(slot) == 4:
+                    self._daily[slot[0] % DAILY_SLOTS] = [slot[0], slot[1], slot[2], dict(slot[3])]
+        else:
+            # Старый формат: счетчики и список последних запросов
+            self._month = self._month_key(date.fromisoformat(
+                data.get('monthly_reset_date', date.today().replace(day=1).isoformat())
+            ))
+            for entry in data.get('usage_history', []):
+                try:
+                    moment = datetime.fromisoformat(entry['timestamp'])
+                except (KeyError, ValueError):
+                    continue
+                self._record(moment, entry.get('tokens', 0), entry.get('type', 'unknown'))
+            # История обрезана до 1000 записей, месячный счетчик точнее
+            self._monthly_tokens = data.get('monthly_tokens', self._monthly_tokens)
+        self._check_monthly_reset(date.today())
+
+    def _snapshot(self) -> Dict:
+        """Копия состояния для сохранения."""
+        with self._lock:
+            return {
+                'version': STATS_VERSION,
+                'month': self._month,
+                'monthly_tokens': self._monthly_tokens,
+                'hourly': [list(slot) for slot in self._hourly if slot[0] >= 0],
+                'daily': [[s[0], s[1], s[2], dict(s[3])] for s in self._daily if s[0] >= 0]
+            }
+
+    def _write_snapshot(self, snapshot: Dict) -> None:
+        """Атомарно записывает состояние в файл."""
+        temp_path = f"{self.stats_file}.tmp"
         try:
-            with open(TOKEN_STATS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.stats, f, indent=2)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f)
+            os.replace(temp_path, self.stats_file)
         except Exception as e:
             logging.error(f"Ошибка при сохранении файла статистики: {e}")
-    
-    def _check_monthly_reset(self) -> None:
-        """Проверяет и сбрасывает месячный счетчик при необходимости."""
-        today = date.today()
-        monthly_reset = date.fromisoformat(self.stats['monthly_reset_date'])
-        
-        if today.month != monthly_reset.month or today.year != monthly_reset.year:
-            self.stats['monthly_tokens'] = 0
-            self.stats['monthly_reset_date'] = today.replace(day=1).isoformat()
-            self._save_stats()
-    
-    def _check_daily_reset(self) -> None:
-        """Проверяет и сбрасывает дневной счетчик при необходимости."""
-        today = date.today()
-        last_reset = date.fromisoformat(self.stats['last_reset_date'])
-        
-        if today != last_reset:
-            self.stats['daily_tokens'] = 0
-            self.stats['last_reset_date'] = today.isoformat()
-            self._save_stats()
-    
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _save(self) -> None:
+        """
+        Сохраняет текущее состояние.
+
+        Записи выполняются по одной, а снимок берется уже под блокировкой записи,
+        поэтому более старый снимок не может перезаписать более новый.
+        """
+        with self._write_lock:
+            self._write_snapshot(self._snapshot())
+
+    def _schedule_save(self) -> None:
+        """Откладывает сохранение, объединяя частые изменения в одну запись."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Нет event loop: сохраняем сразу
+            self._save()
+            return
+        if self._save_handle is None:
+            self._save_handle = loop.call_later(self.save_delay, self._save_in_background, loop)
+
+    def _save_in_background(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Сохраняет состояние в пуле потоков, не блокируя event loop."""
+        self._save_handle = None
+        loop.run_in_executor(None, self._save)
+
+    def flush(self) -> None:
+        """Немедленно сохраняет состояние (например, при остановке бота)."""
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        self._save()
+
     def add_usage(self, tokens: int, request_type: str) -> None:
         """Добавляет информацию об использовании токенов."""
-        self._check_daily_reset()
-        
-        # Обновляем счетчики
-        self.stats['monthly_tokens'] += tokens
-        self.stats['daily_tokens'] += tokens
-        
-        # Добавляем запись в историю
-        self.stats['usage_history'].append({
-            'timestamp': datetime.now().isoformat(),
-            'tokens': tokens,
-            'type': request_type
-        })
-        
-        # Ограничиваем историю последними 1000 записей
-        if len(self.stats['usage_history']) > 1000:
-            self.stats['usage_history'] = self.stats['usage_history'][-1000:]
-        
-        self._save_stats()
+        now = datetime.now()
+        with self._lock:
+            self._check_monthly_reset(now.date())
+            self._record(now, tokens, request_type)
+        self._schedule_save()
         self._check_limits()
-    
+
+    def _daily_tokens(self) -> int:
+        """Токены за сегодня."""
+        today = date.today().toordinal()
+        slot = self._daily[today % DAILY_SLOTS]
+        return slot[1] if slot[0] == today else 0
+
     def _check_limits(self) -> None:
         """Проверяет лимиты и выводит предупреждения."""
-        monthly_percent = (self.stats['monthly_tokens'] / MONTHLY_TOKEN_LIMIT) * 100
-        daily_percent = (self.stats['daily_tokens'] / DAILY_TOKEN_LIMIT) * 100
-        
+        monthly_percent = (self._monthly_tokens / MONTHLY_TOKEN_LIMIT) * 100
+        daily_percent = (self._daily_tokens() / DAILY_TOKEN_LIMIT) * 100
+
         # Проверка месячного лимита
         if monthly_percent >= CRITICAL_THRESHOLD:
             logging.warning(f"⚠️ КРИТИЧЕСКОЕ ПРЕДУПРЕЖДЕНИЕ: Достигнут {monthly_percent:.1f}% месячного лимита токенов!")
         elif monthly_percent >= WARNING_THRESHOLD:
             logging.warning(f"⚠️ Предупреждение: Достигнут {monthly_percent:.1f}% месячного лимита токенов")
-        
+
         # Проверка дневного лимита
         if daily_percent >= CRITICAL_THRESHOLD:
             logging.warning(f"⚠️ КРИТИЧЕСКОЕ ПРЕДУПРЕЖДЕНИЕ: Достигнут {daily_percent:.1f}% дневного лимита токенов!")
         elif daily_percent >= WARNING_THRESHOLD:
             logging.warning(f"⚠️ Предупреждение: Достигнут {daily_percent:.1f}% дневного лимита токенов")
-    
+
     def get_usage_stats(self) -> Dict:
         """Возвращает текущую статистику использования токенов."""
+        with self._lock:
+            self._check_monthly_reset(date.today())
+            monthly_tokens = self._monthly_tokens
+        daily_tokens = self._daily_tokens()
         return {
             'monthly': {
-                'used': self.stats['monthly_tokens'],
+                'used': monthly_tokens,
                 'limit': MONTHLY_TOKEN_LIMIT,
-                'remaining': MONTHLY_TOKEN_LIMIT - self.stats['monthly_tokens'],
-                'percent': (self.stats['monthly_tokens'] / MONTHLY_TOKEN_LIMIT) * 100
+                'remaining': MONTHLY_TOKEN_LIMIT - monthly_tokens,
+                'percent': (monthly_tokens / MONTHLY_TOKEN_LIMIT) * 100
             },
             'daily': {
-                'used': self.stats['daily_tokens'],
+                'used': daily_tokens,
                 'limit': DAILY_TOKEN_LIMIT,
-                'remaining': DAILY_TOKEN_LIMIT - self.stats['daily_tokens'],
-                'percent': (self.stats['daily_tokens'] / DAILY_TOKEN_LIMIT) * 100
+                'remaining': DAILY_TOKEN_LIMIT - daily_tokens,
+                'percent': (daily_tokens / DAILY_TOKEN_LIMIT) * 100
             }
         }
-    
+
     def get_usage_history(self, days: int = 7) -> List[Dict]:
-        """Возвращает историю использования токенов за последние N дней."""
-        cutoff_date = datetime.now() - timedelta(days=days)
-        return [
-            entry for entry in self.stats['usage_history']
-            if datetime.fromisoformat(entry['timestamp']) > cutoff_date
-        ] 
\ No newline at end of file
+        """
+        Возвращает посуточную историю использования токенов за последние N дней.
+
+        Args:
+            days: Количество дней (не больше размера буфера)
+
+        Returns:
+            List[Dict]: Записи с датой, количеством токенов, запросов и разбивкой по типам
+        """
+        today = date.today().toordinal()
+        history = []
+        for day_index in range(today - min(days, DAILY_SLOTS) + 1, today + 1):
+            slot = self._daily[day_index % DAILY_SLOTS]
+            if slot[0] != day_index or not slot[2]:
+                continue
+            history.append({
+                'date': date.fromordinal(day_index).isoformat(),
+                'tokens': slot[1],
+                'requests': slot[2],
+                'by_type': dict(slot[3])
+            })
+        return history
+
+    def get_hourly_usage(self, hours: int = 24) -> List[Dict]:
+        """Возвращает почасовую историю использования токенов за последние N часов."""
+        current = self._hour_index(datetime.now())
+        history = []
+        for hour_index in range(current - min(hours, HOURLY_SLOTS) + 1, current + 1):
+            slot = self._hourly[hour_index % HOURLY_SLOTS]
+            if slot[0] != hour_index or not slot[2]:
+                continue
+            moment = datetime.combine(date.fromordinal(hour_index // 24), datetime.min.time())
+            history.append({
+                'timestamp': (moment + timedelta(hours=hour_index % 24)).isoformat(),
+                'tokens': slot[1],
+                'requests': slot[2]
+            })
+        return history
+
+
+# Создаем экземпляр трекера
+token_tracker = TokenUsageTracker()
@@ -11,7 +11,19 @@ from telethon.tl.types import InputPeerEmpty, Dialog, Channel
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from helpers import clean_text_for_open
-from telethon.errors import RPCError
+from manifest import build_manifest, write_manifest
+from media_store import MediaStore
+from download_manager import DownloadManager
+from image_pipeline import ImageNormalizer
+from post_queue import PostQueue, TOPIC_POSTS
+from originals import OriginalsFetcher
+from layout import new_post_id, sharded_post_dir
+from retention import RetentionService
+from routing import RoutingTable, ChannelDirectory
+from sharding import ShardManager
+from watermarks import HighWaterMarks
+from state import BotState
+from telethon.errors import RPCError, FloodWaitError
 import time
 import shutil
 import json
@@ -20,30 +32,120 @@ import uuid
 
 load_dotenv()
 
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('bot.log', encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+
 API_ID = int(os.getenv('API_ID', '26521480'))
 API_HASH = os.getenv('API_HASH', '858b8e9363acd79e1122748c621c08e1')
 SESSION = os.getenv('SESSION', 'anon')
+# Несколько аккаунтов через запятую: каналы распределяются между ними
+SESSIONS = [name.strip() for name in os.getenv('SESSIONS', SESSION).split(',') if name.strip()]
+# FloodWait дольше этого порога не пережидается внутри запроса, а переводит каналы на другие сессии
+FLOOD_SLEEP_THRESHOLD = int(os.getenv('FLOOD_SLEEP_THRESHOLD', '10'))
 SAVED_DIR = os.getenv('SAVE_DIR', os.path.join(os.getcwd(), 'saved'))
 
+# Посты собираются в скрытой папке на той же файловой системе и публикуются
+# в SAVED_DIR одним переименованием, поэтому продюсер не видит недособранных папок
+STAGING_DIR = os.path.join(SAVED_DIR, '.staging')
+
 if not os.path.exists(SAVED_DIR):
     os.makedirs(SAVED_DIR)
+os.makedirs(STAGING_DIR, exist_ok=True)
+
+# Очередь, через которую продюсер узнает о новых постах
+QUEUE_DB = os.getenv('QUEUE_DB', os.path.join(SAVED_DIR, '.queue.db'))
+post_queue = PostQueue(QUEUE_DB)
+
+# Хранилище медиа по хэшу содержимого, фото в постах — жесткие ссылки на него
+# Загрузки всех сессий идут через общий бюджет: параллельные части для крупных файлов,
+# ограничение одновременных запросов и скорости
+downloader = DownloadManager(
+    max_parallel_parts=int(os.getenv('DOWNLOAD_MAX_PARALLEL', '8')),
+    parts_per_file=int(os.getenv('DOWNLOAD_PARTS_PER_FILE', '4')),
+    parallel_threshold=int(float(os.getenv('DOWNLOAD_PARALLEL_THRESHOLD_MB', '2')) * 1024 ** 2),
+    bandwidth=int(float(os.getenv('DOWNLOAD_BANDWIDTH_MB', '0')) * 1024 ** 2),
+    retries=int(os.getenv('DOWNLOAD_RETRIES', '3'))
+)
+media_store = MediaStore(os.path.join(SAVED_DIR, '.media'), downloader=downloader)
+
+# Нормализация фото (ориентация, EXIF, размер) в пуле процессов перед сохранением в пост
+image_normalizer = ImageNormalizer(
+    media_store,
+    max_side=int(os.getenv('IMAGE_MAX_SIDE', '2560')),
+    max_bytes=int(float(os.getenv('IMAGE_MAX_MB', '1')) * 1024 ** 2),
+    workers=int(os.getenv('IMAGE_WORKERS', '2'))
+)
 
-client = TelegramClient(
-    SESSION, API_ID, API_HASH,
-    device_model='MacBook Pro',
-    system_version='macOS 12.6',
-    app_version='Telegram Desktop 4.15',
-    lang_code='ru',
-    system_lang_code='ru-RU'
+# Размер фото при сохранении: original — оригинал, preview — уменьшенная копия
+# для модерации, оригинал догружается только при публикации
+PHOTO_SIZE_TIER = os.getenv('PHOTO_SIZE_TIER', 'original')
+PHOTO_PREVIEW_SIDE = int(os.getenv('PHOTO_PREVIEW_SIDE', '1280'))
+photo_max_side = PHOTO_PREVIEW_SIDE if PHOTO_SIZE_TIER == 'preview' else None
+
+# Очистка старых постов по возрасту и суммарному размеру
+retention = RetentionService(
+    SAVED_DIR,
+    media_store=media_store,
+    max_age_days=int(os.getenv('RETENTION_MAX_AGE_DAYS', '30')),
+    max_bytes=int(float(os.getenv('RETENTION_MAX_GB', '5')) * 1024 ** 3),
+    interval=int(os.getenv('RETENTION_INTERVAL', '600')),
+    batch_size=int(os.getenv('RETENTION_BATCH_SIZE', '20')),
+    # Блокировки модерации продюсера: заблокированные посты не удаляются
+    moderation_block_file=os.getenv('MODERATION_BLOCK_FILE')
 )
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
+def create_client(session):
+    """
+    Создает клиент Telethon для сессии.
+    Args:
+        session (str): Имя файла сессии
+    Returns:
+        TelegramClient: Клиент
+    """
+    return TelegramClient(
+        session, API_ID, API_HASH,
+        device_model='MacBook Pro',
+        system_version='macOS 12.6',
+        app_version='Telegram Desktop 4.15',
+        lang_code='ru',
+        system_lang_code='ru-RU',
+        flood_sleep_threshold=FLOOD_SLEEP_THRESHOLD
+    )
+
+# Клиенты всех сессий и обратное соответствие клиент -> имя сессии
+clients = {name: create_client(name) for name in SESSIONS}
+client_names = {client: name for name, client in clients.items()}
+
+# Какие каналы обрабатывать и с какими настройками
+routing = RoutingTable(os.getenv('CHANNELS_CONFIG', os.path.join(os.getcwd(), 'channels.json')))
+# Названия и username каналов, чтобы не запрашивать их на каждое сообщение
+channel_directory = ChannelDirectory(
+    clients,
+    routing=routing,
+    refresh_interval=int(os.getenv('CHANNELS_REFRESH_INTERVAL', '1800'))
+)
+# Распределение каналов между сессиями (консистентное хэширование)
+shards = ShardManager(SESSIONS, membership=channel_directory.members)
+
+
+def client_for(chat_id):
+    """Клиент сессии, которая сейчас обрабатывает канал (или None)"""
+    owner = shards.owner(chat_id)
+    return clients[owner] if owner else None
+
+# Догрузка оригиналов фото по запросу продюсера перед публикацией
+originals_fetcher = OriginalsFetcher(
+    post_queue,
+    SAVED_DIR,
+    image_normalizer,
+    client_for,
+    max_attempts=int(os.getenv('ORIGINALS_MAX_ATTEMPTS', '3'))
 )
 
 class LimitedSet:
@@ -124,297 +226,528 @@ processed_documents = LimitedSet(
     cache_file=os.path.join(CACHE_DIR, 'processed_documents.json')
 )
 
-def maintain_saved_limit():
-    """Поддерживает лимит сохраненных постов"""
-    folder = SAVED_DIR
-    max_posts = 100  # Максимальное количество постов
-    posts = []
-    
-    # Собираем все посты
-    for root, dirs, files in os.walk(folder, topdown=False):
-        for dir_name in dirs:
-            if dir_name.startswith('post_'):
-                post_path = os.path.join(root, dir_name)
-                posts.append((post_path, os.path.getctime(post_path)))
-    
-    # Сортируем по дате создания (старые первые)
-    posts.sort(key=lambda x: x[1])
-    
-    # Удаляем лишние посты
-    while len(posts) > max_posts:
-        post_path, _ = posts.pop(0)
+# Состояние бота (остановка, попытки переподключения сессий)
+bot_state = BotState()
+# Сохранения и догрузки, которые нужно дождаться при остановке
+active_tasks = set()
+# Сколько секунд ждать их завершения
+DRAIN_TIMEOUT = int(os.getenv('DRAIN_TIMEOUT', '60'))
+
+# Последнее обработанное сообщение по каналам для догрузки после переподключения
+high_water_marks = HighWaterMarks(os.path.join(CACHE_DIR, 'high_water_marks.json'))
+# Сколько каналов догружать одновременно и сколько сообщений запрашивать за один проход
+BACKFILL_CONCURRENCY = int(os.getenv('BACKFILL_CONCURRENCY', '3'))
+BACKFILL_PAGE_SIZE = int(os.getenv('BACKFILL_PAGE_SIZE', '500'))
+# Каналы, которые сейчас догружаются -> максимальный ID, пришедший за это время в обработчик
+backfill_live_ids = {}
+# Канал -> ID первого сообщения, которое не удалось сохранить.
+# Отметка канала не сдвигается дальше него, и следующая догрузка повторит его
+unsaved_ids = {}
+
+def advance_mark(chat_id, message_id, save=True):
+    """
+    Сдвигает отметку канала, но не дальше первого несохраненного сообщения.
+    Args:
+        chat_id (int): ID канала
+        message_id (int): ID обработанного сообщения
+        save (bool): Сразу записать файл
+    """
+    unsaved = unsaved_ids.get(chat_id)
+    if unsaved is not None:
+        message_id = min(message_id, unsaved - 1)
+    high_water_marks.update(chat_id, message_id, save=save)
+
+def remember_unsaved(chat_id, message_id):
+    """Запоминает сообщение, которое не удалось сохранить"""
+    unsaved_ids[chat_id] = min(unsaved_ids.get(chat_id, message_id), message_id)
+
+def cleanup_staging():
+    """Удаляет папки, оставшиеся в STAGING_DIR после аварийного завершения."""
+    for name in os.listdir(STAGING_DIR):
+        path = os.path.join(STAGING_DIR, name)
         try:
-            shutil.rmtree(post_path)
-            logging.info(f"Удален старый пост: {post_path}")
+            shutil.rmtree(path)
+            logging.info(f"🧹 Удалена недособранная папка {path}")
         except Exception as e:
-            logging.error(f"Ошибка при удалении поста {post_path}: {e}")
+            logging.error(f"Ошибка при удалении {path}: {e}")
 
-def save_text_and_source(post_dir, text, source_name, log_prefix=""):
+def commit_post_folder(staging_folder, post_id):
+    """
+    Публикует собранную папку поста в шард SAVED_DIR/YYYY/MM/DD одним переименованием.
+    Args:
+        staging_folder (str): Путь к папке в STAGING_DIR
+        post_id (str): ID поста (имя папки)
+    Returns:
+        str: Путь к опубликованной папке
+    """
+    post_folder = sharded_post_dir(SAVED_DIR, post_id)
+    if os.path.exists(post_folder):
+        raise FileExistsError(f"Папка {post_folder} уже существует")
+    os.makedirs(os.path.dirname(post_folder), exist_ok=True)
+    os.rename(staging_folder, post_folder)
+    return post_folder
+
+def discard_post_folder(post_folder):
     """
-    Сохраняет текст поста и источник (название канала) в соответствующие файлы в папке поста.
+    Удаляет недособранную папку поста.
     Args:
-        post_dir (str): Путь к папке поста
-        text (str): Текст поста
-        source_name (str): Название источника (канала)
-        log_prefix (str): Префикс для логирования
+        post_folder (str): Путь к папке поста
     """
-    if text:
-        with open(os.path.join(post_dir, 'text_close.txt'), 'w', encoding='utf-8') as f:
-            f.write(text.strip())
-        with open(os.path.join(post_dir, 'source.txt'), 'w', encoding='utf-8') as f:
-            f.write(source_name)
-        logging.info(f"{log_prefix}Сохранил текст: {text}")
+    if post_folder and os.path.exists(post_folder):
+        shutil.rmtree(post_folder)
+
+
+# Ключи постов, которые сейчас сохраняются -> Future с результатом сохранения:
+# повторные события (например, остальные части альбома) ждут результата первого
+in_flight = {}
+# Альбомы без текста (только в памяти): остальные части альбома пропускаются без запросов к API
+skipped_albums = LimitedSet(max_size=500)
+
+def is_image_document(media):
+    """Проверяет, что медиа — документ с картинкой"""
+    document = getattr(media, 'document', None)
+    return document is not None and (getattr(document, 'mime_type', None) or '').startswith('image/')
 
-def save_ready_flag(post_dir):
+def classify_message(message, options):
     """
-    Создаёт файл-флаг ready.txt, сигнализирующий о готовности поста к дальнейшей обработке.
+    Решает, нужно ли сохранять сообщение, только по его метаданным:
+    без загрузки медиа и без записи на диск.
     Args:
-        post_dir (str): Путь к папке поста
+        message: Сообщение из канала
+        options (dict): Настройки канала из таблицы маршрутизации
+    Returns:
+        tuple: (тип поста: 'album', 'photo', 'photo_document' или None; причина пропуска)
+    """
+    if message.grouped_id:
+        if 'album' not in options['kinds']:
+            return None, 'альбома (отключено для канала)'
+        # Текст альбома может быть в любом его сообщении, он проверяется после получения альбома
+        return 'album', None
+    if isinstance(message.media, MessageMediaPhoto):
+        kind = 'photo'
+    elif is_image_document(message.media):
+        kind = 'photo_document'
+    elif message.media and hasattr(message.media, 'document'):
+        return None, 'не фото документа'
+    else:
+        return None, 'поста без фото'
+    if kind not in options['kinds']:
+        return None, 'фото (отключено для канала)' if kind == 'photo' else 'фото-документа (отключено для канала)'
+    if not message.text:
+        return None, 'фото без текста' if kind == 'photo' else 'фото-документа без текста'
+    if len(message.text) < options['min_text_length']:
+        return None, 'поста с коротким текстом'
+    return kind, None
+
+def channel_title(chat_id):
+    """Название канала из кэша (без запросов к API)"""
+    info = channel_directory.get(chat_id)
+    return info['title'] if info and info['title'] else chat_id
+
+async def channel_info(message):
+    """
+    Данные о канале для манифеста. Запрашивает канал у Telegram,
+    только если его еще нет в кэше (например, подписка появилась после обновления).
+    """
+    info = channel_directory.get(message.chat_id)
+    if info is None:
+        info = channel_directory.remember(message.chat_id, await message.get_chat())
+    return info
+
+def dedup_key(message, kind):
     """
-    with open(os.path.join(post_dir, 'ready.txt'), 'w') as f:
-        f.write('ok')
+    Кэш дедупликации и ключ для сообщения.
+    Returns:
+        tuple: (LimitedSet, ключ)
+    """
+    if kind == 'album':
+        return processed_albums, f"{message.chat_id}_{message.grouped_id}"
+    if kind == 'photo_document':
+        return processed_documents, f"{message.chat_id}_{message.id}"
+    return processed_media, f"{message.chat_id}_{message.id}"
 
 
 # --- Сохранение медиа из каналов ---
-@client.on(events.NewMessage(incoming=True, func=lambda e: e.is_channel))
 async def save_channel_message(event):
     """
     Основной обработчик новых сообщений из каналов.
-    Сохраняет альбомы, одиночные фото, фото-документы и текстовые посты в отдельные папки.
-    Для альбомов собирает все сообщения с одинаковым grouped_id.
-    Для каждого поста сохраняет текст, источник, медиа и файл ready.txt.
+    После сохранения или намеренного пропуска сдвигает отметку последнего
+    сообщения канала; сообщение, которое не удалось сохранить, держит отметку.
+    Во время остановки новые сообщения не принимаются: их догрузит следующий запуск.
+    """
+    if bot_state.is_shutting_down:
+        return
+    track_task(asyncio.current_task())
+    if not await handle_channel_message(event.message):
+        remember_unsaved(event.chat_id, event.id)
+        return
+    if event.chat_id in backfill_live_ids:
+        # Пока канал догружается, отметку двигает догрузка: иначе при ее сбое дыра потеряется
+        backfill_live_ids[event.chat_id] = max(backfill_live_ids[event.chat_id], event.id)
+    else:
+        advance_mark(event.chat_id, event.id)
+
+async def handle_channel_message(message, handoff=True):
+    """
+    Обрабатывает одно сообщение канала (из обработчика или при догрузке истории).
+    Сначала по метаданным решает, сохранять ли сообщение: пропуск не трогает диск.
+    Ключ дедупликации записывается в кэш только после успешного сохранения,
+    а на время сохранения пост захватывается в in_flight: повторное событие того же
+    поста дожидается результата и возвращает его, а не считает пост сохраненным.
+    Если сессия получила FloodWait, канал переходит к другой сессии, и она
+    повторяет обработку сообщения.
+    Args:
+        message: Сообщение из канала
+        handoff (bool): Передать сообщение другой сессии при FloodWait
+    Returns:
+        bool: True, если сообщение сохранено или намеренно пропущено;
+            False, если его не удалось сохранить и нужно повторить
+    """
+    options = routing.options(message.chat_id)
+    kind, reason = classify_message(message, options)
+    if kind is None:
+        logging.info(f"⏭️ Пропуск {reason} из канала {channel_title(message.chat_id)}")
+        return True
+
+    cache, key = dedup_key(message, kind)
+    if key in cache or key in skipped_albums:
+        logging.info(f"⏭️ Пост {key} уже был обработан")
+        return True
+    pending = in_flight.get(key)
+    if pending is not None:
+        logging.info(f"⏳ Пост {key} уже сохраняется, ожидание результата")
+        return await asyncio.shield(pending)
+
+    future = asyncio.get_running_loop().create_future()
+    in_flight[key] = future
+    handled = False
+    try:
+        flood = False
+        try:
+            album = None
+            if kind == 'album':
+                album = await fetch_album(message, options['min_text_length'])
+                if album is None:
+                    skipped_albums.add(key)
+                    handled = True
+                    return handled
+            if await save_post(message, kind, album):
+                cache.add(key)
+                handled = True
+        except FloodWaitError as e:
+            shards.mark_flood(client_names.get(message.client), e.seconds)
+            flood = True
+        except Exception as e:
+            logging.error(f"❌ Ошибка при обработке поста {key}: {e}")
+        finally:
+            # Ключ освобождаем до передачи: сессия-владелец захватит его заново,
+            # а ожидающие события получат результат передачи
+            if in_flight.get(key) is future:
+                del in_flight[key]
+
+        if flood and handoff:
+            handled = await hand_off(message)
+        return handled
+    finally:
+        # При отмене ожидающие получат False: отметка канала не сдвинется
+        future.set_result(handled)
+
+async def hand_off(message):
+    """
+    Повторяет обработку сообщения через сессию, которая теперь владеет каналом.
+    Args:
+        message: Сообщение, которое не удалось обработать из-за FloodWait
+    Returns:
+        bool: Результат handle_channel_message у новой сессии (False, если передать не удалось)
+    """
+    owner = shards.owner(message.chat_id)
+    if owner is None or clients[owner] is message.client:
+        logging.warning(f"⚠️ Нет свободной сессии для канала {channel_title(message.chat_id)}, сообщение {message.id} пропущено")
+        return False
+    logging.info(f"🔀 Сообщение {message.id} из канала {channel_title(message.chat_id)} передано сессии {owner}")
+    try:
+        copy = await clients[owner].get_messages(message.chat_id, ids=message.id)
+    except Exception as e:
+        logging.error(f"❌ Сессия {owner} не смогла получить сообщение {message.id}: {e}")
+        return False
+    if copy:
+        return await handle_channel_message(copy, handoff=False)
+    # Сообщение удалено из канала: сохранять нечего
+    return True
+
+async def save_post(message, kind, album=None):
+    """
+    Сохраняет пост: папка собирается в STAGING_DIR, после загрузки медиа
+    записывается манифест post.json, и папка переносится в SAVED_DIR одним os.rename.
+    Args:
+        message: Сообщение из канала
+        kind (str): Тип поста из classify_message
+        album (dict): Сообщения и текст альбома (для kind='album')
+    Returns:
+        bool: True, если пост сохранен
     """
     post_folder = None
     try:
-        # Проверяем, что папка saved существует
-        if not os.path.exists(SAVED_DIR):
-            os.makedirs(SAVED_DIR)
-            logging.info(f"Создана директория {SAVED_DIR}")
-
-        # Проверяем, не был ли пост уже обработан
-        if event.media:
-            # Для альбомов используем только grouped_id
-            if event.grouped_id:
-                album_key = f"{event.chat_id}_{event.grouped_id}"
-                if album_key in processed_albums or not processed_albums.add(album_key):
-                    logging.info(f"⏭️ Альбом {album_key} уже был обработан")
-                    return
-            # Для одиночных медиа используем id
-            else:
-                media_key = f"{event.chat_id}_{event.id}"
-                if media_key in processed_media or not processed_media.add(media_key):
-                    logging.info(f"⏭️ Медиа {media_key} уже было обработано")
-                    return
-            
-        # Для фото-документов проверяем, не был ли он уже обработан
-        if event.media and hasattr(event.media, 'document'):
-            if event.media.document.mime_type.startswith('image/'):
-                doc_key = f"{event.chat_id}_{event.id}"
-                if doc_key in processed_documents or not processed_documents.add(doc_key):
-                    logging.info(f"⏭️ Фото-документ {doc_key} уже был обработан")
-                    return
+        channel = await channel_info(message)
 
         # Создаем папку для поста с ID сообщения
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        message_id = event.id
-        post_folder = os.path.join(SAVED_DIR, f"post_{timestamp}_{message_id}")
+        message_id = message.id
+        post_id = new_post_id(message_id)
+        post_folder = os.path.join(STAGING_DIR, post_id)
         os.makedirs(post_folder, exist_ok=True)
 
-        # Определяем тип сообщения и сохраняем соответствующим способом
-        if event.grouped_id:
-            logging.info(f"📦 Обработка альбома из канала {event.chat.title}")
-            await save_album(event, post_folder)
-        elif event.media and isinstance(event.media, MessageMediaPhoto):
-            if not event.text:
-                logging.info(f"⏭️ Пропуск фото без текста из канала {event.chat.title}")
-                if os.path.exists(post_folder):
-                    shutil.rmtree(post_folder)
-                return
-            logging.info(f"📸 Обработка одиночного фото из канала {event.chat.title}")
-            await save_single_photo(event, post_folder)
-        elif event.media and hasattr(event.media, 'document'):
-            if event.media.document.mime_type.startswith('image/'):
-                if not event.text:
-                    logging.info(f"⏭️ Пропуск фото-документа без текста из канала {event.chat.title}")
-                    if os.path.exists(post_folder):
-                        shutil.rmtree(post_folder)
-                    return
-                logging.info(f"📄 Обработка фото-документа из канала {event.chat.title}")
-                await save_photo_document(event, post_folder)
-            else:
-                logging.info(f"⏭️ Пропуск не фото документа из канала {event.chat.title}")
-                if os.path.exists(post_folder):
-                    shutil.rmtree(post_folder)
-                return
+        # Сохраняем пост в зависимости от типа
+        if kind == 'album':
+            logging.info(f"📦 Обработка альбома из канала {channel['title']}")
+            saved = await save_album(album, post_folder)
+        elif kind == 'photo':
+            logging.info(f"📸 Обработка одиночного фото из канала {channel['title']}")
+            saved = await save_single_photo(message, post_folder)
         else:
-            logging.info(f"⏭️ Пропуск поста без фото из канала {event.chat.title}")
-            if os.path.exists(post_folder):
-                shutil.rmtree(post_folder)
-            return
+            logging.info(f"📄 Обработка фото-документа из канала {channel['title']}")
+            saved = await save_photo_document(message, post_folder)
 
-        # Сохраняем информацию об источнике только если пост был успешно сохранен
-        if os.path.exists(post_folder):
-            source_info = f"Канал: @{event.chat.username}\nДата: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\nID сообщения: {message_id}"
-            source_path = os.path.join(post_folder, "source.txt")
-            with open(source_path, "w", encoding="utf-8") as f:
-                f.write(source_info)
+        if not saved or not saved['photos']:
+            discard_post_folder(post_folder)
+            return False
 
-            # Создаем файл ready.txt
-            save_ready_flag(post_folder)
-            logging.info(f"✅ Пост успешно сохранен в {post_folder}")
+        # Записываем манифест только если пост был успешно сохранен
+        source = {
+            'channel': channel['username'],
+            'title': channel['title'],
+            'chat_id': message.chat_id,
+            'message_id': message_id,
+            'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        manifest = build_manifest(
+            post_id,
+            clean_text_for_open(saved['text']),
+            saved['text'],
+            source,
+            saved['photos']
+        )
+        write_manifest(post_folder, manifest)
+        saved_folder = commit_post_folder(post_folder, post_id)
+        logging.info(f"✅ Пост успешно сохранен в {saved_folder}")
+        post_folder = None
+        retention.add_post(saved_folder)
+
+        # Сообщаем продюсеру о новом посте. Если очередь недоступна,
+        # продюсер найдет папку при периодической сверке
+        try:
+            await asyncio.to_thread(post_queue.enqueue, TOPIC_POSTS, post_id)
+        except Exception as e:
+            logging.error(f"❌ Не удалось поставить пост {post_id} в очередь: {e}")
+        return True
 
+    except FloodWaitError:
+        discard_post_folder(post_folder)
+        raise
     except Exception as e:
-        if post_folder and os.path.exists(post_folder):
-            logging.error(f"❌ Ошибка при сохранении поста: {e}")
-            try:
-                error_info = f"Ошибка: {str(e)}\nВремя: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-                error_path = os.path.join(post_folder, "error.txt")
-                with open(error_path, "w", encoding="utf-8") as f:
-                    f.write(error_info)
-            except Exception as inner_e:
-                logging.error(f"❌ Не удалось сохранить информацию об ошибке: {inner_e}")
-            shutil.rmtree(post_folder)
-
-async def save_album(event, post_folder):
-    """Сохранение альбома с фото"""
-    try:
-        # Получаем все сообщения альбома
-        album_messages = []
-        async for message in client.iter_messages(event.chat_id, min_id=event.id - 10, max_id=event.id + 10):
-            if message.grouped_id == event.grouped_id:
-                album_messages.append(message)
-
-        # Сортируем по ID для правильного порядка
-        album_messages.sort(key=lambda x: x.id)
-        total_photos = len(album_messages)
-
-        # Проверяем наличие текста хотя бы в одном сообщении альбома
-        has_text = False
-        album_text = None
-        for msg in album_messages:
-            if msg.text:
-                has_text = True
-                album_text = msg.text
-                break
-
-        if not has_text:
-            logging.info(f"⏭️ Пропуск альбома без текста")
-            if os.path.exists(post_folder):
-                shutil.rmtree(post_folder)
-            return
+        logging.error(f"❌ Ошибка при сохранении поста: {e}")
+        try:
+            discard_post_folder(post_folder)
+        except Exception as inner_e:
+            logging.error(f"❌ Не удалось удалить папку поста: {inner_e}")
+        return False
 
-        # Сохраняем только фото из альбома
+async def fetch_album(message, min_text_length=0):
+    """
+    Получает сообщения альбома и его текст (без записи на диск).
+    Args:
+        message: Сообщение из альбома
+        min_text_length (int): Минимальная длина текста альбома
+    Returns:
+        dict | None: Сообщения с фото и текст альбома или None, если альбом пропущен
+    """
+    # Получаем все сообщения альбома
+    album_messages = []
+    async for album_message in message.client.iter_messages(message.chat_id, min_id=message.id - 10, max_id=message.id + 10):
+        if album_message.grouped_id == message.grouped_id:
+            album_messages.append(album_message)
+
+    # Сортируем по ID для правильного порядка
+    album_messages.sort(key=lambda x: x.id)
+
+    # Ищем текст хотя бы в одном сообщении альбома
+    album_text = None
+    for msg in album_messages:
+        if msg.text:
+            album_text = msg.text
+            break
+
+    if not album_text:
+        logging.info(f"⏭️ Пропуск альбома без текста")
+        return None
+    if len(album_text) < min_text_length:
+        logging.info(f"⏭️ Пропуск альбома с коротким текстом")
+        return None
+
+    photos = [
+        msg for msg in album_messages
+        if isinstance(msg.media, MessageMediaPhoto) or is_image_document(msg.media)
+    ]
+    if not photos:
+        logging.info(f"⏭️ Пропуск альбома без фото")
+        return None
+    return {'text': album_text, 'messages': photos}
+
+async def save_album(album, post_folder):
+    """
+    Сохранение альбома с фото.
+    Args:
+        album (dict): Сообщения и текст альбома из fetch_album
+        post_folder (str): Папка поста
+    Returns:
+        dict | None: Текст альбома и описания фото или None при ошибке
+    """
+    try:
         saved_files = []
-        photo_count = 0
-        for msg in album_messages:
-            if msg.media and isinstance(msg.media, MessageMediaPhoto):
-                photo_count += 1
+        for photo_count, msg in enumerate(album['messages'], 1):
+            if isinstance(msg.media, MessageMediaPhoto):
                 logging.info(f"📥 Скачивание фото {photo_count} из альбома...")
-                file = await msg.download_media(file=os.path.join(post_folder, f"photo_{photo_count}.jpg"))
-                if file:
-                    saved_files.append(file)
-            elif msg.media and hasattr(msg.media, 'document') and msg.media.document.mime_type.startswith('image/'):
-                photo_count += 1
-                logging.info(f"📥 Скачивание фото-документа {photo_count} из альбома...")
-                file = await msg.download_media(file=os.path.join(post_folder, f"photo_{photo_count}.jpg"))
-                if file:
-                    saved_files.append(file)
             else:
-                pass
-
-        # Сохраняем текст из сообщения, где он был найден
-        if album_text:
-            original_text = album_text
-            cleaned_text = clean_text_for_open(original_text)
-            
-            with open(os.path.join(post_folder, "text.txt"), "w", encoding="utf-8") as f:
-                f.write(cleaned_text)
+                logging.info(f"📥 Скачивание фото-документа {photo_count} из альбома...")
+            photo = await image_normalizer.ingest(
+                msg.client, msg.media, os.path.join(post_folder, f"photo_{photo_count}.jpg"), photo_max_side
+            )
+            photo['message_id'] = msg.id
+            saved_files.append(photo)
 
-            with open(os.path.join(post_folder, "text_close.txt"), "w", encoding="utf-8") as f:
-                f.write(original_text)
-        
         logging.info(f"✅ Альбом сохранен: {len(saved_files)} фото")
+        return {'text': album['text'], 'photos': saved_files}
 
+    except FloodWaitError:
+        raise
     except Exception as e:
         logging.error(f"❌ Ошибка при сохранении альбома: {e}")
-        if os.path.exists(post_folder):
-            shutil.rmtree(post_folder)
+        return None
 
-async def save_single_photo(event, post_folder):
-    """Сохранение одиночного фото"""
+async def save_single_photo(message, post_folder):
+    """
+    Сохранение одиночного фото.
+    Returns:
+        dict | None: Текст поста и описание фото или None при ошибке
+    """
     try:
-        # Проверяем наличие текста
-        if not event.text:
-            logging.info(f"⏭️ Пропуск фото без текста")
-            if os.path.exists(post_folder):
-                shutil.rmtree(post_folder)
-            return
-
-        # Сохраняем фото
         logging.info(f"📥 Скачивание фото...")
-        saved_file = await event.download_media(file=os.path.join(post_folder, "photo_1.jpg"))
-        if saved_file:
-            pass
-        
-        # Сохраняем текст
-        with open(os.path.join(post_folder, "text.txt"), "w", encoding="utf-8") as f:
-            f.write(clean_text_for_open(event.text))
-        with open(os.path.join(post_folder, "text_close.txt"), "w", encoding="utf-8") as f:
-            f.write(event.text)
+        photo = await image_normalizer.ingest(
+            message.client, message.media, os.path.join(post_folder, "photo_1.jpg"), photo_max_side
+        )
+        photo['message_id'] = message.id
         logging.info(f"✅ Фото сохранено")
+        return {'text': message.text, 'photos': [photo]}
 
+    except FloodWaitError:
+        raise
     except Exception as e:
         logging.error(f"❌ Ошибка при сохранении фото: {e}")
-        if os.path.exists(post_folder):
-            shutil.rmtree(post_folder)
+        return None
 
-async def save_photo_document(event, post_folder):
-    """Сохранение фото-документа"""
+async def save_photo_document(message, post_folder):
+    """
+    Сохранение фото-документа.
+    Returns:
+        dict | None: Текст поста и описание фото или None при ошибке
+    """
     try:
-        # Проверяем наличие текста
-        if not event.text:
-            logging.info(f"⏭️ Пропуск фото-документа без текста")
-            if os.path.exists(post_folder):
-                shutil.rmtree(post_folder)
-            return
-
-        # Сохраняем фото-документ
         logging.info(f"📥 Скачивание фото-документа...")
-        saved_file = await event.download_media(file=os.path.join(post_folder, "photo_1.jpg"))
-        if saved_file:
-            pass
-        
-        # Сохраняем текст
-        with open(os.path.join(post_folder, "text.txt"), "w", encoding="utf-8") as f:
-            f.write(clean_text_for_open(event.text))
-        with open(os.path.join(post_folder, "text_close.txt"), "w", encoding="utf-8") as f:
-            f.write(event.text)
+        photo = await image_normalizer.ingest(message.client, message.media, os.path.join(post_folder, "photo_1.jpg"))
+        photo['message_id'] = message.id
         logging.info(f"✅ Фото-документ сохранен")
+        return {'text': message.text, 'photos': [photo]}
 
+    except FloodWaitError:
+        raise
     except Exception as e:
         logging.error(f"❌ Ошибка при сохранении фото-документа: {e}")
-        if os.path.exists(post_folder):
-            shutil.rmtree(post_folder)
+        return None
 
-async def save_text_post(event, post_folder):
-    """Сохранение текстового поста"""
-    try:
-        # Сохраняем текст
-        if event.text:
-            #logging.info(f"Получен текст для сохранения: {event.text[:100]}...")  # Логируем первые 100 символов
-            cleaned_text = clean_text_for_open(event.text)
-            #logging.info(f"Очищенный текст: {cleaned_text[:100]}...")  # Логируем первые 100 символов очищенного текста
-            
-            with open(os.path.join(post_folder, "text.txt"), "w", encoding="utf-8") as f:
-                f.write(cleaned_text)  # Сохраняем очищенный текст
-            with open(os.path.join(post_folder, "text_close.txt"), "w", encoding="utf-8") as f:
-                f.write(event.text)  # Сохраняем оригинальный текст
-            logging.info(f"Текст сохранен в text.txt и text_close.txt")
+async def backfill_channel(client, chat_id, last_id, semaphore):
+    """
+    Догружает сообщения канала после last_id и прогоняет их через обычное сохранение.
+    История запрашивается страницами по BACKFILL_PAGE_SIZE сообщений, пока не
+    закончится. Отметка сдвигается только по уже полученным сообщениям и не
+    дальше первого несохраненного, поэтому при прерывании догрузки или ошибке
+    сохранения остаток запрашивается в следующий раз.
+    Args:
+        client: Клиент сессии, которая владеет каналом
+        chat_id (int): ID канала
+        last_id (int): Последний обработанный ID сообщения
+        semaphore (asyncio.Semaphore): Ограничение одновременно догружаемых каналов
+    Returns:
+        int: Количество догруженных сообщений
+    """
+    count = 0
+    backfill_live_ids[chat_id] = 0
+    # Несохраненные сообщения лежат после last_id: догрузка повторит их
+    unsaved_ids.pop(chat_id, None)
+    async with semaphore:
+        try:
+            cursor = last_id
+            while True:
+                fetched = 0
+                # reverse=True: от старых к новым, начиная сразу после cursor
+                async for message in client.iter_messages(chat_id, min_id=cursor, reverse=True, limit=BACKFILL_PAGE_SIZE):
+                    if bot_state.is_shutting_down:
+                        return count
+                    if await handle_channel_message(message):
+                        advance_mark(chat_id, message.id, save=False)
+                    else:
+                        remember_unsaved(chat_id, message.id)
+                    cursor = message.id
+                    fetched += 1
+                    count += 1
+                if fetched < BACKFILL_PAGE_SIZE:
+                    break
+                # Страница заполнена: история еще не закончилась
+                high_water_marks.save()
+            # Дыра закрыта: учитываем сообщения, обработанные за это время обработчиком
+            advance_mark(chat_id, backfill_live_ids[chat_id], save=False)
+        except FloodWaitError as e:
+            # Отметка остается на последнем догруженном сообщении, остаток догрузится позже
+            shards.mark_flood(client_names.get(client), e.seconds)
+        except Exception as e:
+            logging.error(f"❌ Ошибка при догрузке канала {channel_title(chat_id)}: {e}")
+        finally:
+            backfill_live_ids.pop(chat_id, None)
+            high_water_marks.save()
+    return count
 
-    except Exception as e:
-        logging.error(f"Ошибка при сохранении текстового поста: {e}")
+async def catch_up(session=None):
+    """
+    Догружает сообщения, опубликованные, пока юзербот был отключен,
+    по сохраненным отметкам разрешенных каналов. Каждый канал догружает
+    сессия, которая им владеет.
+    Args:
+        session (str): Догружать только каналы этой сессии (None — все)
+    """
+    semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+    channels = []
+    for chat_id, last_id in high_water_marks.items():
+        if not routing.accepts(chat_id) or chat_id in backfill_live_ids:
+            continue
+        owner = shards.owner(chat_id)
+        if owner is None or (session is not None and owner != session):
+            continue
+        channels.append((clients[owner], chat_id, last_id))
+    if not channels:
+        return
+    logging.info(f"🔄 Догрузка пропущенных сообщений из {len(channels)} каналов...")
+    counts = await asyncio.gather(*(
+        backfill_channel(client, chat_id, last_id, semaphore) for client, chat_id, last_id in channels
+    ))
+    logging.info(f"✅ Догрузка завершена: {sum(counts)} сообщений")
+
+async def get_channels_list():
+    """
+    Список каналов, на которые подписан аккаунт.
+    Returns:
+        list: Данные о каналах (id, title, username, participants_count)
+    """
+    await channel_directory.refresh()
+    return channel_directory.all()
 
-@client.on(events.NewMessage(pattern='/channels'))
 async def channels_command(event):
     """
     Обработчик команды /channels.
@@ -443,126 +776,125 @@ async def channels_command(event):
         logging.error(f"Ошибка при получении списка каналов: {e}")
         await event.respond("Произошла ошибка при получении списка каналов.")
 
-class BotState:
-    def __init__(self):
-        self.is_shutting_down = False
-        self.reconnect_attempts = 0
-        self.max_reconnect_attempts = 5
-        self.reconnect_delay = 10  # начальная задержка в секундах
-
-if __name__ == '__main__':
-    logging.info('Запуск юзербота...')
-    
-    # Получаем текущий event loop
-    loop = asyncio.get_event_loop()
-    
-    # Создаем объект для управления состоянием
-    state = BotState()
-    
-    async def shutdown(signal_name, loop):
-        """Корректное завершение работы бота"""
-        if state.is_shutting_down:
-            return
-            
-        state.is_shutting_down = True
-        logging.info(f"Получен сигнал {signal_name}...")
-        
+def register_handlers(client, name):
+    """
+    Регистрирует обработчики на клиенте сессии.
+    Сообщения канала обрабатывает только сессия-владелец: фильтр отсекает
+    чужие и лишние каналы по chat_id до любых запросов к API.
+    Args:
+        client: Клиент Telethon
+        name (str): Имя сессии
+    """
+    client.add_event_handler(
+        save_channel_message,
+        events.NewMessage(
+            incoming=True,
+            func=lambda e: e.is_channel and routing.accepts(e.chat_id) and shards.is_owner(name, e.chat_id)
+        )
+    )
+    client.add_event_handler(channels_command, events.NewMessage(pattern='/channels'))
+
+for name, session_client in clients.items():
+    register_handlers(session_client, name)
+
+async def run_session(name):
+    """
+    Держит сессию подключенной: переподключает ее с экспоненциальной задержкой
+    без ограничения числа попыток. Пока сессия отключена, ее каналы обрабатывают
+    другие сессии; после подключения она догружает свои каналы.
+    Args:
+        name (str): Имя сессии
+    """
+    client = clients[name]
+    while not bot_state.is_shutting_down:
         try:
-            # Отключаем клиента
-            try:
-                if hasattr(client, 'is_connected') and client.is_connected():
-                    logging.info("Отключаем клиента Telegram...")
-                    # Отключаем клиента
-                    await client.disconnect()
-                    # Ждем завершения всех операций отключения
-                    await asyncio.sleep(1)
-                    logging.info("Клиент Telegram отключен")
-            except Exception as e:
-                logging.warning(f"Ошибка при отключении клиента: {e}")
-            
-            # Отменяем все задачи
-            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
-            for task in tasks:
-                task.cancel()
-            
-            logging.info(f"Отменено {len(tasks)} задач")
-            # Ждем завершения всех задач
-            await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Даем время на завершение всех операций
-            await asyncio.sleep(1)
-            
+            await client.start()
         except Exception as e:
-            logging.error(f"Ошибка при завершении работы: {e}")
-        finally:
-            try:
-                loop.stop()
-                logging.info("Бот остановлен")
-            except Exception as e:
-                logging.error(f"Ошибка при остановке loop: {e}")
-    
-    def handle_signal(sig, frame):
-        """Обработчик сигналов"""
-        signal_name = signal.Signals(sig).name
-        logging.info(f"Получен сигнал {signal_name}")
-        # Запускаем shutdown в отдельном потоке
-        asyncio.run_coroutine_threadsafe(shutdown(signal_name, loop), loop)
-    
-    # Регистрируем обработчики сигналов
-    signals = (signal.SIGTERM, signal.SIGINT)
-    for s in signals:
-        signal.signal(s, handle_signal)
-    
-    while not state.is_shutting_down:
+            delay = bot_state.next_reconnect_delay(name)
+            logging.error(f"Сессия {name}: ошибка соединения с Telegram API: {e}. Переподключение через {delay:.0f} секунд...")
+            await asyncio.sleep(delay)
+            continue
+        bot_state.reset_reconnect(name)
+        shards.mark_connected(name)
+        logging.info(f"Сессия {name} подключена к Telegram")
+        await channel_directory.refresh([name])
+        track_task(asyncio.get_running_loop().create_task(catch_up(name)))
         try:
-            with client:
-                # Сбрасываем счетчик попыток при успешном подключении
-                state.reconnect_attempts = 0
-                state.reconnect_delay = 10
-                logging.info("Бот успешно подключен к Telegram")
-                try:
-                    client.run_until_disconnected()
-                except asyncio.CancelledError:
-                    logging.info("Получен сигнал отмены, завершаем работу...")
-                    break
-                
-        except (OSError, RPCError) as e:
-            if state.is_shutting_down:
-                break
-                
-            state.reconnect_attempts += 1
-            if state.reconnect_attempts > state.max_reconnect_attempts:
-                logging.error(f"Превышено максимальное количество попыток переподключения ({state.max_reconnect_attempts}). Бот остановлен.")
-                break
-                
-            # Экспоненциальная задержка между попытками
-            delay = min(state.reconnect_delay * (2 ** (state.reconnect_attempts - 1)), 300)  # максимум 5 минут
-            logging.error(f'Ошибка соединения с Telegram API: {e}. Попытка {state.reconnect_attempts} из {state.max_reconnect_attempts}. Переподключение через {delay} секунд...')
-            time.sleep(delay)
-            
+            await client.disconnected
         except Exception as e:
-            if state.is_shutting_down:
-                break
-                
-            logging.error(f'Неизвестная ошибка: {e}. Перезапуск через 30 секунд...')
-            time.sleep(30)
-            
-        finally:
-            if not state.is_shutting_down and state.reconnect_attempts > state.max_reconnect_attempts:
-                # Очищаем все задачи
-                pending = asyncio.all_tasks(loop)
-                for task in pending:
-                    task.cancel()
-                
-                # Запускаем loop до завершения всех задач
-                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
-    
-    # Закрываем loop
-    try:
-        loop.close()
-        logging.info("Бот полностью остановлен")
-    except Exception as e:
-        logging.error(f"Ошибка при закрытии loop: {e}")
-        
-    # Принудительное завершение процесса
-    os._exit(0) 
\ No newline at end of file
+            logging.warning(f"Сессия {name} отключилась с ошибкой: {e}")
+        shards.mark_disconnected(name)
+
+def track_task(task):
+    """Запоминает задачу, которую нужно дождаться при остановке"""
+    active_tasks.add(task)
+    task.add_done_callback(active_tasks.discard)
+    return task
+
+async def shutdown():
+    """
+    Корректное завершение работы: перестаем принимать новые сообщения,
+    дожидаемся начатых сохранений и догрузок, затем отключаем сессии и
+    сохраняем состояние.
+    """
+    bot_state.is_shutting_down = True
+    await retention.stop()
+    await channel_directory.stop()
+    await originals_fetcher.stop()
+
+    pending = [task for task in active_tasks if task is not asyncio.current_task()]
+    if pending:
+        logging.info(f"Ожидание завершения {len(pending)} задач (до {DRAIN_TIMEOUT} секунд)...")
+        done, not_done = await asyncio.wait(pending, timeout=DRAIN_TIMEOUT)
+        for task in not_done:
+            task.cancel()
+        await asyncio.gather(*not_done, return_exceptions=True)
+        if not_done:
+            logging.warning(f"Прервано незавершенных задач: {len(not_done)}")
+
+    # Отключаем клиентов всех сессий
+    for name, client in clients.items():
+        try:
+            if client.is_connected():
+                logging.info(f"Отключаем клиента Telegram {name}...")
+                await client.disconnect()
+                logging.info(f"Клиент Telegram {name} отключен")
+        except Exception as e:
+            logging.warning(f"Ошибка при отключении клиента {name}: {e}")
+
+    high_water_marks.save()
+    post_queue.close()
+    image_normalizer.shutdown()
+
+async def main():
+    """
+    Супервизор юзербота: держит все сессии подключенными и по SIGTERM/SIGINT
+    корректно завершает работу.
+    """
+    logging.info('Запуск юзербота...')
+    cleanup_staging()
+    loop = asyncio.get_running_loop()
+
+    stop = asyncio.Event()
+
+    def request_stop(signal_name):
+        logging.info(f"Получен сигнал {signal_name}")
+        stop.set()
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, request_stop, sig.name)
+
+    retention.start(loop)
+    channel_directory.start(loop)
+    originals_fetcher.start(loop)
+    sessions = [loop.create_task(run_session(name)) for name in SESSIONS]
+
+    await stop.wait()
+    await shutdown()
+    for task in sessions:
+        task.cancel()
+    await asyncio.gather(*sessions, return_exceptions=True)
+    logging.info("Бот остановлен")
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,188 @@
+import time
+import asyncio
+import hashlib
+import logging
+from collections import namedtuple
+from telethon.errors import ServerError, TimedOutError
+from telethon.tl.types import InputPhotoFileLocation, PhotoSize, PhotoSizeProgressive
+
+# Максимальный размер одного запроса upload.getFile; смещения частей кратны ему
+PART_SIZE = 512 * 1024
+# Ошибки, после которых имеет смысл повторить запрос той же части
+RETRY_ERRORS = (OSError, asyncio.TimeoutError, ServerError, TimedOutError)
+
+
+class TokenBucket:
+    """Ограничение скорости загрузки в байтах в секунду (0 — без ограничения)"""
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount):
+        """Ждет, пока можно будет загрузить amount байт"""
+        if not self.rate:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            if self._tokens < 0:
+                # Долг отрабатываем ожиданием под замком, чтобы очередь шла по порядку
+                await asyncio.sleep(-self._tokens / self.rate)
+
+
+# Размер фото для загрузки: файл, DC, размер в байтах и признак оригинала
+PhotoVariant = namedtuple('PhotoVariant', 'location dc_id size is_original')
+
+
+def photo_variant(photo, max_side):
+    """
+    Выбирает размер фото: самый крупный, у которого длинная сторона не больше max_side.
+    Args:
+        photo: Photo из MessageMediaPhoto
+        max_side (int | None): Ограничение длинной стороны (None — оригинал)
+    Returns:
+        PhotoVariant | None: Выбранный размер или None, если у фото нет подходящих размеров
+    """
+    sizes = [s for s in photo.sizes if isinstance(s, (PhotoSize, PhotoSizeProgressive))]
+    if not sizes:
+        return None
+    sizes.sort(key=lambda s: s.w * s.h)
+    chosen = sizes[-1]
+    if max_side:
+        fitting = [s for s in sizes if max(s.w, s.h) <= max_side]
+        chosen = fitting[-1] if fitting else sizes[0]
+    location = InputPhotoFileLocation(
+        id=photo.id,
+        access_hash=photo.access_hash,
+        file_reference=photo.file_reference,
+        thumb_size=chosen.type
+    )
+    size = max(chosen.sizes) if isinstance(chosen, PhotoSizeProgressive) else chosen.size
+    return PhotoVariant(location, photo.dc_id, size, chosen is sizes[-1])
+
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DownloadManager:
+    """
+    Загрузка медиа с общим бюджетом на все сессии.
+
+    Мелкие файлы (фото) скачиваются потоком, крупные документы — частями по 512 КБ
+    параллельно. Запросы к другим дата-центрам Telethon отправляет через общий
+    экспортированный sender этого DC, так что параллельные части идут по одному
+    соединению без повторной авторизации. Число одновременных запросов частей
+    ограничено семафором, скорость — TokenBucket. Неудачная часть повторяется
+    с задержкой, уже скачанные части не перезапрашиваются.
+    """
+    def __init__(
+        self,
+        max_parallel_parts=8,
+        parts_per_file=4,
+        parallel_threshold=2 * 1024 * 1024,
+        bandwidth=0,
+        retries=3,
+        retry_delay=1.0
+    ):
+        self.parts_per_file = parts_per_file
+        self.parallel_threshold = parallel_threshold
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._budget = asyncio.Semaphore(max_parallel_parts)
+        self._bucket = TokenBucket(bandwidth)
+
+    async def download(self, client, media, path):
+        """
+        Скачивает медиа в файл.
+        Args:
+            client: Клиент Telethon
+            media: Медиа сообщения или PhotoVariant
+            path (str): Путь к файлу
+        Returns:
+            tuple: (размер в байтах, sha256)
+        """
+        if isinstance(media, PhotoVariant):
+            # Конкретный размер фото: запрос по месту хранения в DC фото
+            return await self._download_stream(client, media.location, path, dc_id=media.dc_id)
+        document = getattr(media, 'document', None)
+        size = getattr(document, 'size', None)
+        if size and size >= self.parallel_threshold:
+            await self._download_parallel(client, media, path, size)
+            return size, await asyncio.to_thread(_sha256_file, path)
+        return await self._download_stream(client, media, path)
+
+    async def _download_stream(self, client, media, path, dc_id=None):
+        """Последовательная загрузка с подсчетом хэша; после сбоя продолжает с места обрыва"""
+        digest = hashlib.sha256()
+        size = 0
+        attempt = 0
+        with open(path, 'wb') as f:
+            while True:
+                try:
+                    async with self._budget:
+                        async for chunk in client.iter_download(media, offset=size, request_size=PART_SIZE, dc_id=dc_id):
+                            await self._bucket.acquire(len(chunk))
+                            digest.update(chunk)
+                            f.write(chunk)
+                            size += len(chunk)
+                    return size, digest.hexdigest()
+                except RETRY_ERRORS as e:
+                    attempt += 1
+                    if attempt > self.retries:
+                        raise
+                    logging.warning(f"⚠️ Обрыв загрузки на {size} байтах ({e}), повтор {attempt} из {self.retries}")
+                    await asyncio.sleep(self.retry_delay * attempt)
+
+    async def _fetch_part(self, client, media, index):
+        """Скачивает одну часть файла с повторами"""
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._budget:
+                    await self._bucket.acquire(PART_SIZE)
+                    async for chunk in client.iter_download(
+                        media, offset=index * PART_SIZE, request_size=PART_SIZE, limit=1
+                    ):
+                        return chunk
+                    return b''
+            except RETRY_ERRORS as e:
+                if attempt == self.retries:
+                    raise
+                logging.warning(f"⚠️ Ошибка загрузки части {index} ({e}), повтор {attempt + 1} из {self.retries}")
+                await asyncio.sleep(self.retry_delay * (attempt + 1))
+
+    async def _download_parallel(self, client, media, path, size):
+        """Параллельная загрузка частей с записью по смещениям"""
+        parts = (size + PART_SIZE - 1) // PART_SIZE
+        queue = asyncio.Queue()
+        for index in range(parts):
+            queue.put_nowait(index)
+
+        with open(path, 'wb') as f:
+            f.truncate(size)
+
+            async def worker():
+                while not queue.empty():
+                    index = queue.get_nowait()
+                    chunk = await self._fetch_part(client, media, index)
+                    f.seek(index * PART_SIZE)
+                    f.write(chunk)
+
+            workers = [asyncio.ensure_future(worker()) for _ in range(min(self.parts_per_file, parts))]
+            try:
+                await asyncio.gather(*workers)
+            except BaseException:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                raise
+        logging.info(f"📥 Файл {size} байт скачан параллельно: {parts} частей")
@@ -0,0 +1,193 @@
+import io
+import os
+import asyncio
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from telethon.tl.types import MessageMediaPhoto
+
+from download_manager import photo_variant
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+try:
+    # HEIC/HEIF-оригиналы, если установлен pillow-heif
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except ImportError:
+    pass
+
+# Ступени качества JPEG при подгонке под лимит размера
+QUALITY_STEPS = (88, 82, 76, 70, 64)
+# Меньше этой стороны картинку не уменьшаем, даже если она не влезает в лимит
+MIN_SIDE = 640
+
+
+def file_sha256(path):
+    """SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _encode_jpeg(img, max_bytes):
+    """Кодирует картинку в JPEG, понижая качество и размер, пока результат не влезет в лимит"""
+    while True:
+        for quality in QUALITY_STEPS:
+            buf = io.BytesIO()
+            img.save(buf, 'JPEG', quality=quality, optimize=True, progressive=True)
+            if buf.tell() <= max_bytes:
+                return buf.getvalue()
+        if min(img.size) <= MIN_SIDE:
+            return buf.getvalue()
+        img = img.resize((int(img.width * 0.8), int(img.height * 0.8)), Image.LANCZOS)
+
+
+def normalize_image(src_path, dst_path, max_side, max_bytes):
+    """
+    Нормализует картинку: поворот по EXIF, удаление метаданных, уменьшение до max_side
+    и JPEG не больше max_bytes. Выполняется в отдельном процессе.
+    Args:
+        src_path (str): Исходный файл
+        dst_path (str): Куда записать результат
+        max_side (int): Максимальная сторона в пикселях
+        max_bytes (int): Максимальный размер файла
+    Returns:
+        dict | None: Размер и SHA-256 результата или None, если исходник уже подходит
+    """
+    with Image.open(src_path) as img:
+        if (
+            img.format == 'JPEG'
+            and max(img.size) <= max_side
+            and os.path.getsize(src_path) <= max_bytes
+            and not img.getexif()
+        ):
+            return None
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ('RGBA', 'LA', 'P'):
+            # Прозрачность заливаем белым фоном
+            rgba = img.convert('RGBA')
+            img = Image.new('RGB', rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel('A'))
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+        data = _encode_jpeg(img, max_bytes)
+
+    with open(dst_path, 'wb') as f:
+        f.write(data)
+    return {'size': len(data), 'sha256': hashlib.sha256(data).hexdigest()}
+
+
+class ImageNormalizer:
+    """
+    Приводит скачанные фото к виду, в котором их выгодно отправлять в Telegram:
+    без EXIF, с правильной ориентацией, не больше max_side по длинной стороне
+    и не больше max_bytes. Работа с картинками идет в пуле процессов, event loop
+    только ждет результат. Результат кэшируется в хранилище медиа по хэшу исходника.
+    Без Pillow фото сохраняются как есть.
+    """
+    CACHE_TAG = 'norm'
+
+    def __init__(self, media_store, max_side=2560, max_bytes=1024 * 1024, workers=2):
+        self.media_store = media_store
+        self.max_side = max_side
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.enabled = Image is not None
+        self._executor = None
+        if not self.enabled:
+            logging.warning("⚠️ Pillow не установлен, фото сохраняются без нормализации")
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def shutdown(self):
+        """Останавливает пул процессов"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _normalize(self, source_path, sha256):
+        """
+        Возвращает путь к нормализованной копии и ее описание.
+        Рядом с копией хранится описание <sha>.norm.json с ее размером и хэшем,
+        поэтому повторная нормализация того же исходника не читает файл целиком.
+        Исходник, который не нуждается в нормализации, тоже запоминается в описании.
+        Returns:
+            tuple: (путь, размер, sha256) или None, если исходник подходит как есть
+        """
+        store = self.media_store
+        cached_path = store.derived_path(sha256, self.CACHE_TAG)
+        meta_path = store.derived_meta_path(sha256, self.CACHE_TAG)
+        meta = await asyncio.to_thread(store.read_meta, meta_path)
+        if meta is not None:
+            if meta.get('unchanged'):
+                store.touch(meta_path)
+                return None
+            if os.path.exists(cached_path) and os.path.getsize(cached_path) == meta.get('size'):
+                store.touch(cached_path)
+                store.touch(meta_path)
+                return cached_path, meta['size'], meta['sha256']
+        if os.path.exists(cached_path):
+            # Копия из кэша без описания: хэш считается один раз
+            store.touch(cached_path)
+            size = os.path.getsize(cached_path)
+            digest = await asyncio.to_thread(file_sha256, cached_path)
+            await asyncio.to_thread(store.write_meta, meta_path, {'size': size, 'sha256': digest})
+            return cached_path, size, digest
+
+        tmp_path = store.tmp_path()
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(
+                self._get_executor(), normalize_image,
+                source_path, tmp_path, self.max_side, self.max_bytes
+            )
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if result is None:
+            await asyncio.to_thread(store.write_meta, meta_path, {'unchanged': True})
+            return None
+        os.replace(tmp_path, cached_path)
+        await asyncio.to_thread(store.write_meta, meta_path, result)
+        return cached_path, result['size'], result['sha256']
+
+    async def ingest(self, client, media, dest, preview_side=None):
+        """
+        Скачивает фото в хранилище, нормализует его и связывает с папкой поста.
+        Args:
+            client: Клиент Telethon
+            media: Медиа сообщения
+            dest (str): Путь к файлу в папке поста
+            preview_side (int | None): Для фото скачать размер не больше этой стороны вместо оригинала
+        Returns:
+            dict: Описание фото для манифеста (file, size, sha256, tier)
+        """
+        tier = 'original'
+        source = media
+        if preview_side and isinstance(media, MessageMediaPhoto) and media.photo:
+            variant = photo_variant(media.photo, preview_side)
+            if variant and not variant.is_original:
+                source, tier = variant, 'preview'
+        path, sha256, size = await self.media_store.fetch(client, source)
+        if self.enabled:
+            try:
+                normalized = await self._normalize(path, sha256)
+            except Exception as e:
+                logging.warning(f"⚠️ Не удалось нормализовать фото {sha256[:12]}, сохраняем как есть: {e}")
+                normalized = None
+            if normalized:
+                logging.info(f"🖼️ Фото нормализовано: {size} -> {normalized[1]} байт")
+                path, size, sha256 = normalized
+        self.media_store.link_into(path, dest)
+        return {'file': os.path.basename(dest), 'size': size, 'sha256': sha256, 'tier': tier}
@@ -0,0 +1,71 @@
+import os
+import threading
+from datetime import datetime, timedelta
+
+# Посты хранятся в подпапках по дате: SAVED_DIR/YYYY/MM/DD/post_YYYYmmdd_HHMMSS_<id>
+
+# Время последнего выданного ID поста: ID строго возрастают в пределах процесса
+_last_post_time = None
+_post_id_lock = threading.Lock()
+
+
+def new_post_id(message_id):
+    """
+    Создает ID поста вида post_YYYYmmdd_HHMMSS_ffffff_<message_id>.
+    Микросекунды делают ID уникальным для сообщений разных каналов с одинаковым ID,
+    а сортировка по имени совпадает с порядком сохранения.
+    Args:
+        message_id (int): ID сообщения в канале
+    Returns:
+        str: ID поста
+    """
+    global _last_post_time
+    with _post_id_lock:
+        now = datetime.now()
+        if _last_post_time is not None and now <= _last_post_time:
+            now = _last_post_time + timedelta(microseconds=1)
+        _last_post_time = now
+    return f"post_{now:%Y%m%d_%H%M%S_%f}_{message_id}"
+
+
+def post_date(post_id):
+    """
+    Извлекает дату из ID поста вида post_YYYYmmdd_HHMMSS_<id>.
+    Returns:
+        date | None: Дата или None, если ID имеет другой формат
+    """
+    parts = post_id.split('_')
+    if len(parts) < 3 or parts[0] != 'post':
+        return None
+    try:
+        return datetime.strptime(parts[1], '%Y%m%d').date()
+    except ValueError:
+        return None
+
+
+def shard_dir(saved_dir, day):
+    """Папка шарда за указанный день"""
+    return os.path.join(saved_dir, f"{day:%Y}", f"{day:%m}", f"{day:%d}")
+
+
+def find_post_dir(saved_dir, post_id):
+    """
+    Находит папку поста в шардах или в старой плоской структуре.
+    Returns:
+        str | None: Путь или None, если папки нет
+    """
+    for path in (sharded_post_dir(saved_dir, post_id), os.path.join(saved_dir, post_id)):
+        if os.path.isdir(path):
+            return path
+    return None
+
+
+def sharded_post_dir(saved_dir, post_id):
+    """
+    Путь к папке поста в шардированной структуре.
+    Для ID без даты возвращает путь прямо в saved_dir.
+    """
+    day = post_date(post_id)
+    if day is None:
+        return os.path.join(saved_dir, post_id)
+    return os.path.join(shard_dir(saved_dir, day), post_id)
@@ -0,0 +1,60 @@
+import os
+import json
+from datetime import datetime
+
+# Манифест поста: один файл вместо text.txt/text_close.txt/source.txt/ready.txt
+MANIFEST_FILE = 'post.json'
+MANIFEST_VERSION = 1
+
+
+def build_manifest(post_id, text, text_close, source, photos):
+    """
+    Собирает манифест поста.
+    Args:
+        post_id (str): ID поста (имя папки)
+        text (str): Очищенный текст для открытого канала
+        text_close (str): Оригинальный текст для закрытого канала
+        source (dict): Данные об источнике (канал, ID сообщения, дата)
+        photos (list): Описания фото в порядке публикации
+    Returns:
+        dict: Манифест
+    """
+    return {
+        'version': MANIFEST_VERSION,
+        'post_id': post_id,
+        'text': text,
+        'text_close': text_close,
+        'source': source,
+        'photos': photos,
+        # preview: часть фото скачана в уменьшенном размере, оригиналы догружаются при публикации
+        'photo_tier': 'preview' if any(photo.get('tier') == 'preview' for photo in photos) else 'original',
+        'status': 'ready',
+        'created_at': datetime.now().isoformat()
+    }
+
+
+def read_manifest(post_dir):
+    """
+    Читает манифест из папки поста.
+    Returns:
+        dict | None: Манифест или None, если файла нет
+    """
+    path = os.path.join(post_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_manifest(post_dir, manifest):
+    """
+    Атомарно записывает манифест в папку поста.
+    Args:
+        post_dir (str): Путь к папке поста
+        manifest (dict): Манифест
+    """
+    path = os.path.join(post_dir, MANIFEST_FILE)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, path)
@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+
+from download_manager import DownloadManager
+
+
+class MediaStore:
+    """
+    Хранилище медиа по содержимому: каждый файл лежит один раз в
+    <root>/<первые два символа хэша>/<sha256>.jpg, а в папки постов попадает
+    жесткой ссылкой. Счетчик ссылок файловой системы (st_nlink) служит
+    счетчиком ссылок: файл с единственной ссылкой больше не нужен ни одному посту.
+    Хранилище общее с продюсером и должно лежать на той же файловой системе, что и посты.
+    """
+    def __init__(self, root, orphan_grace=3600, downloader=None):
+        self.root = root
+        self.downloader = downloader or DownloadManager()
+        self.tmp_dir = os.path.join(root, 'tmp')
+        # Файлы моложе этого возраста не удаляются, даже если на них нет ссылок:
+        # их могли только что скачать и еще не связать с постом
+        self.orphan_grace = orphan_grace
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def path_for(self, sha256):
+        """Путь к файлу в хранилище по хэшу"""
+        return os.path.join(self.root, sha256[:2], f"{sha256}.jpg")
+
+    def _commit(self, tmp_path, sha256):
+        """Переносит скачанный файл в хранилище или удаляет его, если такой уже есть"""
+        path = self.path_for(sha256)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            # Обновляем время, чтобы сборщик мусора не удалил файл до создания ссылки
+            os.utime(path)
+            logging.info(f"♻️ Медиа {sha256[:12]} уже есть в хранилище")
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        return path
+
+    @staticmethod
+    def link_into(path, dest):
+        """Создает жесткую ссылку на файл хранилища (или копию, если ссылка невозможна)"""
+        if os.path.exists(dest):
+            os.remove(dest)
+        try:
+            os.link(path, dest)
+        except OSError:
+            shutil.copy2(path, dest)
+
+    def tmp_path(self):
+        """Путь для временного файла внутри хранилища"""
+        return os.path.join(self.tmp_dir, uuid.uuid4().hex)
+
+    def derived_path(self, sha256, tag):
+        """Путь к производному файлу (например, нормализованной копии) по хэшу исходника"""
+        return os.path.join(self.root, sha256[:2], f"{sha256}.{tag}.jpg")
+
+    def derived_meta_path(self, sha256, tag):
+        """Путь к описанию производного файла (размер, хэш) рядом с ним"""
+        return os.path.join(self.root, sha256[:2], f"{sha256}.{tag}.json")
+
+    def read_meta(self, path):
+        """Читает описание производного файла или возвращает None"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"⚠️ Не удалось прочитать {path}: {e}")
+            return None
+
+    def write_meta(self, path, meta):
+        """Атомарно записывает описание производного файла"""
+        tmp_path = self.tmp_path()
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+
+    def _meta_in_use(self, shard_dir, name):
+        """Описание нужно, пока в хранилище есть исходник или производный файл"""
+        base = name[:-len('.json')]
+        source = f"{base.split('.')[0]}.jpg"
+        return (
+            os.path.exists(os.path.join(shard_dir, f"{base}.jpg"))
+            or os.path.exists(os.path.join(shard_dir, source))
+        )
+
+    def touch(self, path):
+        """Отмечает файл хранилища как используемый, чтобы сборщик мусора его не удалил"""
+        os.utime(path)
+
+    async def fetch(self, client, media):
+        """
+        Скачивает медиа в хранилище через менеджер загрузок (SHA-256 считается по ходу загрузки).
+        Args:
+            client: Клиент Telethon
+            media: Медиа сообщения или PhotoVariant (конкретный размер фото)
+        Returns:
+            tuple: (путь в хранилище, sha256, размер в байтах)
+        """
+        tmp_path = self.tmp_path()
+        try:
+            size, sha256 = await self.downloader.download(client, media, tmp_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return self._commit(tmp_path, sha256), sha256, size
+
+    def collect_orphans(self):
+        """
+        Удаляет файлы хранилища, на которые не ссылается ни один пост.
+        Returns:
+            tuple: (удалено файлов, освобождено байт)
+        """
+        removed = 0
+        reclaimed = 0
+        deadline = time.time() - self.orphan_grace
+        for shard in os.listdir(self.root):
+            shard_dir = os.path.join(self.root, shard)
+            if shard == 'tmp' or not os.path.isdir(shard_dir):
+                continue
+            with os.scandir(shard_dir) as entries:
+                for entry in entries:
+                    stat = entry.stat(follow_symlinks=False)
+                    if stat.st_nlink > 1 or stat.st_mtime > deadline:
+                        continue
+                    if entry.name.endswith('.json') and self._meta_in_use(shard_dir, entry.name):
+                        continue
+                    try:
+                        os.remove(entry.path)
+                    except OSError as e:
+                        logging.error(f"Ошибка при удалении {entry.path}: {e}")
+                        continue
+                    removed += 1
+                    reclaimed += stat.st_size
+        # Недокачанные файлы после аварийного завершения
+        with os.scandir(self.tmp_dir) as entries:
+            for entry in entries:
+                stat = entry.stat(follow_symlinks=False)
+                if stat.st_mtime <= deadline:
+                    os.remove(entry.path)
+                    removed += 1
+                    reclaimed += stat.st_size
+        return removed, reclaimed
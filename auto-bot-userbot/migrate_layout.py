@@ -0,0 +1,68 @@
+"""
+Переносит папки постов из плоской структуры SAVED_DIR/post_* в шарды
+SAVED_DIR/YYYY/MM/DD/post_*.
+
+Запуск: python migrate_layout.py [--dry-run]
+
+Продюсер находит папку и по старому, и по новому пути, поэтому переносить
+можно без остановки ботов. Безопаснее делать это, пока посты не редактируются.
+"""
+import os
+import argparse
+import logging
+from dotenv import load_dotenv
+
+from layout import post_date, sharded_post_dir
+
+load_dotenv()
+
+SAVED_DIR = os.getenv('SAVE_DIR', os.path.join(os.getcwd(), 'saved'))
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def migrate(saved_dir, dry_run=False):
+    """
+    Переносит папки постов в шарды.
+    Args:
+        saved_dir (str): Корневая папка постов
+        dry_run (bool): Только показать, что будет перенесено
+    Returns:
+        tuple: (перенесено, пропущено)
+    """
+    moved = 0
+    skipped = 0
+    with os.scandir(saved_dir) as entries:
+        post_dirs = sorted(
+            entry.name for entry in entries
+            if entry.name.startswith('post_') and entry.is_dir()
+        )
+
+    for post_id in post_dirs:
+        source = os.path.join(saved_dir, post_id)
+        if post_date(post_id) is None:
+            logging.warning(f"⏭️ {post_id}: не удалось определить дату, пропуск")
+            skipped += 1
+            continue
+        target = sharded_post_dir(saved_dir, post_id)
+        if os.path.exists(target):
+            logging.warning(f"⏭️ {post_id}: {target} уже существует, пропуск")
+            skipped += 1
+            continue
+        if dry_run:
+            logging.info(f"🔎 {source} -> {target}")
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.rename(source, target)
+            logging.info(f"📦 {source} -> {target}")
+        moved += 1
+    return moved, skipped
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Перенос постов в шарды по дате')
+    parser.add_argument('--dry-run', action='store_true', help='только показать, что будет перенесено')
+    args = parser.parse_args()
+
+    moved, skipped = migrate(SAVED_DIR, dry_run=args.dry_run)
+    logging.info(f"✅ Готово. Перенесено: {moved}, пропущено: {skipped}")
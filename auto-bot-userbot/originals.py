@@ -0,0 +1,130 @@
+import os
+import asyncio
+import logging
+
+from layout import find_post_dir
+from manifest import read_manifest, write_manifest
+from post_queue import TOPIC_ORIGINALS
+
+
+class OriginalsFetcher:
+    """
+    Догружает оригиналы фото для постов, сохраненных в уменьшенном размере.
+
+    Продюсер перед публикацией ставит в очередь задание темы originals с ID поста.
+    Фоновая задача забирает задания, заново получает исходные сообщения через сессию,
+    которая сейчас обрабатывает канал, и подменяет превью в папке поста оригиналами.
+    После замены всех фото в манифест записывается photo_tier = original.
+    """
+    def __init__(
+        self,
+        queue,
+        saved_dir,
+        normalizer,
+        client_for,
+        poll_interval=1.0,
+        max_attempts=3,
+        retry_delay=30
+    ):
+        """
+        Args:
+            queue: Очередь заданий PostQueue
+            saved_dir (str): Папка с постами
+            normalizer: ImageNormalizer для загрузки и нормализации фото
+            client_for: Функция chat_id -> клиент Telethon (или None, если нет доступной сессии)
+            poll_interval (float): Пауза между опросами пустой очереди в секундах
+            max_attempts (int): Попыток на пост, после которых задание помечается проваленным
+            retry_delay (int): Задержка повтора после ошибки в секундах
+        """
+        self.queue = queue
+        self.saved_dir = saved_dir
+        self.normalizer = normalizer
+        self.client_for = client_for
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._task = None
+
+    def start(self, loop=None):
+        """Запускает фоновую задачу, если она еще не запущена"""
+        if self._task and not self._task.done():
+            return
+        loop = loop or asyncio.get_event_loop()
+        self._task = loop.create_task(self.run())
+
+    async def stop(self):
+        """Останавливает фоновую задачу"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run(self):
+        """Цикл обработки заданий"""
+        while True:
+            # Запросы к SQLite могут ждать блокировку базы: выполняем их вне цикла событий
+            jobs = await asyncio.to_thread(self.queue.claim, TOPIC_ORIGINALS)
+            if not jobs:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            for job in jobs:
+                try:
+                    await self.fetch(job['key'])
+                    await asyncio.to_thread(self.queue.ack, job)
+                except asyncio.CancelledError:
+                    self.queue.nack(job)
+                    raise
+                except Exception as e:
+                    if job['attempts'] >= self.max_attempts:
+                        logging.error(f"❌ Оригиналы фото поста {job['key']} не получены, попыток: {job['attempts']}: {e}")
+                        await asyncio.to_thread(self.queue.fail, job)
+                    else:
+                        logging.warning(f"⚠️ Ошибка загрузки оригиналов поста {job['key']}, повтор через {self.retry_delay} с: {e}")
+                        await asyncio.to_thread(self.queue.nack, job, self.retry_delay)
+
+    async def fetch(self, post_id):
+        """
+        Заменяет превью фото поста оригиналами.
+        Args:
+            post_id (str): ID поста
+        """
+        post_dir = find_post_dir(self.saved_dir, post_id)
+        manifest = read_manifest(post_dir) if post_dir else None
+        if not manifest or manifest.get('photo_tier') != 'preview':
+            return
+
+        chat_id = manifest['source']['chat_id']
+        client = self.client_for(chat_id)
+        if client is None:
+            raise RuntimeError(f"нет доступной сессии для канала {chat_id}")
+
+        previews = [p for p in manifest['photos'] if p.get('tier') == 'preview' and p.get('message_id')]
+        messages = await client.get_messages(chat_id, ids=[p['message_id'] for p in previews])
+        upgraded = {}
+        for entry, message in zip(previews, messages):
+            if message is None or message.media is None:
+                # Исходное сообщение удалено: остается превью
+                logging.warning(f"⚠️ Сообщение {entry['message_id']} удалено, в посте {post_id} остается превью")
+                continue
+            dest = os.path.join(post_dir, entry['file'])
+            tmp_dest = os.path.join(post_dir, f".{entry['file']}.tmp")
+            try:
+                photo = await self.normalizer.ingest(client, message.media, tmp_dest)
+                os.replace(tmp_dest, dest)
+            except BaseException:
+                if os.path.exists(tmp_dest):
+                    os.remove(tmp_dest)
+                raise
+            upgraded[entry['file']] = photo
+
+        # Манифест перечитываем: продюсер мог изменить статус, пока шла загрузка
+        manifest = read_manifest(post_dir)
+        for entry in manifest['photos']:
+            photo = upgraded.get(entry['file'])
+            if photo:
+                entry.update(size=photo['size'], sha256=photo['sha256'], tier='original')
+                # file_id продюсера относится к превью
+                entry.pop('file_id', None)
+        manifest['photo_tier'] = 'original'
+        write_manifest(post_dir, manifest)
+        logging.info(f"🖼️ Пост {post_id}: получено оригиналов фото: {len(upgraded)}")
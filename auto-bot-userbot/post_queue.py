@@ -0,0 +1,120 @@
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+# Схема совпадает со схемой в auto-bot-producer/src/bot/post_queue.py
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    topic TEXT NOT NULL,
+    key TEXT NOT NULL,
+    payload TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'ready',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    visible_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    UNIQUE (topic, key)
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (topic, status, visible_at, id);
+"""
+
+TOPIC_POSTS = 'posts'
+# Запросы продюсера на загрузку оригиналов фото перед публикацией
+TOPIC_ORIGINALS = 'originals'
+
+STATUS_READY = 'ready'
+STATUS_CLAIMED = 'claimed'
+STATUS_DONE = 'done'
+# Попытки исчерпаны: задание не выдается, пока продюсер не поставит его заново
+STATUS_FAILED = 'failed'
+
+
+class PostQueue:
+    """
+    Очередь заданий между юзерботом и продюсером на SQLite.
+    Юзербот ставит задания темы posts и забирает задания темы originals.
+    """
+    def __init__(self, db_path, visibility_timeout=300):
+        self.db_path = db_path
+        self.visibility_timeout = visibility_timeout
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+    def enqueue(self, topic, key, payload=None):
+        """
+        Ставит задание в очередь.
+        Args:
+            topic (str): Тема очереди
+            key (str): Уникальный в пределах темы ключ задания
+            payload (dict): Данные задания
+        Returns:
+            bool: True если задание добавлено, False если оно уже было в очереди
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT OR IGNORE INTO jobs (topic, key, payload, status, visible_at, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (topic, key, json.dumps(payload or {}, ensure_ascii=False), STATUS_READY, now, now)
+            )
+        if cursor.rowcount == 1:
+            logging.info(f"📬 Задание {topic}/{key} поставлено в очередь")
+        return cursor.rowcount == 1
+
+    def claim(self, topic, limit=10):
+        """
+        Забирает доступные задания темы. Задание становится невидимым
+        для других потребителей на visibility_timeout секунд.
+        Returns:
+            list: Задания в виде словарей (id, key, payload, attempts)
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = self._conn.execute(
+                    'SELECT id, key, payload, attempts FROM jobs '
+                    'WHERE topic = ? AND status IN (?, ?) AND visible_at <= ? '
+                    'ORDER BY id LIMIT ?',
+                    (topic, STATUS_READY, STATUS_CLAIMED, now, limit)
+                ).fetchall()
+                self._conn.executemany(
+                    'UPDATE jobs SET status = ?, attempts = attempts + 1, visible_at = ? WHERE id = ?',
+                    [(STATUS_CLAIMED, now + self.visibility_timeout, row[0]) for row in rows]
+                )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return [
+            {'id': row[0], 'key': row[1], 'payload': json.loads(row[2]), 'attempts': row[3] + 1}
+            for row in rows
+        ]
+
+    def ack(self, job):
+        """Подтверждает выполнение задания"""
+        with self._lock:
+            self._conn.execute('UPDATE jobs SET status = ? WHERE id = ?', (STATUS_DONE, job['id']))
+
+    def nack(self, job, delay=0):
+        """Возвращает задание в очередь с задержкой"""
+        with self._lock:
+            self._conn.execute(
+                'UPDATE jobs SET status = ?, visible_at = ? WHERE id = ?',
+                (STATUS_READY, time.time() + delay, job['id'])
+            )
+
+    def fail(self, job):
+        """Снимает задание с исчерпанными попытками, оставляя его для разбора"""
+        with self._lock:
+            self._conn.execute('UPDATE jobs SET status = ? WHERE id = ?', (STATUS_FAILED, job['id']))
+
+    def close(self):
+        """Закрывает соединение с базой"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import shutil
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import date, timedelta
+
+from layout import post_date
+from manifest import MANIFEST_FILE
+
+
+def dir_size(path):
+    """Суммарный размер файлов в папке поста (без вложенных папок)"""
+    total = 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False):
+                total += entry.stat(follow_symlinks=False).st_size
+    return total
+
+
+def format_bytes(size):
+    """Размер в читаемом виде"""
+    for unit in ('Б', 'КБ', 'МБ'):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} ГБ"
+
+
+class RetentionService:
+    """
+    Удаляет старые посты, чтобы папка с постами не превышала бюджеты по возрасту и размеру.
+
+    Полный обход дерева выполняется один раз при запуске и затем раз в reindex_interval
+    секунд; между ними индекс пополняется через add_post() при сохранении новых постов.
+    Посты на модерации (статус sent), заблокированные модератором и редактируемые
+    (есть temp.txt) не удаляются. Удаление идет небольшими пачками в пуле потоков.
+    После удаления постов из хранилища медиа убираются файлы без ссылок.
+    """
+    def __init__(
+        self,
+        saved_dir,
+        max_age_days=30,
+        max_bytes=5 * 1024 ** 3,
+        interval=600,
+        batch_size=20,
+        reindex_interval=24 * 3600,
+        moderation_block_file=None,
+        media_store=None
+    ):
+        self.saved_dir = saved_dir
+        self.max_age_days = max_age_days
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.batch_size = batch_size
+        self.reindex_interval = reindex_interval
+        self.moderation_block_file = moderation_block_file
+        self.media_store = media_store
+        # Путь к папке поста -> размер в байтах, от старых к новым
+        self._index = OrderedDict()
+        self._total_bytes = 0
+        self._indexed_at = None
+        self._task = None
+
+    def start(self, loop=None):
+        """Запускает фоновую задачу, если она еще не запущена"""
+        if self._task and not self._task.done():
+            return
+        loop = loop or asyncio.get_event_loop()
+        self._task = loop.create_task(self.run())
+
+    async def stop(self):
+        """Останавливает фоновую задачу"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def add_post(self, post_dir):
+        """Добавляет в индекс только что сохраненный пост"""
+        if self._indexed_at is None or post_dir in self._index:
+            return
+        try:
+            size = dir_size(post_dir)
+        except OSError:
+            return
+        self._index[post_dir] = size
+        self._total_bytes += size
+
+    def _build_index(self):
+        """Полный обход шардов и старой плоской структуры"""
+        posts = []
+        for root, dirs, _ in os.walk(self.saved_dir):
+            # Служебные папки (.staging, .media) не обходим
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for name in [d for d in dirs if d.startswith('post_')]:
+                path = os.path.join(root, name)
+                try:
+                    posts.append((name, path, dir_size(path)))
+                except OSError:
+                    continue
+            dirs[:] = [d for d in dirs if not d.startswith('post_')]
+        posts.sort()
+        index = OrderedDict((path, size) for _, path, size in posts)
+        return index, sum(index.values())
+
+    def _load_moderation_blocks(self):
+        """ID постов, заблокированных модераторами в продюсере"""
+        if not self.moderation_block_file or not os.path.exists(self.moderation_block_file):
+            return set()
+        try:
+            with open(self.moderation_block_file, 'r', encoding='utf-8') as f:
+                return set(json.load(f))
+        except Exception as e:
+            logging.error(f"Ошибка при чтении {self.moderation_block_file}: {e}")
+            return set()
+
+    def _is_protected(self, post_dir, blocked):
+        """Проверяет, что пост сейчас нельзя удалять"""
+        if os.path.basename(post_dir) in blocked:
+            return True
+        if os.path.exists(os.path.join(post_dir, 'temp.txt')):
+            return True
+        try:
+            with open(os.path.join(post_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f).get('status') == 'sent'
+        except FileNotFoundError:
+            return False
+        except Exception:
+            # Поврежденный манифест: оставляем пост на ручной разбор
+            return True
+
+    def _select_victims(self, posts, total_bytes):
+        """
+        Выбирает посты для удаления, начиная с самых старых.
+        Args:
+            posts (list): Снимок индекса [(путь, размер)] от старых к новым
+            total_bytes (int): Суммарный размер постов в индексе
+        Returns:
+            tuple: (посты для удаления, посты, которых уже нет на диске)
+        """
+        oldest_allowed = date.today() - timedelta(days=self.max_age_days)
+        blocked = self._load_moderation_blocks()
+        victims = []
+        missing = []
+        remaining_bytes = total_bytes
+        for post_dir, size in posts:
+            if not os.path.isdir(post_dir):
+                # Пост уже удален продюсером после публикации
+                missing.append(post_dir)
+                remaining_bytes -= size
+                continue
+            day = post_date(os.path.basename(post_dir))
+            too_old = day is not None and day < oldest_allowed
+            over_budget = remaining_bytes > self.max_bytes
+            if not too_old and not over_budget:
+                break
+            if self._is_protected(post_dir, blocked):
+                continue
+            victims.append(post_dir)
+            remaining_bytes -= size
+        return victims, missing
+
+    def _forget(self, post_dir):
+        """Убирает пост из индекса"""
+        size = self._index.pop(post_dir, 0)
+        self._total_bytes -= size
+        return size
+
+    def _remove_batch(self, batch):
+        """
+        Удаляет пачку папок постов и опустевшие папки шардов прошлых дней.
+        Returns:
+            list: Успешно удаленные папки
+        """
+        removed = []
+        today = date.today()
+        for post_dir in batch:
+            try:
+                shutil.rmtree(post_dir)
+            except Exception as e:
+                logging.error(f"❌ Ошибка при удалении поста {post_dir}: {e}")
+                continue
+            removed.append(post_dir)
+            # Папку текущего дня не трогаем: в нее сейчас переносятся новые посты
+            day = post_date(os.path.basename(post_dir))
+            if day is None or day >= today:
+                continue
+            parent = os.path.dirname(post_dir)
+            while os.path.abspath(parent) != os.path.abspath(self.saved_dir):
+                try:
+                    os.rmdir(parent)
+                except OSError:
+                    break
+                parent = os.path.dirname(parent)
+        return removed
+
+    async def collect(self):
+        """
+        Один проход сборки мусора.
+        Returns:
+            tuple: (удалено постов, освобождено байт)
+        """
+        reindex = self._indexed_at is None or time.monotonic() - self._indexed_at >= self.reindex_interval
+        if reindex:
+            self._index, self._total_bytes = await asyncio.to_thread(self._build_index)
+            self._indexed_at = time.monotonic()
+            logging.info(f"🗂️ Индекс постов: {len(self._index)} постов, {format_bytes(self._total_bytes)}")
+
+        victims, missing = await asyncio.to_thread(
+            self._select_victims, list(self._index.items()), self._total_bytes
+        )
+        for post_dir in missing:
+            self._forget(post_dir)
+        removed = 0
+        reclaimed = 0
+        for i in range(0, len(victims), self.batch_size):
+            batch = victims[i:i + self.batch_size]
+            for post_dir in await asyncio.to_thread(self._remove_batch, batch):
+                reclaimed += self._forget(post_dir)
+                removed += 1
+
+        if removed:
+            logging.info(
+                f"🧹 Удалено старых постов: {removed}, освобождено {format_bytes(reclaimed)}, "
+                f"занято {format_bytes(self._total_bytes)}"
+            )
+
+        # Файлы хранилища освобождаются, когда на них не остается ссылок из постов
+        if self.media_store and (removed or missing or reindex):
+            orphans, orphan_bytes = await asyncio.to_thread(self.media_store.collect_orphans)
+            if orphans:
+                logging.info(f"🧹 Удалено файлов из хранилища медиа: {orphans}, освобождено {format_bytes(orphan_bytes)}")
+        return removed, reclaimed
+
+    async def run(self):
+        """Периодическая сборка мусора"""
+        while True:
+            try:
+                await self.collect()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"❌ Ошибка при очистке старых постов: {e}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,197 @@
+import os
+import json
+import asyncio
+import logging
+
+# Типы постов, которые юзербот умеет сохранять (см. classify_message в bot.py)
+POST_KINDS = ('album', 'photo', 'photo_document')
+
+# Настройки канала по умолчанию
+DEFAULT_OPTIONS = {
+    # Какие типы постов сохранять
+    'kinds': POST_KINDS,
+    # Минимальная длина текста поста
+    'min_text_length': 0,
+}
+
+
+class RoutingTable:
+    """
+    Таблица маршрутизации каналов из channels.json:
+
+        {
+            "allow": [-1001234567890],
+            "deny": [-1009876543210],
+            "channels": {
+                "-1001234567890": {"kinds": ["album", "photo"], "min_text_length": 50}
+            }
+        }
+
+    Пустой allow означает «все каналы, кроме deny». Таблица компилируется в
+    множества и словарь, поэтому проверка канала — O(1) без запросов к API.
+    Без файла принимаются все каналы.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._mtime = None
+        self._allow = frozenset()
+        self._deny = frozenset()
+        self._options = {}
+        self._default_options = self._compile_options(None)
+        self.reload()
+
+    @staticmethod
+    def _compile_options(options):
+        compiled = dict(DEFAULT_OPTIONS)
+        compiled.update(options or {})
+        compiled['kinds'] = frozenset(compiled['kinds'])
+        return compiled
+
+    def reload(self):
+        """
+        Перечитывает конфиг, если файл изменился.
+        Returns:
+            bool: True, если таблица обновлена
+        """
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+
+        config = {}
+        if mtime is not None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+            except Exception as e:
+                # Оставляем предыдущую таблицу, чтобы опечатка в конфиге не открыла все каналы
+                logging.error(f"❌ Ошибка при чтении {self.path}: {e}")
+                return False
+
+        self._allow = frozenset(int(chat_id) for chat_id in config.get('allow', []))
+        self._deny = frozenset(int(chat_id) for chat_id in config.get('deny', []))
+        self._options = {
+            int(chat_id): self._compile_options(options)
+            for chat_id, options in config.get('channels', {}).items()
+        }
+        logging.info(
+            f"🧭 Таблица каналов загружена: разрешено {len(self._allow) or 'все'}, "
+            f"запрещено {len(self._deny)}, с настройками {len(self._options)}"
+        )
+        return True
+
+    def accepts(self, chat_id):
+        """Проверяет, нужно ли обрабатывать сообщения канала"""
+        if chat_id in self._deny:
+            return False
+        return not self._allow or chat_id in self._allow
+
+    def options(self, chat_id):
+        """Настройки канала"""
+        return self._options.get(chat_id, self._default_options)
+
+
+class ChannelDirectory:
+    """
+    Кэш названий и username каналов, заполняемый из списков диалогов всех сессий.
+    Обработчики сообщений берут данные о канале отсюда, а не из event.chat.
+    Для каждой сессии хранится множество каналов, на которые она подписана.
+    Кэш и таблица маршрутизации обновляются в фоне.
+    """
+    def __init__(self, clients, routing=None, refresh_interval=1800):
+        """
+        Args:
+            clients (dict): Имя сессии -> клиент Telethon
+            routing (RoutingTable): Таблица, которую нужно перечитывать вместе с кэшем
+            refresh_interval (int): Период обновления в секундах
+        """
+        self.clients = clients
+        self.routing = routing
+        self.refresh_interval = refresh_interval
+        self._channels = {}
+        self._members = {}
+        self._task = None
+
+    async def refresh(self, names=None):
+        """
+        Перечитывает списки каналов подключенных сессий.
+        Args:
+            names (list): Только эти сессии (None — все)
+        """
+        for name, client in self.clients.items():
+            if names is not None and name not in names:
+                continue
+            if not client.is_connected():
+                continue
+            members = set()
+            try:
+                async for dialog in client.iter_dialogs():
+                    if not dialog.is_channel:
+                        continue
+                    entity = dialog.entity
+                    members.add(dialog.id)
+                    self._channels[dialog.id] = {
+                        'id': dialog.id,
+                        'title': dialog.title,
+                        'username': getattr(entity, 'username', None),
+                        'participants_count': getattr(entity, 'participants_count', None),
+                    }
+            except Exception as e:
+                # Оставляем прежний список каналов сессии
+                logging.error(f"❌ Ошибка при получении каналов сессии {name}: {e}")
+                continue
+            self._members[name] = members
+        logging.info(f"📇 Кэш каналов обновлен: {len(self._channels)} каналов")
+
+    def get(self, chat_id):
+        """Данные о канале или None, если канала нет в кэше"""
+        return self._channels.get(chat_id)
+
+    def members(self, name):
+        """Каналы, на которые подписана сессия, или None, если список еще не загружен"""
+        return self._members.get(name)
+
+    def remember(self, chat_id, chat):
+        """Добавляет в кэш канал, полученный из события"""
+        info = {
+            'id': chat_id,
+            'title': getattr(chat, 'title', None),
+            'username': getattr(chat, 'username', None),
+            'participants_count': getattr(chat, 'participants_count', None),
+        }
+        self._channels[chat_id] = info
+        return info
+
+    def all(self):
+        """Все каналы из кэша"""
+        return list(self._channels.values())
+
+    def start(self, loop=None):
+        """Запускает фоновое обновление, если оно еще не запущено"""
+        if self._task and not self._task.done():
+            return
+        loop = loop or asyncio.get_event_loop()
+        self._task = loop.create_task(self.run())
+
+    async def stop(self):
+        """Останавливает фоновое обновление"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run(self):
+        """Периодическое обновление кэша каналов и таблицы маршрутизации (первое — через refresh())"""
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                if self.routing:
+                    self.routing.reload()
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"❌ Ошибка при обновлении кэша каналов: {e}")
@@ -0,0 +1,106 @@
+import time
+import bisect
+import hashlib
+import logging
+
+
+def _hash(value):
+    """Стабильный между запусками хэш строки"""
+    return int.from_bytes(hashlib.md5(str(value).encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """
+    Кольцо консистентного хэширования: каждая сессия занимает replicas точек,
+    канал принадлежит первой подходящей сессии по часовой стрелке от своего хэша.
+    При выпадении сессии переезжают только ее каналы.
+    """
+    def __init__(self, nodes, replicas=100):
+        self.nodes = list(nodes)
+        points = sorted(
+            (_hash(f"{node}#{i}"), node)
+            for node in self.nodes
+            for i in range(replicas)
+        )
+        self._keys = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def walk(self, key):
+        """Сессии в порядке предпочтения для ключа (каждая по одному разу)"""
+        if not self._keys:
+            return
+        start = bisect.bisect(self._keys, _hash(key))
+        seen = set()
+        for i in range(len(self._keys)):
+            node = self._nodes[(start + i) % len(self._keys)]
+            if node in seen:
+                continue
+            seen.add(node)
+            yield node
+            if len(seen) == len(self.nodes):
+                return
+
+
+class ShardManager:
+    """
+    Распределяет каналы между сессиями юзербота.
+    Канал обрабатывает первая по кольцу сессия, которая подключена, не ждет FloodWait
+    и подписана на канал. Когда сессия отключается или получает FloodWait,
+    ее каналы переходят к следующим по кольцу сессиям.
+    """
+    def __init__(self, names, membership=None, replicas=100):
+        """
+        Args:
+            names (list): Имена сессий
+            membership: Функция name -> множество chat_id, на которые подписана сессия
+                (или None, пока список неизвестен)
+            replicas (int): Точек на кольце на одну сессию
+        """
+        self.names = list(names)
+        self.ring = HashRing(self.names, replicas)
+        self.membership = membership
+        self._connected = set()
+        self._flood_until = {}
+
+    def mark_connected(self, name):
+        if name not in self._connected:
+            self._connected.add(name)
+            logging.info(f"🔀 Сессия {name} подключена, каналы перераспределены")
+
+    def mark_disconnected(self, name):
+        if name in self._connected:
+            self._connected.discard(name)
+            logging.warning(f"🔀 Сессия {name} отключена, ее каналы переходят к другим сессиям")
+
+    def mark_flood(self, name, seconds):
+        """Исключает сессию из распределения на время FloodWait"""
+        self._flood_until[name] = time.monotonic() + seconds
+        logging.warning(f"🔀 Сессия {name}: FloodWait {seconds} с, ее каналы переходят к другим сессиям")
+
+    def available(self, name):
+        """Сессия подключена и не ждет FloodWait"""
+        if name not in self._connected:
+            return False
+        return self._flood_until.get(name, 0) <= time.monotonic()
+
+    def owner(self, chat_id):
+        """
+        Сессия, которая сейчас обрабатывает канал.
+        Returns:
+            str | None: Имя сессии или None, если подходящих сессий нет
+        """
+        for name in self.ring.walk(chat_id):
+            if not self.available(name):
+                continue
+            members = self.membership(name) if self.membership else None
+            if members is None or chat_id in members:
+                return name
+        return None
+
+    def is_owner(self, name, chat_id):
+        """
+        Проверяет, должна ли сессия обрабатывать канал.
+        Если подходящих сессий нет, сообщение обрабатывает та сессия, что его получила.
+        """
+        owner = self.owner(chat_id)
+        return owner is None or owner == name
@@ -1,3 +1,6 @@
+import random
+
+
 class BotState:
     """
     Класс для управления состоянием бота.
@@ -5,6 +8,25 @@ class BotState:
     """
     def __init__(self):
         self.is_shutting_down = False
-        self.reconnect_attempts = 0
-        self.max_reconnect_attempts = 5
-        self.reconnect_delay = 10  # Начальная задержка в секундах 
\ No newline at end of file
+        # Неудачных попыток подключения подряд по сессиям
+        self.reconnect_attempts = {}
+        self.reconnect_delay = 10  # Начальная задержка в секундах
+        self.max_reconnect_delay = 300  # Максимальная задержка в секундах
+
+    def next_reconnect_delay(self, session):
+        """
+        Задержка перед следующей попыткой подключения сессии: экспоненциальная
+        с разбросом, чтобы сессии не переподключались одновременно.
+        Args:
+            session (str): Имя сессии
+        Returns:
+            float: Задержка в секундах
+        """
+        attempt = self.reconnect_attempts.get(session, 0) + 1
+        self.reconnect_attempts[session] = attempt
+        delay = min(self.reconnect_delay * (2 ** (attempt - 1)), self.max_reconnect_delay)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def reset_reconnect(self, session):
+        """Сбрасывает счетчик попыток после успешного подключения"""
+        self.reconnect_attempts.pop(session, None)
@@ -0,0 +1,63 @@
+import os
+import json
+import logging
+
+
+class HighWaterMarks:
+    """
+    Последний обработанный ID сообщения по каждому каналу.
+    По этим отметкам после переподключения догружаются сообщения, пропущенные офлайн.
+    Хранится в JSON-файле: {"<chat_id>": <message_id>}.
+    """
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self._marks = {}
+        self._dirty = False
+        self._load_from_file()
+
+    def get(self, chat_id):
+        """Последний обработанный ID сообщения канала или None"""
+        return self._marks.get(chat_id)
+
+    def items(self):
+        """Пары (chat_id, message_id)"""
+        return list(self._marks.items())
+
+    def update(self, chat_id, message_id, save=True):
+        """
+        Сдвигает отметку канала вперед (назад не сдвигается).
+        Args:
+            chat_id (int): ID канала
+            message_id (int): ID обработанного сообщения
+            save (bool): Сразу записать файл
+        """
+        if message_id <= self._marks.get(chat_id, 0):
+            return
+        self._marks[chat_id] = message_id
+        self._dirty = True
+        if save:
+            self.save()
+
+    def save(self):
+        """Атомарно записывает отметки в файл, если они изменились"""
+        if not self._dirty:
+            return
+        temp_path = f"{self.cache_file}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({str(k): v for k, v in self._marks.items()}, f)
+            os.replace(temp_path, self.cache_file)
+            self._dirty = False
+        except Exception as e:
+            logging.error(f"Ошибка при сохранении отметок в файл {self.cache_file}: {e}")
+
+    def _load_from_file(self):
+        """Загружает отметки из файла"""
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                self._marks = {int(k): int(v) for k, v in json.load(f).items()}
+            logging.info(f"Загружено {len(self._marks)} отметок из {self.cache_file}")
+        except Exception as e:
+            logging.error(f"Ошибка при загрузке отметок из файла {self.cache_file}: {e}")